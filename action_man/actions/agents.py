@@ -1,57 +1,205 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime
 import logging
 import json
+from os import environ
+from time import time
+from typing import Any, AsyncIterator, DefaultDict, Dict, List, Tuple, cast
 
-from faust.agents import current_agent
 from faust.types import StreamT
 
 from action_man.algorithm import ab
+from action_man.counters.agents import COUNTERS_BACKEND
 from action_man.entrypoint import kafka
-from action_man.stores.actions import save_action
-from action_man.stores.exceptions import StoreException
+from action_man.kafka import current_app
+from action_man.stores.actions import save_action, save_actions_bulk
+from action_man.stores.exceptions import StoreException, TRANSIENT_ERRORS, is_transient
+from action_man.stores.stats import lock_stats_offsets, save_stats
 from action_man import cache
-from action_man import models
-from action_man.topics import actions_topic
+from action_man import metrics
+from action_man import records
+from action_man.topics import actions_topic, keyed_actions_topic, owned_actions
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+STORE_BATCH_SIZE = int(environ.get('STORE_ACTIONS_BATCH_SIZE', 500))
+STORE_BATCH_LINGER = float(environ.get('STORE_ACTIONS_BATCH_LINGER', 0.5))
+CACHE_FLUSH_INTERVAL = float(environ.get('CACHE_ACTIONS_FLUSH_INTERVAL', 0.1))
+CACHE_FLUSH_SIZE = int(environ.get('CACHE_ACTIONS_FLUSH_SIZE', 10000))
+ROLLUP_BATCH_SIZE = int(environ.get('STATS_ROLLUP_BATCH_SIZE', 5000))
+ROLLUP_WINDOW = float(environ.get('STATS_ROLLUP_WINDOW', 5.0))
+ROLLUP_BUCKET = int(environ.get('STATS_ROLLUP_BUCKET', 3600))
+ROLLUP_RETRY_INTERVAL = float(environ.get('STATS_ROLLUP_RETRY_INTERVAL', 5.0))
+ROLLUP_RETRY_ATTEMPTS = int(environ.get('STATS_ROLLUP_RETRY_ATTEMPTS', 5))
+
 
 @kafka.agent(actions_topic)
-async def store_actions(actions: StreamT):
+async def store_actions(actions: StreamT) -> AsyncIterator[Any]:
     '''
     Stores actions on DB for posterous analysis.
 
+    Actions are buffered up to STORE_ACTIONS_BATCH_SIZE messages or
+    STORE_ACTIONS_BATCH_LINGER seconds and written in one round trip,
+    offsets are acked only once the batch has been handled.
+    If the batch is rejected it is retried row by row so a single bad
+    action doesn't take the rest down with it.
+
     :param actions: StreamT:
 
     '''
-    async for action in actions:
-        logger.info(f'Storing action on db')
-        db_pool = await current_agent().app.db_pool()
+    async for batch in actions.take(STORE_BATCH_SIZE, within=STORE_BATCH_LINGER):
+        logger.info(f'Storing {len(batch)} actions on db')
+        db_pool = await current_app().db_pool()
         async with db_pool.acquire() as conn:
             try:
-                yield await save_action(conn, action.to_representation())
+                with metrics.timer('db.save_actions_bulk'):
+                    await save_actions_bulk(conn, [action.to_representation() for action in batch])
             except StoreException:
-                logger.exception(f'Error while inserting action in DB, continuing....')
-            finally:
-                yield action.id
+                logger.exception(f'Error while bulk inserting actions in DB, falling back to single inserts....')
+                for action in batch:
+                    try:
+                        with metrics.timer('db.save_action'):
+                            await save_action(conn, action.to_representation())
+                    except StoreException:
+                        logger.exception(f'Error while inserting action in DB, continuing....')
 
+        for action in batch:
+            yield action.id
 
-@kafka.agent(actions_topic)
-async def cache_actions(actions: StreamT):
+
+@kafka.agent(keyed_actions_topic)
+async def cache_actions(actions: StreamT) -> AsyncIterator[Any]:
     '''
     Stores action counts on DB for posterous analysis.
 
+    Increments are merged in the app counter buffer and flushed every
+    CACHE_ACTIONS_FLUSH_INTERVAL seconds (or once CACHE_ACTIONS_FLUSH_SIZE
+    increments pile up), with the interval set to 0 after every action.
+    Actions go through topics.owned_actions, so every experiment is counted
+    and marked dirty by the worker owning its partition.
+    With the table backend counters are kept by counters.agents.count_actions
+    and actions are just acked here.
+
     :param actions: StreamT:
 
     '''
-    async for action in actions:
+    if COUNTERS_BACKEND == 'table':
+        # count_actions repartitions, acking here avoids forwarding twice
+        async for action in actions:
+            yield action.id
+        return
+
+    async for action in owned_actions(actions):
         logger.info(f'Increasing action count on cache')
-        cache_pool = await current_agent().app.cache_pool()
-        with await cache_pool as conn:
-            await conn.incr('action_count')
-            if action.reward == 1:
-                await conn.incr(f'{action.experiment_id}_{action.variant_id}_successes')
-            await conn.incr(f'{action.experiment_id}_{action.variant_id}_total')
+        app = current_app()
+        counters = app.counter_buffer()
+
+        counters.incr('action_count')
+        cache.incr_counters(counters, action.experiment_id, action.variant_id, action.reward)
+
+        if not CACHE_FLUSH_INTERVAL or counters.increments >= CACHE_FLUSH_SIZE:
+            await app.flush_counters()
+
+        app.debouncer().mark(str(action.experiment_id))
 
         yield action.id
+
+
+def _offset_ranges(batch: List[Tuple[Any, Tuple[str, int], int]]) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    # first and last offset per (topic, partition), enough to replay a skipped batch
+    ranges: Dict[Tuple[str, int], Tuple[int, int]] = {}
+    for _, tp, offset in batch:
+        first, last = ranges.get(tp, (offset, offset))
+        ranges[tp] = (min(first, offset), max(last, offset))
+    return ranges
+
+
+@kafka.agent(actions_topic)
+async def rollup_actions(actions: StreamT) -> AsyncIterator[Any]:
+    '''
+    Roll actions up into per experiment, variant and time bucket counts.
+
+    Actions are aggregated in memory for up to STATS_ROLLUP_BATCH_SIZE
+    messages or STATS_ROLLUP_WINDOW seconds and upserted in one statement,
+    buckets are STATS_ROLLUP_BUCKET seconds long and assigned on processing
+    time, like action.last_modified.
+
+    The last offset rolled up per partition is stored in the same transaction
+    and redelivered actions are skipped. A batch failing on a transient error
+    (connection, serialization, deadlock) is retried every
+    STATS_ROLLUP_RETRY_INTERVAL seconds up to STATS_ROLLUP_RETRY_ATTEMPTS
+    times; past that, or on any other error, it is logged with its offsets
+    and skipped, so one bad batch can't stall the stream.
+
+    :param actions: StreamT:
+
+    '''
+    def with_offset(action: records.Action) -> Tuple[records.Action, Tuple[str, int], int]:
+        event = actions.current_event
+        if event is None:
+            raise RuntimeError('rollup_actions needs the event of every action to track offsets')
+        message = event.message
+        return action, (message.topic, message.partition), message.offset
+
+    # faust types processors as returning their input, this one wraps it
+    actions.add_processor(cast(Any, with_offset))
+
+    async for batch in actions.take(ROLLUP_BATCH_SIZE, within=ROLLUP_WINDOW):
+        now = int(time())
+        bucket = datetime.utcfromtimestamp(now - now % ROLLUP_BUCKET)
+
+        db_pool = await current_app().db_pool()
+        for attempt in range(1, ROLLUP_RETRY_ATTEMPTS + 1):
+            try:
+                async with db_pool.acquire() as conn, conn.transaction():
+                    applied = await lock_stats_offsets(conn, {tp for _, tp, _ in batch})
+
+                    stats: DefaultDict[Tuple[str, str, datetime], List[int]] = defaultdict(lambda: [0, 0])
+                    offsets: Dict[Tuple[str, int], int] = {}
+                    for action, tp, offset in batch:
+                        if offset <= applied[tp]:
+                            continue
+                        counts = stats[(action.experiment_id, action.variant_id, bucket)]
+                        counts[0] += int(action.reward)
+                        counts[1] += 1
+                        offsets[tp] = max(offset, offsets.get(tp, -1))
+
+                    with metrics.timer('db.save_stats'):
+                        rows = await save_stats(conn, {key: (counts[0], counts[1]) for key, counts in stats.items()}, offsets)
+                logger.info(f'Rolled {len(batch)} actions up into {rows} stats rows')
+                break
+            except (StoreException, *TRANSIENT_ERRORS) as exc:
+                if attempt < ROLLUP_RETRY_ATTEMPTS and is_transient(exc):
+                    logger.exception(
+                        f'Error while rolling up {len(batch)} actions, retrying in {ROLLUP_RETRY_INTERVAL}s'
+                    )
+                    await asyncio.sleep(ROLLUP_RETRY_INTERVAL)
+                    continue
+
+                logger.exception(
+                    f'Skipping {len(batch)} actions that could not be rolled up, offsets {_offset_ranges(batch)}'
+                )
+                metrics.incr('stats.rollup_skipped', len(batch))
+                break
+
+        for action, _, _ in batch:
+            yield action.id
+
+
+@kafka.timer(interval=CACHE_FLUSH_INTERVAL or 1.0)
+async def flush_cached_actions() -> None:
+    '''
+    Flush action counts buffered by cache_actions
+    '''
+    await kafka.flush_counters()
+
+
+@kafka.on_partitions_revoked.connect
+async def flush_cached_actions_on_revoke(app: Any, /, *args: Any, **kwargs: Any) -> None:
+    '''
+    Flush action counts before partitions move to another worker
+    '''
+    await app.flush_counters()
@@ -1,8 +1,16 @@
-from typing import Any
+from os import environ
+from typing import Any, Optional
 
 import numpy
 
 
+DRAWS = int(environ.get('AB_DRAWS', 1000))
+# upper bound on the number of beta samples held in memory at once
+MAX_SAMPLES = int(environ.get('AB_MAX_SAMPLES', 4000000))
+
+_rng = numpy.random.default_rng(int(environ['AB_SEED']) if environ.get('AB_SEED') else None)
+
+
 def calculate(successes: int = 0, total: int = 0) -> Any:
     '''
     Calculate current probability based on beta distribution
@@ -11,4 +19,52 @@ def calculate(successes: int = 0, total: int = 0) -> Any:
     :param total: int:  (Default value = 0)
 
     '''
-    return numpy.random.beta(successes + 1, total - successes + 1)
+    return _rng.beta(successes + 1, total - successes + 1)
+
+
+def probability_of_best(
+    successes: numpy.ndarray,
+    totals: numpy.ndarray,
+    mask: Optional[numpy.ndarray] = None,
+    draws: int = DRAWS,
+    rng: Optional[numpy.random.Generator] = None
+) -> numpy.ndarray:
+    '''
+    Thompson sampling estimate of the probability each variant is the best one,
+    drawing `draws` samples from every Beta(successes + 1, failures + 1) posterior.
+
+    Arrays are shaped (variants,) for a single experiment or (experiments, variants)
+    for a batch of them, padding variants are excluded setting `mask` to False.
+
+    :param successes: numpy.ndarray:
+    :param totals: numpy.ndarray:
+    :param mask: Optional[numpy.ndarray]:  (Default value = None)
+    :param draws: int:  (Default value = DRAWS)
+    :param rng: Optional[numpy.random.Generator]:  (Default value = None)
+
+    '''
+    rng = rng or _rng
+    batched = numpy.ndim(successes) > 1
+    successes = numpy.atleast_2d(numpy.asarray(successes, dtype=numpy.float64))
+    totals = numpy.atleast_2d(numpy.asarray(totals, dtype=numpy.float64))
+    mask = numpy.ones(successes.shape, dtype=bool) if mask is None else numpy.atleast_2d(mask)
+
+    experiments, variants = successes.shape
+    alpha = (successes + 1)[:, None, :]
+    beta = (totals - successes + 1)[:, None, :]
+
+    result = numpy.zeros(successes.shape)
+    if not variants:
+        return result if batched else result[0]
+
+    chunk = max(1, MAX_SAMPLES // (draws * variants))
+    for start in range(0, experiments, chunk):
+        end = min(start + chunk, experiments)
+        samples = rng.beta(alpha[start:end], beta[start:end], size=(end - start, draws, variants))
+        samples[~numpy.broadcast_to(mask[start:end, None, :], samples.shape)] = -numpy.inf
+
+        best = samples.argmax(axis=-1) + numpy.arange(end - start)[:, None] * variants
+        counts = numpy.bincount(best.ravel(), minlength=(end - start) * variants)
+        result[start:end] = counts.reshape(end - start, variants) / draws
+
+    return result if batched else result[0]
@@ -0,0 +1,83 @@
+from array import array
+import json
+import random
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+import numpy
+
+
+# used by sample when no generator is passed
+_rng = random.Random()
+
+
+def build(weights: Sequence[float]) -> Tuple[List[float], List[int]]:
+    '''
+    Vose's alias method: split `weights` into n columns of equal height, each
+    holding at most two variants, the column's own one up to `prob[i]` and
+    `alias[i]` above it. Non positive weights are dropped, all of them being
+    non positive gives a uniform table.
+
+    :param weights: Sequence[float]:
+
+    '''
+    n = len(weights)
+    scaled = numpy.nan_to_num(numpy.maximum(numpy.asarray(weights, dtype=float), 0.0))
+    scaled = scaled * n / scaled.sum() if scaled.sum() > 0 else numpy.ones(n)
+
+    prob = [1.0] * n
+    alias = list(range(n))
+    heights = scaled.tolist()
+    small = [i for i, height in enumerate(heights) if height < 1.0]
+    large = [i for i, height in enumerate(heights) if height >= 1.0]
+
+    while small and large:
+        short, tall = small.pop(), large.pop()
+        prob[short], alias[short] = heights[short], tall
+        heights[tall] += heights[short] - 1.0
+        (small if heights[tall] < 1.0 else large).append(tall)
+
+    # leftovers are within rounding error of a full column
+    return prob, alias
+
+
+class AliasTable:
+    '''Precomputed weighted choice over the variants of an experiment.
+
+    Workers build it from the probabilities they calculate, the web app
+    samples it in O(1) whatever the number of variants: one random number
+    picks a column and the side of the column to return.
+    '''
+
+    __slots__ = ('variants', 'prob', 'alias')
+
+    def __init__(self, variants: Sequence[str], prob: Sequence[float], alias: Sequence[int]) -> None:
+        self.variants = tuple(variants)
+        self.prob = array('d', prob)
+        self.alias = array('I', alias)
+
+    def __len__(self) -> int:
+        return len(self.variants)
+
+    @classmethod
+    def from_weights(cls, weights: Mapping[str, float]) -> 'AliasTable':
+        return cls(list(weights), *build(list(weights.values())))
+
+    @classmethod
+    def loads(cls, s: Any) -> 'AliasTable':
+        table = json.loads(s)
+        return cls(table['variants'], table['prob'], table['alias'])
+
+    def dumps(self) -> bytes:
+        return json.dumps(
+            {'variants': list(self.variants), 'prob': self.prob.tolist(), 'alias': self.alias.tolist()}
+        ).encode('utf-8')
+
+    def sample(self, rng: Optional[random.Random] = None) -> str:
+        """
+        Draw a variant, the table must not be empty
+
+        :param rng: Optional[random.Random]:  (Default value = None)
+        """
+        column = (rng or _rng).random() * len(self.variants)
+        i = int(column)
+        return self.variants[i] if column - i < self.prob[i] else self.variants[self.alias[i]]
@@ -0,0 +1,76 @@
+from math import erf, lgamma, sqrt
+from os import environ
+
+import numpy
+
+from action_man.algorithm import ab
+
+
+# above this many terms the normal approximation is used, it is accurate
+# to a few decimals well before that
+EXACT_TERMS = int(environ.get('CLOSED_FORM_EXACT_TERMS', 10000))
+
+
+def _lbeta(a: float, b: float) -> float:
+    return lgamma(a) + lgamma(b) - lgamma(a + b)
+
+
+def probability_b_beats_a(successes_a: int, total_a: int, successes_b: int, total_b: int) -> float:
+    '''
+    Closed form P(pB > pA) for two Beta(successes + 1, failures + 1) posteriors
+
+    :param successes_a: int:
+    :param total_a: int:
+    :param successes_b: int:
+    :param total_b: int:
+
+    '''
+    alpha_a, beta_a = successes_a + 1, total_a - successes_a + 1
+    alpha_b, beta_b = successes_b + 1, total_b - successes_b + 1
+
+    # the sum runs over alpha_b terms, evaluate the cheaper side
+    if alpha_b > alpha_a:
+        return 1 - probability_b_beats_a(successes_b, total_b, successes_a, total_a)
+
+    if alpha_b > EXACT_TERMS:
+        mean_a, mean_b = alpha_a / (alpha_a + beta_a), alpha_b / (alpha_b + beta_b)
+        var_a = alpha_a * beta_a / ((alpha_a + beta_a) ** 2 * (alpha_a + beta_a + 1))
+        var_b = alpha_b * beta_b / ((alpha_b + beta_b) ** 2 * (alpha_b + beta_b + 1))
+        return 0.5 * (1 + erf((mean_b - mean_a) / sqrt(2 * (var_a + var_b))))
+
+    # sum_i B(alpha_a + i, beta_a + beta_b) / ((beta_b + i) B(1 + i, beta_b) B(alpha_a, beta_a)),
+    # consecutive terms only differ by a ratio so they are accumulated in log space
+    i = numpy.arange(alpha_b - 1)
+    ratios = numpy.log((alpha_a + i) / (alpha_a + i + beta_a + beta_b))
+    ratios += numpy.log((beta_b + i) / (beta_b + i + 1))
+    ratios += numpy.log((beta_b + i + 1) / (1 + i))
+    first = _lbeta(alpha_a, beta_a + beta_b) - _lbeta(alpha_a, beta_a)
+    terms = numpy.concatenate(([first], first + numpy.cumsum(ratios)))
+
+    return float(min(max(numpy.exp(terms).sum(), 0.0), 1.0))
+
+
+def probability_of_best(successes: numpy.ndarray, totals: numpy.ndarray, mask: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Exact probability of being the best variant for two variants experiments,
+    anything else falls back to Monte Carlo Thompson sampling.
+
+    :param successes: numpy.ndarray: (experiments, variants)
+    :param totals: numpy.ndarray: (experiments, variants)
+    :param mask: numpy.ndarray: (experiments, variants) False for padding variants
+
+    '''
+    result = numpy.zeros(successes.shape)
+    pairs = mask.sum(axis=-1) == 2
+
+    for row in numpy.flatnonzero(pairs):
+        a, b = numpy.flatnonzero(mask[row])
+        p_b = probability_b_beats_a(
+            int(successes[row, a]), int(totals[row, a]), int(successes[row, b]), int(totals[row, b])
+        )
+        result[row, a], result[row, b] = 1 - p_b, p_b
+
+    if (~pairs).any():
+        result[~pairs] = ab.probability_of_best(successes[~pairs], totals[~pairs], mask=mask[~pairs])
+
+    return result
@@ -0,0 +1,32 @@
+from os import environ
+
+import numpy
+
+
+EPSILON = float(environ.get('EPSILON_GREEDY_EPSILON', 0.1))
+
+
+def allocate(
+    successes: numpy.ndarray,
+    totals: numpy.ndarray,
+    mask: numpy.ndarray,
+    epsilon: float = EPSILON
+) -> numpy.ndarray:
+    '''
+    Epsilon-greedy allocation, `epsilon` of the traffic is spread evenly
+    across variants and the rest goes to the best observed conversion rate.
+
+    :param successes: numpy.ndarray: (experiments, variants)
+    :param totals: numpy.ndarray: (experiments, variants)
+    :param mask: numpy.ndarray: (experiments, variants) False for padding variants
+    :param epsilon: float:  (Default value = EPSILON)
+
+    '''
+    # smoothed rate, so that variants without actions yet are comparable
+    rates = numpy.where(mask, (successes + 1) / (totals + 2), -numpy.inf)
+    variants = numpy.maximum(mask.sum(axis=-1, keepdims=True), 1)
+
+    best = (rates == rates.max(axis=-1, keepdims=True)) & mask
+    greedy = best / numpy.maximum(best.sum(axis=-1, keepdims=True), 1)
+
+    return numpy.where(mask, (1 - epsilon) * greedy + epsilon / variants, 0)
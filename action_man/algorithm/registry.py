@@ -0,0 +1,79 @@
+from collections import defaultdict
+from os import environ
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy
+
+from action_man.algorithm import ab
+from action_man.algorithm import closed_form
+from action_man.algorithm import greedy
+from action_man.algorithm import ucb
+
+
+# every algorithm takes (experiments, variants) shaped successes, totals and
+# mask arrays and returns how traffic should be split across the variants
+Algorithm = Callable[[numpy.ndarray, numpy.ndarray, numpy.ndarray], numpy.ndarray]
+
+ALGORITHMS: Dict[str, Algorithm] = {
+    'thompson': ab.probability_of_best,
+    'ucb1': ucb.allocate,
+    'epsilon_greedy': greedy.allocate,
+    'closed_form': closed_form.probability_of_best,
+}
+
+DEFAULT_ALGORITHM = environ.get('DEFAULT_ALGORITHM', 'thompson')
+
+if DEFAULT_ALGORITHM not in ALGORITHMS:
+    raise ValueError(f'DEFAULT_ALGORITHM must be one of {", ".join(ALGORITHMS)}, not {DEFAULT_ALGORITHM}')
+
+
+def get_algorithm(name: Optional[str] = None) -> Algorithm:
+    '''
+    Look an algorithm up by name, unknown or missing names get the default one
+
+    :param name: Optional[str]:  (Default value = None)
+
+    '''
+    return ALGORITHMS.get(name or DEFAULT_ALGORITHM, ALGORITHMS[DEFAULT_ALGORITHM])
+
+
+def calculate_batch(
+    experiments: Sequence[Mapping[str, Tuple[int, int]]],
+    algorithms: Optional[Sequence[Optional[str]]] = None
+) -> List[Dict[str, float]]:
+    '''
+    Score a batch of experiments, grouping them by algorithm so that
+    each group is scored in a single vectorized call.
+
+    :param experiments: Sequence[Mapping[str, Tuple[int, int]]]: (successes, total) per variant id
+    :param algorithms: Optional[Sequence[Optional[str]]]: algorithm name per experiment  (Default value = None)
+
+    '''
+    algorithms = algorithms or [None] * len(experiments)
+
+    groups: Dict[Algorithm, List[int]] = defaultdict(list)
+    for i, name in enumerate(algorithms):
+        groups[get_algorithm(name)].append(i)
+
+    results: List[Dict[str, float]] = [{} for _ in experiments]
+
+    for algorithm, indexes in groups.items():
+        group = [experiments[i] for i in indexes]
+        width = max([len(counters) for counters in group], default=0)
+        if not width:
+            continue
+
+        successes = numpy.zeros((len(group), width))
+        totals = numpy.zeros((len(group), width))
+        mask = numpy.zeros((len(group), width), dtype=bool)
+
+        for row, counters in enumerate(group):
+            for column, (s, t) in enumerate(counters.values()):
+                successes[row, column], totals[row, column], mask[row, column] = s, t, True
+
+        allocation = algorithm(successes, totals, mask)
+
+        for row, (i, counters) in enumerate(zip(indexes, group)):
+            results[i] = dict(zip(counters.keys(), allocation[row, :len(counters)].tolist()))
+
+    return results
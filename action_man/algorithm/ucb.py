@@ -0,0 +1,24 @@
+import numpy
+
+
+def allocate(successes: numpy.ndarray, totals: numpy.ndarray, mask: numpy.ndarray) -> numpy.ndarray:
+    '''
+    UCB1 allocation, the variant with the highest upper confidence bound gets
+    all the traffic (split evenly on ties), untried variants come first.
+
+    :param successes: numpy.ndarray: (experiments, variants)
+    :param totals: numpy.ndarray: (experiments, variants)
+    :param mask: numpy.ndarray: (experiments, variants) False for padding variants
+
+    '''
+    plays = numpy.where(mask, totals, 0).sum(axis=-1, keepdims=True)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scores = successes / totals + numpy.sqrt(2 * numpy.log(numpy.maximum(plays, 1)) / totals)
+
+    scores = numpy.where(totals > 0, scores, numpy.inf)
+    scores = numpy.where(mask, scores, -numpy.inf)
+
+    best = (scores == scores.max(axis=-1, keepdims=True)) & mask
+    allocation: numpy.ndarray = best / numpy.maximum(best.sum(axis=-1, keepdims=True), 1)
+    return allocation
@@ -1,50 +1,241 @@
+import asyncio
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import csv
+from datetime import datetime
+from io import StringIO
+from hashlib import sha1
+import json as jsonlib
+from os import environ
+from typing import Any, Dict, List, Tuple
+from uuid import UUID
+
 from sanic import Blueprint
+from sanic.exceptions import InvalidUsage
 from sanic.request import Request
-from sanic.response import json, HTTPResponse
+from sanic.response import json, raw, stream, HTTPResponse, StreamingHTTPResponse
 
-from action_man.stores.actions import get_actions, save_action
+from action_man.api.args import datetime_arg, uuid_arg
+from action_man.serializers import dumps_action
+from action_man.stores.actions import ACTION_COLUMNS, get_actions, iter_actions, save_action, save_actions_bulk
 
 actions_bp = Blueprint('actions', url_prefix='/api/actions')
 
+ACTIONS_PAGE_SIZE = int(environ.get('ACTIONS_PAGE_SIZE', 500))
+# seconds GET /api/actions responses are cached in Redis, 0 disables the cache
+ACTIONS_CACHE_TTL = int(environ.get('ACTIONS_CACHE_TTL', 0))
+# rows fetched from the cursor and written to the client at once by the export
+EXPORT_CHUNK_SIZE = int(environ.get('ACTIONS_EXPORT_CHUNK_SIZE', 1000))
+# kafka publishes POSTed actions to the actions topic, db writes them synchronously
+INGEST_MODE = environ.get('ACTIONS_INGEST_MODE', 'kafka')
+# max actions accepted by a single POST /api/actions/batch
+INGEST_BATCH_SIZE = int(environ.get('ACTIONS_INGEST_BATCH_SIZE', 1000))
+
+
+def encode_cursor(last_modified: datetime, id: Any) -> str:
+    return urlsafe_b64encode(f'{last_modified.isoformat()}|{id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        last_modified, _, id = urlsafe_b64decode(cursor.encode()).decode().partition('|')
+        return datetime.fromisoformat(last_modified), UUID(id)
+    except ValueError as exc:
+        raise InvalidUsage('Invalid cursor') from exc
+
+
+def _action_data(action: Any) -> Dict:
+    # introduce Marshmallow for JSON schemas
+    return {
+        'id': str(action['id']),
+        'experiment_id': str(action['experiment_id']),
+        'variant_id': str(action['variant_id']),
+        'reward': int(action['reward']),
+        'context': action['context'],
+        'last_modified': action['last_modified'].isoformat()
+    }
+
+
+def _ndjson_rows(actions: List[Any]) -> str:
+    return ''.join(jsonlib.dumps(_action_data(action)) + '\n' for action in actions)
+
+
+def _csv_rows(actions: List[Any]) -> str:
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        [action[column] for column in ACTION_COLUMNS] for action in actions
+    )
+    return buffer.getvalue()
+
 
 @actions_bp.route('/')
 async def get_action(request: Request) -> HTTPResponse:
+    experiment_id = uuid_arg(request, 'experiment_id')
+    variant_id = uuid_arg(request, 'variant_id')
+    cursor = request.args.get('cursor')
+
+    try:
+        limit = min(int(request.args.get('limit', ACTIONS_PAGE_SIZE)), ACTIONS_PAGE_SIZE)
+    except ValueError as exc:
+        raise InvalidUsage('Invalid limit') from exc
+
+    cache_key = None
+    if ACTIONS_CACHE_TTL > 0:
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.query_args))
+        cache_key = f'actions_{sha1(query.encode()).hexdigest()}'
+        cached = await request.app.cache_pool.get(cache_key)
+        if cached:
+            return raw(cached, content_type='application/json')
+
+    limit = limit if limit > 0 else ACTIONS_PAGE_SIZE
+
     async with request.app.db_pool.acquire() as conn:
-        actions = await get_actions(conn, limit=500)
-        count = await request.app.cache_pool.get('action_count')
-
-        # introduce Marshmallow for JSON schemas
-        data = [
-            {
-                'id': str(action['id']),
-                'experiment_id': str(action['experiment_id']),
-                'variant_id': str(action['variant_id']),
-                'reward': int(action['reward']),
-                'context': action['context']
-            }
-            for action in actions
-        ]
-
-        return json(
-            {
-                'data': data,
-                'count': count
-            }
+        actions = await get_actions(
+            conn,
+            experiment_id=experiment_id,
+            variant_id=variant_id,
+            limit=limit,
+            after=decode_cursor(cursor) if cursor else None
         )
 
+    count = await request.app.cache_pool.get('action_count')
 
-@actions_bp.route("/", methods=['POST'])
-async def create_action(request: Request) -> HTTPResponse:
-    # no sanitation for the time being
-    data = request.json
+    data = [_action_data(action) for action in actions]
 
-    async with request.app.db_pool.acquire() as conn:
-        action_id = await save_action(conn, data)
+    # a short page means there is nothing left to fetch
+    last = actions[-1] if len(actions) == limit else None
 
-    return json(
+    body = jsonlib.dumps(
         {
-            'data': {
-                'id': action_id
-            }
+            'data': data,
+            'count': int(count) if count else 0,
+            'next': encode_cursor(last['last_modified'], last['id']) if last else None
         }
+    ).encode()
+
+    if cache_key:
+        await request.app.cache_pool.set(cache_key, body, expire=ACTIONS_CACHE_TTL)
+
+    return raw(body, content_type='application/json')
+
+
+@actions_bp.route('/export')
+async def export_actions(request: Request) -> StreamingHTTPResponse:
+    """
+    Stream actions as NDJSON, or CSV with format=csv, filtered by experiment_id
+    and a [since, until) last_modified range. Rows come from a server side
+    cursor so memory stays flat whatever the result size.
+    """
+    experiment_id = uuid_arg(request, 'experiment_id')
+    since = datetime_arg(request, 'since')
+    until = datetime_arg(request, 'until')
+    export_format = request.args.get('format', 'ndjson')
+
+    if export_format not in ('ndjson', 'csv'):
+        raise InvalidUsage('Invalid format')
+
+    serialize = _csv_rows if export_format == 'csv' else _ndjson_rows
+
+    async def streaming_fn(response: StreamingHTTPResponse) -> None:
+        if export_format == 'csv':
+            await response.write(','.join(ACTION_COLUMNS) + '\r\n')
+
+        async with request.app.db_pool.acquire() as conn:
+            chunk: List[Any] = []
+            async for action in iter_actions(
+                conn, experiment_id=experiment_id, since=since, until=until, prefetch=EXPORT_CHUNK_SIZE
+            ):
+                chunk.append(action)
+                if len(chunk) >= EXPORT_CHUNK_SIZE:
+                    await response.write(serialize(chunk))
+                    chunk = []
+
+            if chunk:
+                await response.write(serialize(chunk))
+
+    return stream(
+        streaming_fn,
+        content_type='text/csv' if export_format == 'csv' else 'application/x-ndjson'
     )
+
+
+def _validate_action(data: Any) -> Dict:
+    """
+    Check a POSTed action, returns it in the shape of records.Action
+
+    :param data: Any:
+
+    """
+    if not isinstance(data, dict):
+        raise InvalidUsage('Invalid action')
+
+    action: Dict[str, Any] = {}
+    for field in ('id', 'experiment_id', 'variant_id'):
+        try:
+            action[field] = str(UUID(str(data[field])))
+        except (KeyError, ValueError) as exc:
+            raise InvalidUsage(f'Invalid {field}') from exc
+
+    reward = data.get('reward')
+    if isinstance(reward, bool) or reward not in (0, 1):
+        raise InvalidUsage('Invalid reward')
+    action['reward'] = int(reward)
+
+    context = data.get('context', '{}')
+    if isinstance(context, str):
+        try:
+            jsonlib.loads(context)
+        except ValueError as exc:
+            raise InvalidUsage('Invalid context') from exc
+    action['context'] = context if isinstance(context, str) else jsonlib.dumps(context)
+
+    return action
+
+
+async def _publish_actions(request: Request, actions: List[Dict]) -> None:
+    # keyed by experiment so each experiment's actions land on one partition
+    deliveries = [
+        await request.app.kafka.send('actions', value=dumps_action(action), key=action['experiment_id'])
+        for action in actions
+    ]
+
+    if request.args.get('wait') == 'true':
+        await asyncio.gather(*deliveries)
+
+
+@actions_bp.route("/", methods=['POST'])
+async def create_action(request: Request) -> HTTPResponse:
+    action = _validate_action(request.json)
+
+    if INGEST_MODE == 'db':
+        async with request.app.db_pool.acquire() as conn:
+            action_id = await save_action(conn, action)
+
+        return json({'data': {'id': action_id}})
+
+    await _publish_actions(request, [action])
+
+    return json({'data': {'id': action['id']}}, status=202)
+
+
+@actions_bp.route("/batch", methods=['POST'])
+async def create_actions(request: Request) -> HTTPResponse:
+    """
+    Publish an array of actions in one request, every action is validated
+    before any of them is sent.
+    """
+    data = request.json
+    if not isinstance(data, list) or not 0 < len(data) <= INGEST_BATCH_SIZE:
+        raise InvalidUsage(f'Expected an array of 1 to {INGEST_BATCH_SIZE} actions')
+
+    actions = [_validate_action(action) for action in data]
+
+    if INGEST_MODE == 'db':
+        async with request.app.db_pool.acquire() as conn:
+            action_ids = await save_actions_bulk(conn, actions)
+
+        return json({'data': {'ids': [str(action_id) for action_id in action_ids]}})
+
+    await _publish_actions(request, actions)
+
+    return json({'data': {'ids': [action['id'] for action in actions]}}, status=202)
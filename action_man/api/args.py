@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+
+from sanic.exceptions import InvalidUsage
+from sanic.request import Request
+
+
+def uuid_arg(request: Request, name: str) -> Optional[UUID]:
+    value = request.args.get(name)
+    if not value:
+        return None
+
+    try:
+        return UUID(value)
+    except ValueError as exc:
+        raise InvalidUsage(f'Invalid {name}') from exc
+
+
+def datetime_arg(request: Request, name: str) -> Optional[datetime]:
+    value = request.args.get(name)
+    if not value:
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise InvalidUsage(f'Invalid {name}') from exc
+
+    # last_modified is stored as naive UTC
+    if parsed.tzinfo:
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
@@ -1,5 +1,4 @@
 import logging
-from json import dumps, loads
 from random import randint, choice
 from uuid import uuid4, uuid5, NAMESPACE_OID
 
@@ -7,6 +6,8 @@ from sanic import Blueprint
 from sanic.request import Request
 from sanic.response import json, HTTPResponse
 
+from action_man.serializers import dumps_action
+
 
 variants = [
     uuid5(NAMESPACE_OID, 'control'),
@@ -19,23 +20,22 @@ demo_bp = Blueprint('demo', url_prefix='/api/demo')
 
 @demo_bp.route('/publish', methods=['POST'])
 async def publish(request: Request) -> HTTPResponse:
-    probabilities = await request.app.cache_pool.get(f'{uuid5(NAMESPACE_OID, "test-experiment")}_probabilities')
-    probabilities = loads(probabilities) if probabilities else {}
+    probabilities = await request.app.probabilities.get(uuid5(NAMESPACE_OID, 'test-experiment'))
 
     variant_id = max(probabilities.keys(), key=lambda x: probabilities[x]) if probabilities else None
 
-    _data = dumps(
+    experiment_id = str(uuid5(NAMESPACE_OID, 'test-experiment'))
+
+    data = dumps_action(
         {
             'id': str(uuid4()),
-            'experiment_id': str(uuid5(NAMESPACE_OID, 'test-experiment')),
+            'experiment_id': experiment_id,
             'variant_id': variant_id or str(choice(variants)),
             'reward': randint(0, 1),
             'context': '{}'
         }
     )
 
-    data = _data.encode('utf-8')
-    
-    request.app.kafka.send('actions', value=data)
+    await request.app.kafka.send('actions', value=data, key=experiment_id)
 
     return json({'data': {'status': 'accepted'}})
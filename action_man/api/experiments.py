@@ -0,0 +1,100 @@
+import asyncio
+from os import environ
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from sanic import Blueprint
+from sanic.exceptions import InvalidUsage
+from sanic.request import Request
+from sanic.response import json, HTTPResponse
+
+from action_man.api.args import datetime_arg, uuid_arg
+from action_man.assignment import assign
+from action_man.stores.stats import GRANULARITIES, get_stats
+
+experiments_bp = Blueprint('experiments', url_prefix='/api/experiments')
+
+# max experiments assigned by a single GET /api/experiments/assign
+ASSIGN_BATCH_SIZE = int(environ.get('EXPERIMENTS_ASSIGN_BATCH_SIZE', 50))
+
+
+@experiments_bp.route('/<experiment_id:uuid>/stats')
+async def get_experiment_stats(request: Request, experiment_id: UUID) -> HTTPResponse:
+    """
+    Successes and totals per variant and time bucket from the rollup table,
+    filtered by variant_id and a [since, until) bucket range.
+    """
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in GRANULARITIES:
+        raise InvalidUsage('Invalid granularity')
+
+    async with request.app.db_pool.acquire() as conn:
+        stats = await get_stats(
+            conn,
+            experiment_id,
+            variant_id=uuid_arg(request, 'variant_id'),
+            since=datetime_arg(request, 'since'),
+            until=datetime_arg(request, 'until'),
+            granularity=granularity
+        )
+
+    return json(
+        {
+            'data': [
+                {
+                    'variant_id': str(record['variant_id']),
+                    'bucket': record['bucket'].isoformat(),
+                    'successes': record['successes'],
+                    'total': record['total']
+                }
+                for record in stats
+            ]
+        }
+    )
+
+
+async def _assignment(request: Request, experiment_id: Any, user_id: Optional[str]) -> Dict:
+    state = await request.app.probabilities.state(experiment_id)
+
+    return {
+        'experiment_id': str(experiment_id),
+        'variant_id': assign(
+            str(experiment_id),
+            state.probabilities,
+            state.counters,
+            algorithm=state.algorithm,
+            user_id=user_id,
+            allocation=state.allocation
+        )
+    }
+
+
+@experiments_bp.route('/<experiment_id:uuid>/assign')
+async def assign_experiment(request: Request, experiment_id: UUID) -> HTTPResponse:
+    """
+    Pick the variant to show for an experiment, sticky for a given user_id.
+    State comes from the in process probabilities cache, so a warm
+    experiment is assigned without any network hop.
+    """
+    return json({'data': await _assignment(request, experiment_id, request.args.get('user_id'))})
+
+
+@experiments_bp.route('/assign')
+async def assign_experiments(request: Request) -> HTTPResponse:
+    """
+    Assign every experiment_id query arg at once, e.g. all the experiments of a page
+    """
+    experiment_ids = request.args.getlist('experiment_id') or []
+    if not 0 < len(experiment_ids) <= ASSIGN_BATCH_SIZE:
+        raise InvalidUsage(f'Expected 1 to {ASSIGN_BATCH_SIZE} experiment_id')
+
+    try:
+        experiment_ids = [UUID(experiment_id) for experiment_id in experiment_ids]
+    except ValueError as exc:
+        raise InvalidUsage('Invalid experiment_id') from exc
+
+    user_id = request.args.get('user_id')
+
+    return json(
+        {'data': await asyncio.gather(*[_assignment(request, experiment_id, user_id) for experiment_id in experiment_ids])}
+    )
@@ -0,0 +1,20 @@
+from sanic import Blueprint
+from sanic.request import Request
+from sanic.response import raw, HTTPResponse
+
+from action_man import metrics
+
+metrics_bp = Blueprint('metrics')
+
+
+@metrics_bp.route('/metrics')
+async def get_metrics(request: Request) -> HTTPResponse:
+    """
+    Prometheus scrape endpoint of the web app
+    """
+    app = request.app
+    metrics.record_db_pool(metrics.REGISTRY, app.db_pool)
+    metrics.record_cache_pool(metrics.REGISTRY, app.cache_pool)
+    metrics.gauge('kafka.producer.in_flight', app.kafka.in_flight)
+
+    return raw(metrics.render(metrics.REGISTRY).encode(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
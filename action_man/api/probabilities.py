@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+from os import environ
+from time import monotonic
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import aioredis
+
+from action_man import cache
+from action_man.algorithm.alias import AliasTable
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# seconds a cached copy is trusted without hearing from PROBABILITIES_CHANNEL,
+# bounds staleness should a notification be lost
+PROBABILITIES_CACHE_TTL = float(environ.get('PROBABILITIES_CACHE_TTL', 5.0))
+
+
+class ExperimentState(NamedTuple):
+    probabilities: Dict[str, float]
+    # (successes, total) per variant id
+    counters: Dict[str, Tuple[int, int]]
+    algorithm: Optional[str]
+    # weighted choice over the probabilities, built by the workers
+    allocation: Optional[AliasTable]
+
+
+EMPTY_STATE = ExperimentState({}, {}, None, None)
+
+
+class ProbabilitiesCache:
+    '''Per process copy of the parsed `{experiment}_probabilities` keys, along
+    with the counters and algorithm they were calculated from and their alias table.
+
+    Entries are dropped as soon as the workers announce new probabilities on
+    cache.PROBABILITIES_CHANNEL, see `listen`, and reloaded from Redis on the
+    next read; an entry older than `ttl` is reloaded regardless. Unknown
+    experiments are cached too, as EMPTY_STATE.
+    '''
+
+    def __init__(
+        self,
+        pool: aioredis.ConnectionsPool,
+        ttl: float = PROBABILITIES_CACHE_TTL,
+        clock: Callable[[], float] = monotonic
+    ) -> None:
+        self._pool = pool
+        self._ttl = ttl
+        self._clock = clock
+        # expiry and state, per experiment
+        self._entries: Dict[str, Tuple[float, ExperimentState]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, experiment_id: Any) -> Dict[str, float]:
+        """
+        Probabilities of an experiment by variant id, empty until the workers calculated them
+
+        :param experiment_id: Any:
+        """
+        return (await self.state(experiment_id)).probabilities
+
+    async def state(self, experiment_id: Any) -> ExperimentState:
+        """
+        Probabilities, counters, algorithm and allocation table of an experiment
+
+        :param experiment_id: Any:
+        """
+        experiment_id = str(experiment_id)
+        expires, state = self._entries.get(experiment_id, (float('-inf'), EMPTY_STATE))
+        if self._clock() < expires:
+            return state
+
+        # an expired placeholder marks the read in flight, a notification
+        # evicting it meanwhile means what is read may already be stale
+        expires = self._clock() + self._ttl
+        reading = self._entries[experiment_id] = (float('-inf'), state)
+
+        probabilities, counters, algorithm, allocation = await cache.get_experiment_state(self._pool, experiment_id)
+        state = ExperimentState(
+            json.loads(probabilities) if probabilities else {},
+            counters,
+            algorithm,
+            AliasTable.loads(allocation) if allocation else None
+        )
+
+        if self._entries.get(experiment_id) is reading:
+            self._entries[experiment_id] = (expires, state)
+
+        return state
+
+    def invalidate(self, experiment_id: Any) -> None:
+        """
+
+        :param experiment_id: Any:
+        """
+        self._entries.pop(str(experiment_id), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def listen(self, retry: float = 1.0) -> None:
+        """
+        Evict experiments announced on PROBABILITIES_CHANNEL until cancelled,
+        resubscribing `retry` seconds after the subscription is lost
+
+        :param retry: float:  (Default value = 1.0)
+        """
+        while True:
+            try:
+                channel, = await self._pool.subscribe(cache.PROBABILITIES_CHANNEL)
+                # notifications may have been missed while unsubscribed
+                self.clear()
+
+                async for experiment_id in channel.iter(encoding='utf-8'):
+                    self.invalidate(experiment_id)
+            except (aioredis.RedisError, OSError):
+                logger.exception('Lost probabilities subscription')
+
+            self.clear()
+            await asyncio.sleep(retry)
@@ -0,0 +1,123 @@
+from hashlib import blake2b
+from math import log
+import random
+from typing import Mapping, Optional, Tuple
+
+from action_man.algorithm.alias import AliasTable
+from action_man.algorithm.registry import DEFAULT_ALGORITHM
+
+
+# algorithms whose probabilities are the chance of each variant being the best
+# under Beta posteriors, a single posterior draw per variant samples from them
+BETA_ALGORITHMS = ('thompson', 'closed_form')
+
+# draws of the callers not passing their own generator
+_rng = random.Random()
+
+
+def thompson_choice(counters: Mapping[str, Tuple[int, int]], rng: Optional[random.Random] = None) -> Optional[str]:
+    """
+    Variant with the highest draw from its Beta(successes + 1, failures + 1) posterior
+
+    :param counters: Mapping[str, Tuple[int, int]]: (successes, total) per variant id
+    :param rng: Optional[random.Random]:  (Default value = None)
+    """
+    if not counters:
+        return None
+
+    rng = rng or _rng
+    return max(
+        counters,
+        key=lambda variant_id: rng.betavariate(
+            counters[variant_id][0] + 1, max(counters[variant_id][1] - counters[variant_id][0], 0) + 1
+        )
+    )
+
+
+def weighted_choice(weights: Mapping[str, float], rng: Optional[random.Random] = None) -> Optional[str]:
+    """
+    Variant drawn in proportion to its weight, uniformly when no weight is positive
+
+    :param weights: Mapping[str, float]:
+    :param rng: Optional[random.Random]:  (Default value = None)
+    """
+    if not weights:
+        return None
+
+    rng = rng or _rng
+    variants = list(weights)
+    if sum(weights.values()) <= 0:
+        return rng.choice(variants)
+
+    return rng.choices(variants, weights=[weights[variant_id] for variant_id in variants])[0]
+
+
+def _unit_hash(*parts: str) -> float:
+    digest = blake2b(':'.join(parts).encode(), digest_size=8).digest()
+    # (0, 1) excluded bounds, so the log below is always defined and negative
+    return (int.from_bytes(digest, 'big') + 0.5) / 2 ** 64
+
+
+def sticky_choice(user_id: str, experiment_id: str, weights: Mapping[str, float]) -> Optional[str]:
+    """
+    Variant of a user by weighted rendezvous hashing: every variant scores
+    -weight / ln(hash(user, experiment, variant)) and the highest one wins.
+    Users are split across variants in proportion to the weights, and when the
+    weights shift only the share of users needed to follow them moves.
+
+    :param user_id: str:
+    :param experiment_id: str:
+    :param weights: Mapping[str, float]:
+    """
+    if not weights:
+        return None
+
+    if sum(weights.values()) <= 0:
+        weights = {variant_id: 1.0 for variant_id in weights}
+
+    return max(
+        weights,
+        key=lambda variant_id: -weights[variant_id] / log(_unit_hash(user_id, experiment_id, variant_id))
+    )
+
+
+def assign(
+    experiment_id: str,
+    probabilities: Mapping[str, float],
+    counters: Mapping[str, Tuple[int, int]],
+    algorithm: Optional[str] = None,
+    user_id: Optional[str] = None,
+    allocation: Optional[AliasTable] = None,
+    rng: Optional[random.Random] = None
+) -> Optional[str]:
+    """
+    Pick the variant of an experiment to show, None when it has no variants.
+
+    Users passing a `user_id` get a sticky variant weighted by the
+    probabilities. Anonymous ones get a draw from the `allocation` table
+    published by the workers; experiments calculated before tables were
+    published get a Thompson sample from the counters for Bayesian
+    algorithms, a draw weighted by the probabilities otherwise.
+
+    :param experiment_id: str:
+    :param probabilities: Mapping[str, float]: traffic share per variant id
+    :param counters: Mapping[str, Tuple[int, int]]: (successes, total) per variant id
+    :param algorithm: Optional[str]:  (Default value = None)
+    :param user_id: Optional[str]:  (Default value = None)
+    :param allocation: Optional[AliasTable]: alias table of the probabilities  (Default value = None)
+    :param rng: Optional[random.Random]:  (Default value = None)
+    """
+    # variants registered after the last calculation get no traffic until the next one
+    weights = {variant_id: probabilities.get(variant_id, 0.0) for variant_id in counters} or dict(probabilities)
+
+    if user_id:
+        return sticky_choice(user_id, experiment_id, weights)
+
+    rng = rng or _rng
+    if allocation:
+        return allocation.sample(rng)
+
+    if (algorithm or DEFAULT_ALGORITHM) in BETA_ALGORITHMS and counters:
+        return thompson_choice(counters, rng)
+
+    return weighted_choice(weights, rng)
@@ -0,0 +1,110 @@
+import logging
+from typing import Optional, Tuple
+from uuid import UUID
+
+import click
+from faust.cli import AppCommand, option
+
+from action_man.entrypoint import kafka
+from action_man import cache
+from action_man import db
+from action_man.bootstrap import recovery
+from action_man.stores.stats import TOTALS_SOURCES
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# atomically move a flat counter key into its experiment hash and register
+# the variant and the experiment of its partition alongside, running it twice
+# is harmless as the flat key is gone after the first run
+MOVE_COUNTER_SCRIPT = '''
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('HINCRBY', KEYS[2], ARGV[1], value)
+    redis.call('SADD', KEYS[3], ARGV[2])
+    redis.call('SADD', KEYS[4], ARGV[3])
+    redis.call('DEL', KEYS[1])
+end
+return value
+'''
+
+
+def _parse_flat_counter(key: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Split a "{experiment_id}_{variant_id}_{successes|total}" key,
+    returns None for keys not following the layout
+
+    :param key: str:
+    """
+    try:
+        experiment_id, variant_id, counter = key.split('_')
+        UUID(experiment_id), UUID(variant_id)
+    except ValueError:
+        return None
+
+    return experiment_id, variant_id, counter
+
+
+@kafka.command(
+    option('--count', type=int, default=1000, help='Number of keys fetched per SCAN call.'),
+)
+async def migrate_counters(self: AppCommand, count: int) -> None:
+    """Move flat experiment counter keys into per experiment hashes and split the experiment sets by partition."""
+    cache_pool = await cache.cache_pool()
+    migrated = 0
+
+    try:
+        with await cache_pool as conn:
+            for pattern in ('*_successes', '*_total'):
+                async for key in conn.iscan(match=pattern, count=count):
+                    parsed = _parse_flat_counter(key.decode())
+                    if not parsed:
+                        continue
+
+                    experiment_id, variant_id, counter = parsed
+                    await conn.eval(
+                        MOVE_COUNTER_SCRIPT,
+                        keys=[
+                            key.decode(),
+                            cache.counters_key(experiment_id),
+                            cache.variants_key(experiment_id),
+                            cache.experiments_key(cache.experiment_partition(experiment_id)),
+                        ],
+                        args=[f'{variant_id}_{counter}', variant_id, experiment_id]
+                    )
+                    migrated += 1
+
+            # experiment sets used to be global, they are now split by partition
+            for key, partition_key in ((cache.EXPERIMENTS_KEY, cache.experiments_key),
+                                       (cache.DIRTY_EXPERIMENTS_KEY, cache.dirty_experiments_key)):
+                for experiment_id in await conn.smembers(key, encoding='utf-8'):
+                    await conn.sadd(partition_key(cache.experiment_partition(experiment_id)), experiment_id)
+                await conn.delete(key)
+    finally:
+        cache_pool.close()
+        await cache_pool.wait_closed()
+
+    self.say(f'Migrated {migrated} counter keys')
+
+
+@kafka.command(
+    option('--source', type=click.Choice(sorted(TOTALS_SOURCES)), default='stats',
+           help='Rebuild from the experiment_variant_stats rollup or the raw actions.'),
+    option('--chunk', type=int, default=1000, help='Number of experiments loaded per round trip.'),
+    option('--resume/--no-resume', default=True, help='Carry on from the checkpoint of an interrupted rebuild.'),
+)
+async def rebuild_counters(self: AppCommand, source: str, chunk: int, resume: bool) -> None:
+    """Recompute the Redis experiment counters and action_count from Postgres."""
+    db_pool = await db.db_pool()
+    cache_pool = await cache.cache_pool()
+
+    try:
+        rows, elapsed = await recovery.rebuild_counters(db_pool, cache_pool, source=source, chunk=chunk, resume=resume)
+    finally:
+        await db_pool.close()
+        cache_pool.close()
+        await cache_pool.wait_closed()
+
+    self.say(f'Rebuilt {rows} counters from {source} in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/sec)')
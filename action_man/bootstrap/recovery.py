@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from os import environ
+from time import monotonic, perf_counter
+from typing import Any, Tuple
+
+from aioredis import ConnectionsPool
+from aioredlock import Lock, LockError
+from asyncpg.pool import Pool
+
+from action_man import cache
+from action_man.stores.exceptions import StoreException
+from action_man.stores.stats import count_actions, get_variant_totals
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# last experiment id loaded by an unfinished rebuild, empty while the first chunk loads
+CHECKPOINT_KEY = 'counters_rebuild_checkpoint'
+# counters are rebuilt from here on start when Redis lost them, `stats` or `actions`, empty disables it
+COUNTERS_REBUILD_SOURCE = environ.get('COUNTERS_REBUILD_SOURCE', 'stats')
+# seconds between two attempts at a rebuild another worker holds, or that failed
+REBUILD_RETRY_INTERVAL = float(environ.get('COUNTERS_REBUILD_RETRY_INTERVAL', 5.0))
+
+
+async def needs_rebuild(cache_pool: ConnectionsPool) -> bool:
+    """
+    Counters are rebuilt when Redis lost them or a previous rebuild didn't finish
+
+    :param cache_pool: ConnectionsPool:
+    """
+    with await cache_pool as conn:
+        return not await conn.exists('action_count') or bool(await conn.exists(CHECKPOINT_KEY))
+
+
+async def rebuild_counters(
+    db_pool: Pool,
+    cache_pool: ConnectionsPool,
+    source: str = 'stats',
+    chunk: int = 1000,
+    resume: bool = True
+) -> Tuple[int, float]:
+    """
+    Recompute the experiment counters and action_count from Postgres and load
+    them into Redis, `chunk` experiments at a time. Progress is checkpointed
+    in Redis after every chunk so an interrupted rebuild carries on from there
+    when `resume` is set. Returns the variant counters loaded and the seconds taken.
+
+    :param db_pool: Pool:
+    :param cache_pool: ConnectionsPool:
+    :param source: str: `stats` for the rollup table, `actions` for the raw actions  (Default value = 'stats')
+    :param chunk: int:  (Default value = 1000)
+    :param resume: bool:  (Default value = True)
+    """
+    with await cache_pool as conn:
+        after = await conn.get(CHECKPOINT_KEY, encoding='utf-8') if resume else None
+        await conn.set(CHECKPOINT_KEY, after or '')
+
+    if after:
+        logger.warning(f'Resuming counters rebuild after experiment {after}')
+
+    rows = 0
+    start = perf_counter()
+
+    async with db_pool.acquire() as conn:
+        while True:
+            totals = await get_variant_totals(conn, after=after or None, limit=chunk, source=source)
+            if not totals:
+                break
+
+            await cache.load_counters(
+                cache_pool,
+                [(record['experiment_id'], record['variant_id'], record['successes'], record['total']) for record in totals]
+            )
+            after = str(totals[-1]['experiment_id'])
+            await cache.set_key(cache_pool, CHECKPOINT_KEY, after)
+
+            rows += len(totals)
+            logger.info(f'Rebuilt {rows} counters, {rows / (perf_counter() - start):.0f} rows/sec')
+
+        action_count = await count_actions(conn, source=source)
+
+    with await cache_pool as conn:
+        tr = conn.multi_exec()
+        tr.set('action_count', action_count)
+        tr.delete(CHECKPOINT_KEY)
+        await tr.execute()
+
+    return rows, perf_counter() - start
+
+
+async def _keep_extending(lock: Lock, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await lock.extend()
+
+
+async def restore_counters(app: Any) -> None:
+    """
+    Rebuild the counters from COUNTERS_REBUILD_SOURCE when Redis lost them,
+    then SETNX action_count. Meant to run before the worker consumes any
+    action, as the rebuild overwrites counters with absolute values: one
+    worker rebuilds under a lock, extended in the background for as long as
+    the rebuild lasts, the others wait for it to finish.
+
+    :param app: Any: KafkaWorker
+    """
+    cache_pool = await app.cache_pool()
+
+    while COUNTERS_REBUILD_SOURCE and await needs_rebuild(cache_pool):
+        lock_manager = await app.redis_lock_manager()
+        start = monotonic()
+        try:
+            async with await lock_manager.lock('lock_counters_rebuild') as lock:
+                app.monitor.on_lock_acquired('lock_counters_rebuild', monotonic() - start)
+
+                # the worker holding the lock before may have finished the rebuild
+                if not await needs_rebuild(cache_pool):
+                    break
+
+                extending = asyncio.ensure_future(_keep_extending(lock, lock_manager.lock_timeout / 3))
+                try:
+                    rows, elapsed = await rebuild_counters(await app.db_pool(), cache_pool, source=COUNTERS_REBUILD_SOURCE)
+                finally:
+                    extending.cancel()
+
+                logger.warning(
+                    f'Rebuilt {rows} counters from {COUNTERS_REBUILD_SOURCE} in {elapsed:.2f}s '
+                    f'({rows / max(elapsed, 1e-9):.0f} rows/sec)'
+                )
+        except LockError:
+            logger.warning(f'Counters rebuild running on another worker, checking again in {REBUILD_RETRY_INTERVAL}s')
+            await asyncio.sleep(REBUILD_RETRY_INTERVAL)
+        except StoreException:
+            logger.exception(f'Counters rebuild failed, retrying in {REBUILD_RETRY_INTERVAL}s')
+            await asyncio.sleep(REBUILD_RETRY_INTERVAL)
+
+    await cache.setnx_key(cache_pool, 'action_count', 0)
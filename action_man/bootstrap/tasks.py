@@ -1,15 +1,29 @@
+from datetime import datetime
 import logging
+from os import environ
+from typing import cast
 
 from action_man.entrypoint import kafka
-from action_man import cache
+from action_man.metrics import METRICS_FLUSH_INTERVAL
+from action_man.monitoring import StatsdMon
+from action_man.stores.exceptions import StoreException
+from action_man.stores.partitions import maintain_partitions
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+# days covered by each action partition, 7 for weekly ones
+PARTITION_DAYS = int(environ.get('ACTIONS_PARTITION_DAYS', 1))
+# partitions created ahead of the current one
+PARTITIONS_AHEAD = int(environ.get('ACTIONS_PARTITIONS_AHEAD', 3))
+# days of actions kept, older partitions are dropped, 0 keeps everything
+RETENTION_DAYS = int(environ.get('ACTIONS_RETENTION_DAYS', 0))
+
+
 @kafka.task
-async def create_unconsumed_topics():
+async def create_unconsumed_topics() -> None:
     """
     Create a topic for each of the events that have no consumers yet,
     this is a one off task haction_manening at bootstrap
@@ -29,7 +43,7 @@ async def create_unconsumed_topics():
 
 
 @kafka.timer(60.0)
-async def refresh_topics_map():
+async def refresh_topics_map() -> None:
     """
     Refresh topics_map attribute inside kafka action_man
     """
@@ -38,12 +52,29 @@ async def refresh_topics_map():
     logger.warning(kafka.topics_map)
 
 
-@kafka.task
-async def setnx_actions_count():
+@kafka.timer(METRICS_FLUSH_INTERVAL)
+async def flush_metrics() -> None:
+    """
+    Send the metrics recorded in process since the last flush to statsd
     """
-    SETNX actions_count key in redis
+    cast(StatsdMon, kafka.monitor).flush_metrics()
+
+
+@kafka.timer(3600.0, on_leader=True)
+async def maintain_action_partitions() -> None:
     """
-    cache_pool = await kafka.cache_pool()
-    redis_lock_manager = await kafka.redis_lock_manager()
+    Create the upcoming action partitions and drop the ones past retention
+    """
+    db_pool = await kafka.db_pool()
+
+    try:
+        async with db_pool.acquire() as conn:
+            created, dropped = await maintain_partitions(
+                conn, datetime.utcnow(), days=PARTITION_DAYS, ahead=PARTITIONS_AHEAD, retention=RETENTION_DAYS
+            )
+    except StoreException:
+        logger.exception('Action partitions maintenance failed')
+        return
 
-    await cache.set_key_with_lock('action_count', 0, redis_lock_manager, cache_pool, execute_cmd='setnx')
+    if created or dropped:
+        logger.warning(f'Action partitions created: {created}, dropped: {dropped}')
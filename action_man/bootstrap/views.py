@@ -0,0 +1,13 @@
+from faust.web import Request, Response, View
+
+from action_man.entrypoint import kafka
+from action_man import metrics
+
+
+@kafka.page('/metrics')
+async def get_metrics(web: View, request: Request) -> Response:
+    """
+    Prometheus scrape endpoint of the worker, on the faust web port
+    """
+    kafka.record_metrics(metrics.REGISTRY)
+    return web.bytes(metrics.render(metrics.REGISTRY).encode(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
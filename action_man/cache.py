@@ -1,7 +1,11 @@
+from collections import Counter, defaultdict
 from os import environ
+from time import monotonic
+from typing import Any, DefaultDict, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 import aioredis
 from aioredlock import Aioredlock, LockError
+from kafka.partitioner.default import murmur2
 
 
 async def cache_pool() -> aioredis.ConnectionsPool:
@@ -25,20 +29,502 @@ async def set_key_with_lock(
     value: str,
     lock_manager: Aioredlock,
     pool: aioredis.ConnectionsPool,
-    execute_cmd: str = 'set'
+    execute_cmd: str = 'set',
+    monitor: Any = None
 ) -> None:
     """
+    Only meant for writes that need coordination across keys or processes,
+    single key writes are atomic in Redis already, see set_key, setnx_key,
+    msetnx_keys and compare_and_set.
 
     :param key:
     :param value:
     :param lock_manager:
     :param pool:
     :param command:
+    :param monitor: reports the time spent waiting for the lock when given
     """
+    start = monotonic()
     try:
         async with await lock_manager.lock(f'lock_{key}'):
+            if monitor:
+                monitor.on_lock_acquired(key, monotonic() - start)
+
             with await pool as conn:
                 command = getattr(conn, execute_cmd)
                 await command(key, value)
     except LockError:
         raise
+
+
+async def set_key(pool: aioredis.ConnectionsPool, key: str, value: Any) -> None:
+    """
+
+    :param pool: aioredis.ConnectionsPool:
+    :param key: str:
+    :param value: Any:
+    """
+    with await pool as conn:
+        await conn.set(key, value)
+
+
+async def setnx_key(pool: aioredis.ConnectionsPool, key: str, value: Any) -> bool:
+    """
+    Set key only if it doesn't exist, returns whether it was set
+
+    :param pool: aioredis.ConnectionsPool:
+    :param key: str:
+    :param value: Any:
+    """
+    with await pool as conn:
+        return bool(await conn.setnx(key, value))
+
+
+async def msetnx_keys(pool: aioredis.ConnectionsPool, values: Dict[str, Any]) -> bool:
+    """
+    Set all keys only if none of them exists, returns whether they were set
+
+    :param pool: aioredis.ConnectionsPool:
+    :param values: Dict[str, Any]:
+    """
+    if not values:
+        return False
+
+    pairs = [item for pair in values.items() for item in pair]
+
+    with await pool as conn:
+        return bool(await conn.msetnx(*pairs))
+
+
+# versions handed out to compare_and_set writers, a single Redis counter keeps
+# them ordered across workers whatever their wall clocks say
+VERSIONS_KEY = 'versions'
+
+
+async def next_version(pool: aioredis.ConnectionsPool) -> int:
+    """
+    Version for compare_and_set, greater than every version handed out before
+
+    :param pool: aioredis.ConnectionsPool:
+    """
+    with await pool as conn:
+        return int(await conn.incr(VERSIONS_KEY))
+
+
+# set the value only when the version is newer than the stored one,
+# so that a slow writer can't overwrite a fresher value; keys past the
+# version are companions of the value, written along with it
+COMPARE_AND_SET_SCRIPT = '''
+local current = tonumber(redis.call('GET', KEYS[2]) or '-1')
+if tonumber(ARGV[2]) > current then
+    redis.call('SET', KEYS[1], ARGV[1])
+    redis.call('SET', KEYS[2], ARGV[2])
+    for i = 3, #KEYS do
+        redis.call('SET', KEYS[i], ARGV[i])
+    end
+    return 1
+end
+return 0
+'''
+
+
+async def compare_and_set(
+    pool: aioredis.ConnectionsPool, key: str, value: Any, version: int, companions: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Set key to value if version is greater than the one last written,
+    versions are kept in "{key}_revision", apart from the wall clock
+    "{key}_version" of earlier releases. Returns whether the value was set
+
+    :param pool: aioredis.ConnectionsPool:
+    :param key: str:
+    :param value: Any:
+    :param version: int: see next_version
+    :param companions: Optional[Dict[str, Any]]: keys set atomically along with `key`, under its version  (Default value = None)
+    """
+    companions = companions or {}
+
+    with await pool as conn:
+        return bool(
+            await conn.eval(
+                COMPARE_AND_SET_SCRIPT,
+                keys=[key, f'{key}_revision', *companions.keys()],
+                args=[value, version, *companions.values()]
+            )
+        )
+
+
+# ids of the experiments whose probabilities were rewritten, the web app
+# evicts them from its local copy, see api.probabilities
+PROBABILITIES_CHANNEL = 'probabilities'
+
+
+async def publish_probabilities(pool: aioredis.ConnectionsPool, experiment_ids: Sequence[Any]) -> None:
+    """
+    Notify the subscribers of PROBABILITIES_CHANNEL the probabilities of the experiments changed
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_ids: Sequence[Any]:
+    """
+    if not experiment_ids:
+        return
+
+    with await pool as conn:
+        pipe = conn.pipeline()
+        for experiment_id in experiment_ids:
+            pipe.publish(PROBABILITIES_CHANNEL, str(experiment_id))
+        await pipe.execute()
+
+
+class CounterBuffer:
+    '''In memory buffer of Redis increments.
+
+    Increments are merged per key (or per hash field) and written as a single
+    MULTI/EXEC batch of INCRBY/HINCRBY commands on flush, set members are
+    deduplicated and written with one SADD per key. The batch applies all or
+    nothing, so putting it back in the buffer after a failure never counts
+    an increment twice.
+    '''
+
+    def __init__(self) -> None:
+        self._counters: Counter = Counter()
+        self._members: DefaultDict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._counters) + len(self._members)
+
+    @property
+    def increments(self) -> int:
+        """ Total amount of buffered increments, before merging """
+        return sum(self._counters.values())
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        """
+
+        :param key: str:
+        :param amount: int:  (Default value = 1)
+        """
+        self._counters[key] += amount
+
+    def hincr(self, key: str, field: str, amount: int = 1) -> None:
+        """
+
+        :param key: str:
+        :param field: str:
+        :param amount: int:  (Default value = 1)
+        """
+        self._counters[(key, field)] += amount
+
+    def sadd(self, key: str, member: str) -> None:
+        """
+
+        :param key: str:
+        :param member: str:
+        """
+        self._members[key].add(member)
+
+    async def flush(self, pool: aioredis.ConnectionsPool) -> int:
+        """
+        Write buffered increments in one transaction, returns the number of
+        commands sent. On failure increments are put back in the buffer.
+
+        :param pool: aioredis.ConnectionsPool:
+        """
+        if not len(self):
+            return 0
+
+        counters, self._counters = self._counters, Counter()
+        members, self._members = self._members, defaultdict(set)
+
+        try:
+            with await pool as conn:
+                tr = conn.multi_exec()
+                for key, amount in counters.items():
+                    if isinstance(key, tuple):
+                        tr.hincrby(key[0], key[1], amount)
+                    else:
+                        tr.incrby(key, amount)
+                for key, values in members.items():
+                    tr.sadd(key, *values)
+                await tr.execute()
+        except Exception:
+            counters.update(self._counters)
+            self._counters = counters
+            for key, values in self._members.items():
+                members[key] |= values
+            self._members = members
+            raise
+
+        return len(counters) + len(members)
+
+
+EXPERIMENTS_KEY = 'experiments'
+DIRTY_EXPERIMENTS_KEY = 'dirty_experiments'
+ALGORITHMS_KEY = 'experiment_algorithms'
+
+# experiments are registered per partition of the actions topic, so every
+# worker schedules the experiments it owns, has to match the topic partitions
+PARTITIONS = int(environ.get('KAFKA_TOPIC_PARTITIONS', 10))
+
+
+def experiment_partition(experiment_id: Any, partitions: int = PARTITIONS) -> int:
+    """
+    Partition of the actions topic keyed by experiment_id, the Kafka default partitioner
+
+    :param experiment_id: Any:
+    :param partitions: int:  (Default value = PARTITIONS)
+    """
+    key_hash: int = murmur2(str(experiment_id).encode())
+    return (key_hash & 0x7fffffff) % partitions
+
+
+def experiments_key(partition: int) -> str:
+    """
+    Redis set registering every experiment id of a partition
+
+    :param partition: int:
+    """
+    return f'{EXPERIMENTS_KEY}:{partition}'
+
+
+def dirty_experiments_key(partition: int) -> str:
+    """
+    Redis set of the experiments of a partition that received actions since they were last popped
+
+    :param partition: int:
+    """
+    return f'{DIRTY_EXPERIMENTS_KEY}:{partition}'
+
+
+def counters_key(experiment_id: Any) -> str:
+    """
+    Redis hash holding successes/total counters for every variant of an experiment
+
+    :param experiment_id: Any:
+    """
+    return f'{experiment_id}_counters'
+
+
+def variants_key(experiment_id: Any) -> str:
+    """
+    Redis set registering every variant id seen for an experiment
+
+    :param experiment_id: Any:
+    """
+    return f'{experiment_id}_variants'
+
+
+def allocation_key(experiment_id: Any) -> str:
+    """
+    Alias table of an experiment probabilities, see algorithm.alias
+
+    :param experiment_id: Any:
+    """
+    return f'{experiment_id}_allocation'
+
+
+def incr_counters(counters: CounterBuffer, experiment_id: Any, variant_id: Any, reward: int) -> None:
+    """
+    Buffer the counter increments for an action and register its variant,
+    the worker debouncer schedules the recalculation
+
+    :param counters: CounterBuffer:
+    :param experiment_id: Any:
+    :param variant_id: Any:
+    :param reward: int:
+    """
+    key = counters_key(experiment_id)
+
+    if reward == 1:
+        counters.hincr(key, f'{variant_id}_successes')
+    counters.hincr(key, f'{variant_id}_total')
+    counters.sadd(variants_key(experiment_id), str(variant_id))
+    counters.sadd(experiments_key(experiment_partition(experiment_id)), str(experiment_id))
+
+
+async def init_counters(pool: aioredis.ConnectionsPool, experiment_id: Any, variant_id: Any) -> None:
+    """
+    Register a variant and initialize its counters, HSETNX is atomic so no lock is needed
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_id: Any:
+    :param variant_id: Any:
+    """
+    key = counters_key(experiment_id)
+
+    with await pool as conn:
+        pipe = conn.pipeline()
+        pipe.hsetnx(key, f'{variant_id}_successes', 0)
+        pipe.hsetnx(key, f'{variant_id}_total', 0)
+        pipe.sadd(variants_key(experiment_id), str(variant_id))
+        partition = experiment_partition(experiment_id)
+        pipe.sadd(experiments_key(partition), str(experiment_id))
+        pipe.sadd(dirty_experiments_key(partition), str(experiment_id))
+        await pipe.execute()
+
+
+async def load_counters(
+    pool: aioredis.ConnectionsPool,
+    counters: Iterable[Tuple[Any, Any, int, int]],
+    flag_dirty: bool = True
+) -> int:
+    """
+    Overwrite counters with absolute (experiment_id, variant_id, successes, total)
+    values in one pipeline, registering the variants and, unless told otherwise,
+    flagging the experiments dirty. Loading the same counters twice is harmless.
+    Returns the commands sent.
+
+    :param pool: aioredis.ConnectionsPool:
+    :param counters: Iterable[Tuple[Any, Any, int, int]]:
+    :param flag_dirty: bool: off for writers already marking experiments through the debouncer  (Default value = True)
+    """
+    commands = 0
+
+    with await pool as conn:
+        pipe = conn.pipeline()
+        for experiment_id, variant_id, successes, total in counters:
+            pipe.hmset(counters_key(experiment_id), f'{variant_id}_successes', successes, f'{variant_id}_total', total)
+            pipe.sadd(variants_key(experiment_id), str(variant_id))
+            partition = experiment_partition(experiment_id)
+            pipe.sadd(experiments_key(partition), str(experiment_id))
+            commands += 3
+            if flag_dirty:
+                pipe.sadd(dirty_experiments_key(partition), str(experiment_id))
+                commands += 1
+        await pipe.execute()
+
+    return commands
+
+
+async def get_counters(pool: aioredis.ConnectionsPool, experiment_id: Any) -> Dict[str, Tuple[int, int]]:
+    """
+    Read the counters of a whole experiment in a single round trip,
+    returns a (successes, total) tuple per variant id, registered variants
+    without counters yet are reported as (0, 0)
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_id: Any:
+    """
+    with await pool as conn:
+        pipe = conn.pipeline()
+        variants = pipe.smembers(variants_key(experiment_id), encoding='utf-8')
+        fields = pipe.hgetall(counters_key(experiment_id), encoding='utf-8')
+        await pipe.execute()
+
+    counters = {variant_id: (0, 0) for variant_id in await variants}
+    counters.update(parse_counters(await fields))
+
+    return counters
+
+
+async def get_experiment_state(
+    pool: aioredis.ConnectionsPool, experiment_id: Any
+) -> Tuple[Optional[str], Dict[str, Tuple[int, int]], Optional[str], Optional[str]]:
+    """
+    Read the raw JSON probabilities, the counters, the algorithm and the raw
+    allocation table of an experiment in a single round trip
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_id: Any:
+    """
+    with await pool as conn:
+        pipe = conn.pipeline()
+        probabilities = pipe.get(f'{experiment_id}_probabilities', encoding='utf-8')
+        allocation = pipe.get(allocation_key(experiment_id), encoding='utf-8')
+        variants = pipe.smembers(variants_key(experiment_id), encoding='utf-8')
+        fields = pipe.hgetall(counters_key(experiment_id), encoding='utf-8')
+        algorithm = pipe.hget(ALGORITHMS_KEY, str(experiment_id), encoding='utf-8')
+        await pipe.execute()
+
+    counters = {variant_id: (0, 0) for variant_id in await variants}
+    counters.update(parse_counters(await fields))
+
+    return await probabilities, counters, await algorithm, await allocation
+
+
+async def set_algorithm(pool: aioredis.ConnectionsPool, experiment_id: Any, algorithm: str) -> None:
+    """
+    Pick the algorithm used to calculate an experiment probabilities
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_id: Any:
+    :param algorithm: str:
+    """
+    with await pool as conn:
+        await conn.hset(ALGORITHMS_KEY, str(experiment_id), algorithm)
+
+
+async def get_algorithms(pool: aioredis.ConnectionsPool, experiment_ids: Sequence[Any]) -> List[Optional[str]]:
+    """
+    Algorithm names of a batch of experiments, None where no algorithm was picked
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_ids: Sequence[Any]:
+    """
+    if not experiment_ids:
+        return []
+
+    with await pool as conn:
+        algorithms: List[Optional[str]] = await conn.hmget(
+            ALGORITHMS_KEY, *[str(experiment_id) for experiment_id in experiment_ids], encoding='utf-8'
+        )
+
+    return algorithms
+
+
+async def flag_dirty_experiments(pool: aioredis.ConnectionsPool, experiment_ids: Iterable[Any]) -> None:
+    """
+    Flag experiments dirty in the set of their partition, the worker owning
+    it recalculates them on its next sweep
+
+    :param pool: aioredis.ConnectionsPool:
+    :param experiment_ids: Iterable[Any]:
+    """
+    with await pool as conn:
+        pipe = conn.pipeline()
+        for experiment_id in experiment_ids:
+            pipe.sadd(dirty_experiments_key(experiment_partition(experiment_id)), str(experiment_id))
+        await pipe.execute()
+
+
+async def pop_dirty_experiments(pool: aioredis.ConnectionsPool, partitions: Iterable[int]) -> Tuple[List[str], int]:
+    """
+    Atomically take the experiments of `partitions` that received actions since
+    the last call, returns them along with the number of their active experiments
+
+    :param pool: aioredis.ConnectionsPool:
+    :param partitions: Iterable[int]:
+    """
+    partitions = list(partitions)
+    if not partitions:
+        return [], 0
+
+    with await pool as conn:
+        tr = conn.multi_exec()
+        dirty = [tr.smembers(dirty_experiments_key(partition), encoding='utf-8') for partition in partitions]
+        tr.delete(*[dirty_experiments_key(partition) for partition in partitions])
+        active = [tr.scard(experiments_key(partition)) for partition in partitions]
+        await tr.execute()
+
+    return [experiment_id for members in dirty for experiment_id in await members], sum([await count for count in active])
+
+
+def parse_counters(fields: Dict[str, str]) -> Dict[str, Tuple[int, int]]:
+    """
+
+    :param fields: Dict[str, str]: raw HGETALL reply
+    """
+    counters: Dict[str, Tuple[int, int]] = {}
+
+    for field, value in fields.items():
+        variant_id, _, counter = field.rpartition('_')
+        successes, total = counters.get(variant_id, (0, 0))
+
+        if counter == 'successes':
+            successes = int(value)
+        elif counter == 'total':
+            total = int(value)
+
+        counters[variant_id] = (successes, total)
+
+    return counters
@@ -0,0 +1,130 @@
+import logging
+from os import environ
+from typing import Any, AsyncIterator, Set
+
+from faust.types import StreamT
+
+from action_man.entrypoint import kafka
+from action_man.kafka import current_app
+from action_man import cache
+from action_man import metrics
+from action_man.topics import keyed_actions_topic, owned_actions
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# `redis` increments counters in Redis from cache_actions, `table` keeps them
+# in a faust Table and only writes periodic snapshots to Redis
+COUNTERS_BACKEND = environ.get('COUNTERS_BACKEND', 'redis')
+COUNTERS_SNAPSHOT_INTERVAL = float(environ.get('COUNTERS_SNAPSHOT_INTERVAL', 1.0))
+
+# table keys updated since the last snapshot, local to this worker partitions
+_changed: Set[str] = set()
+
+
+async def snapshot_counts(app: Any, table: Any, changed: Set[str]) -> int:
+    """
+    Write the counters of `table` changed since the last snapshot to Redis,
+    returns how many were written
+
+    :param app: Any: KafkaWorker
+    :param table: Any: faust Table of [successes, total] per experiment_id:variant_id
+    :param changed: Set[str]: keys changed since the last snapshot, emptied once written
+    """
+    if not changed:
+        return 0
+
+    keys = [key for key in changed if key in table]
+    changed.clear()
+
+    snapshot = []
+    for key in keys:
+        experiment_id, _, variant_id = key.partition(':')
+        successes, total = table[key]
+        snapshot.append((experiment_id, variant_id, successes, total))
+
+    try:
+        with metrics.timer('redis.load_counters'):
+            # count_actions marks the experiments through the debouncer already
+            await cache.load_counters(await app.cache_pool(), snapshot, flag_dirty=False)
+    except Exception:
+        changed.update(keys)
+        raise
+
+    return len(snapshot)
+
+
+async def publish_counts(app: Any) -> None:
+    """
+    Make the actions counted so far visible in Redis, whatever the backend
+
+    :param app: Any: KafkaWorker
+    """
+    if COUNTERS_BACKEND == 'table':
+        await snapshot_counts(app, counts_table, _changed)
+    await app.flush_counters()
+
+
+# [successes, total] per experiment_id:variant_id, persisted by the app
+# store (rocksdb:// in production) and restored from its changelog,
+# only filled with the table backend
+counts_table = kafka.Table('experiment_variant_counts', default=lambda: [0, 0])
+
+
+@kafka.agent(keyed_actions_topic)
+async def count_actions(actions: StreamT) -> AsyncIterator[Any]:
+    '''
+    Count successes and totals per variant in the local table.
+
+    Actions are keyed by experiment, unkeyed ones are repartitioned, so every
+    variant counter is owned by a single worker and increments are in
+    memory operations.
+    Counters not in the table yet are seeded from Redis, so switching
+    backend doesn't reset them.
+    With the redis backend actions are counted by actions.agents.cache_actions
+    and just acked here.
+
+    :param actions: StreamT:
+
+    '''
+    if COUNTERS_BACKEND != 'table':
+        # cache_actions repartitions, acking here avoids forwarding twice
+        async for action in actions:
+            yield action.id
+        return
+
+    async for action in owned_actions(actions):
+        app = current_app()
+        key = f'{action.experiment_id}:{action.variant_id}'
+
+        if key not in counts_table:
+            counters = await cache.get_counters(await app.cache_pool(), action.experiment_id)
+            counts_table[key] = list(counters.get(str(action.variant_id), (0, 0)))
+
+        successes, total = counts_table[key]
+        counts_table[key] = [successes + int(action.reward), total + 1]
+        _changed.add(key)
+
+        app.counter_buffer().incr('action_count')
+        app.debouncer().mark(str(action.experiment_id))
+
+        yield action.id
+
+
+@kafka.timer(interval=COUNTERS_SNAPSHOT_INTERVAL)
+async def snapshot_counters() -> None:
+    '''
+    Materialise the changed counters into Redis for the web tier
+    '''
+    written = await snapshot_counts(kafka, counts_table, _changed)
+    if written:
+        logger.info(f'Snapshot of {written} counters written to Redis')
+
+
+@kafka.on_partitions_revoked.connect
+async def snapshot_counters_on_revoke(app: Any, /, *args: Any, **kwargs: Any) -> None:
+    '''
+    Snapshot counters before their partitions move to another worker
+    '''
+    await snapshot_counts(app, counts_table, _changed)
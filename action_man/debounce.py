@@ -0,0 +1,77 @@
+from os import environ
+from time import monotonic
+from typing import Callable, Dict, List, Tuple
+
+
+# min seconds between two recalculations of an experiment
+DEBOUNCE_INTERVAL = float(environ.get('PROBABILITIES_DEBOUNCE_INTERVAL', 1.0))
+# actions after which an experiment is recalculated without waiting for the interval
+DEBOUNCE_ACTIONS = int(environ.get('PROBABILITIES_DEBOUNCE_ACTIONS', 1000))
+
+
+class Debouncer:
+    '''Tracks experiments that received actions and decides when to recalculate them.
+
+    An experiment is due once `interval` seconds passed since it was last
+    recalculated, so an idle experiment is recalculated on its first action
+    and a busy one at most once per interval, or as soon as `max_pending`
+    actions piled up for it. Experiments without actions are never due.
+    '''
+
+    def __init__(
+        self,
+        interval: float = DEBOUNCE_INTERVAL,
+        max_pending: int = DEBOUNCE_ACTIONS,
+        clock: Callable[[], float] = monotonic
+    ) -> None:
+        self._interval = interval
+        self._max_pending = max_pending
+        self._clock = clock
+        # actions and time of the first one, per experiment waiting to be recalculated
+        self._pending: Dict[str, Tuple[int, float]] = {}
+        self._last_run: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def mark(self, key: str) -> None:
+        """
+        Record an action for `key`
+
+        :param key: str:
+        """
+        actions, since = self._pending.get(key, (0, self._clock()))
+        self._pending[key] = (actions + 1, since)
+
+    def due(self) -> List[Tuple[str, float]]:
+        """
+        Take the keys to recalculate now, along with the seconds their
+        oldest pending action waited
+        """
+        now = self._clock()
+        due = [
+            (key, now - since)
+            for key, (actions, since) in self._pending.items()
+            if actions >= self._max_pending or now - self._last_run.get(key, float('-inf')) >= self._interval
+        ]
+
+        for key, _ in due:
+            del self._pending[key]
+            self._last_run[key] = now
+
+        # past the interval an experiment is due on its next action anyway
+        self._last_run = {
+            key: last_run for key, last_run in self._last_run.items() if now - last_run < self._interval
+        }
+
+        return due
+
+    def drain(self) -> List[str]:
+        """
+        Take every pending key, due or not, to hand them over before this
+        worker stops tracking them
+        """
+        pending = list(self._pending)
+        self._pending.clear()
+
+        return pending
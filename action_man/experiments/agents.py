@@ -1,35 +1,114 @@
+import asyncio
 import logging
+from os import environ
+from typing import Any, AsyncIterator, List, cast
 
-from faust.agents import current_agent
 from faust.types import StreamT
 
+from action_man.algorithm import registry
 from action_man.entrypoint import kafka
+from action_man.kafka import current_app
 from action_man import cache
-from action_man import models
 from action_man import records
-from action_man.probabilities.agents import calculate_probabilities
+from action_man.monitoring import StatsdMon
+from action_man.counters.agents import publish_counts
+from action_man.probabilities.agents import PROBABILITIES_BATCH_SIZE, calculate_batch
+from action_man.topics import actions_topic
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# probability batches a worker scores at the same time on every tick
+EXPERIMENTS_CONCURRENCY = int(environ.get('EXPERIMENTS_CONCURRENCY', 4))
+# seconds between two checks for experiments the debouncer finds due
+DEBOUNCE_TICK = float(environ.get('PROBABILITIES_DEBOUNCE_TICK', 0.1))
 
-@kafka.timer(interval=1.0, on_leader=True)
-async def calculate_experiments():
+
+def owned_partitions() -> List[int]:
     """
+    Partitions of the actions topic assigned to this worker
     """
-    db_pool = await kafka.db_pool()
+    return sorted(tp.partition for tp in kafka.consumer.assignment() if tp.topic == actions_topic.get_topic_name())
+
 
-    logger.info('calculate_experiments')
+async def calculate_all(experiment_ids: List[str]) -> None:
+    """
+    Recalculate experiments in batches of PROBABILITIES_BATCH_SIZE,
+    scoring up to EXPERIMENTS_CONCURRENCY batches at a time, a failed batch
+    is flagged dirty again so the next calculate_experiments sweep retries it
 
-    async with db_pool.acquire() as conn:
-        async with conn.transaction():
-            async for record in conn.cursor(f'SELECT DISTINCT experiment_id FROM {models.Action.__tablename__}'):
-                await calculate_probabilities.cast(record.get('experiment_id'))
+    :param experiment_ids: List[str]:
+    """
+    concurrency = asyncio.Semaphore(EXPERIMENTS_CONCURRENCY)
+
+    async def calculate(batch: List[str]) -> None:
+        async with concurrency:
+            try:
+                await calculate_batch(kafka, batch)
+            except Exception:
+                logger.exception(f'Failed to recalculate {len(batch)} experiments, flagging them dirty again')
+                try:
+                    await cache.flag_dirty_experiments(await kafka.cache_pool(), batch)
+                except Exception:
+                    logger.exception(f'Failed to flag {len(batch)} experiments dirty again, they wait for new actions')
+
+    await asyncio.gather(*[
+        calculate(experiment_ids[i:i + PROBABILITIES_BATCH_SIZE])
+        for i in range(0, len(experiment_ids), PROBABILITIES_BATCH_SIZE)
+    ])
+
+
+@kafka.timer(interval=DEBOUNCE_TICK)
+async def recalculate_debounced_experiments() -> None:
+    """
+    Recalculate the experiments the action stream marked on this worker
+    once the debouncer finds them due, see debounce.Debouncer
+    """
+    debouncer = kafka.debouncer()
+    due = debouncer.due()
+    if not due:
+        return
+
+    await publish_counts(kafka)
+    await calculate_all([experiment_id for experiment_id, _ in due])
+
+    cast(StatsdMon, kafka.monitor).on_probabilities_recalculated(len(due), len(debouncer), [staleness for _, staleness in due])
+
+
+@kafka.on_partitions_revoked.connect
+async def flag_debounced_experiments_on_revoke(app: Any, /, *args: Any, **kwargs: Any) -> None:
+    """
+    Hand the experiments still waiting in the debouncer over to the sweep of
+    calculate_experiments, so whichever worker owns their partition next
+    recalculates them
+    """
+    await publish_counts(app)
+    await app.flush_debouncer()
+
+
+@kafka.timer(interval=1.0)
+async def calculate_experiments() -> None:
+    """
+    Recalculate probabilities of the experiments flagged dirty in Redis
+    outside of the action stream, by init_experiment or a counters rebuild,
+    idle experiments are skipped.
+
+    Every worker only schedules the experiments of the actions partitions it owns.
+    """
+    cache_pool = await kafka.cache_pool()
+
+    dirty, active = await cache.pop_dirty_experiments(cache_pool, owned_partitions())
+
+    await calculate_all(dirty)
+
+    skipped = max(active - len(dirty), 0)
+    logger.info(f'calculate_experiments: {len(dirty)} experiments recalculated, {skipped} skipped')
+    cast(StatsdMon, kafka.monitor).on_experiments_tick(len(dirty), skipped)
 
 
 @kafka.agent(value_type=records.ExperimentInit)
-async def init_experiment(experiments: StreamT):
+async def init_experiment(experiments: StreamT) -> AsyncIterator[Any]:
     """
 
     :param experiments: StreamT:
@@ -39,11 +118,14 @@ async def init_experiment(experiments: StreamT):
         experiment_id = experiment.experiment_id
         variant_id = experiment.variant_id
 
-        cache_pool = await kafka.cache_pool()
-        redis_lock_manager = await current_agent().app.redis_lock_manager()
+        cache_pool = await current_app().cache_pool()
+
+        await cache.init_counters(cache_pool, experiment_id, variant_id)
+        logger.info(f'Initializing {experiment_id}_{variant_id} cache counters')
 
-        await cache.set_key_with_lock(f'{experiment_id}_{variant_id}_successes', 0, redis_lock_manager, cache_pool, execute_cmd='setnx')
-        await cache.set_key_with_lock(f'{experiment_id}_{variant_id}_total', 0, redis_lock_manager, cache_pool, execute_cmd='setnx')
-        logger.info(f'Initializing {experiment_id}_{variant_id} cache keys')
+        if experiment.algorithm in registry.ALGORITHMS:
+            await cache.set_algorithm(cache_pool, experiment_id, experiment.algorithm)
+        elif experiment.algorithm:
+            logger.warning(f'Unknown algorithm {experiment.algorithm} for {experiment_id}, {registry.DEFAULT_ALGORITHM} will be used')
 
         yield experiment_id, variant_id
@@ -1,16 +1,23 @@
+import asyncio
 from asyncio import AbstractEventLoop
 import logging
 from os import environ
-from typing import Dict, List
+from functools import partial
+from time import monotonic, perf_counter
+from typing import Any, Awaitable, Dict, Optional, Union, cast
 
+from aiokafka import AIOKafkaProducer
 from asyncpg.pool import Pool
 from aioredis import ConnectionsPool
 from aioredlock import Aioredlock
 import faust
-from kafka import KafkaProducer
+from faust.agents import current_agent
 
 from action_man import cache
 from action_man import db
+from action_man import metrics
+from action_man.bootstrap import recovery
+from action_man.debounce import Debouncer
 from action_man.monitoring import StatsdMon
 
 
@@ -18,10 +25,115 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+PRODUCER_LINGER_MS = int(environ.get('KAFKA_PRODUCER_LINGER_MS', 5))
+PRODUCER_MAX_BATCH_SIZE = int(environ.get('KAFKA_PRODUCER_MAX_BATCH_SIZE', 65536))
+PRODUCER_COMPRESSION_TYPE = environ.get('KAFKA_PRODUCER_COMPRESSION_TYPE') or None
+PRODUCER_MAX_IN_FLIGHT = int(environ.get('KAFKA_PRODUCER_MAX_IN_FLIGHT', 10000))
+
+
 class KafkaConnectException(Exception):
     pass
 
 
+class AsyncProducer:
+    '''Asyncio native producer with bounded in-flight buffering.
+
+    `send` returns as soon as the message is buffered, handing back a future
+    resolved on broker acknowledgement. Once `max_in_flight` messages are
+    waiting for acknowledgement `send` blocks, pushing back on the caller
+    instead of growing the buffer.
+    '''
+
+    def __init__(self, producer: Any, max_in_flight: int = PRODUCER_MAX_IN_FLIGHT) -> None:
+        self._producer = producer
+        self._max_in_flight = max_in_flight
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    @property
+    def in_flight(self) -> int:
+        """ Messages buffered and not yet acknowledged """
+        return self._pending
+
+    async def start(self) -> None:
+        """ """
+        try:
+            await self._producer.start()
+        except Exception as exc:
+            raise KafkaConnectException(f'Exception while connecting to Kafka: {exc}') from exc
+
+    async def stop(self) -> None:
+        """ Flush pending messages and close the producer """
+        await self._producer.stop()
+
+    async def _send(self, topic: str, value: bytes, key: Optional[bytes]) -> Awaitable:
+        delivery: Awaitable = await self._producer.send(topic, value=value, key=key)
+        return delivery
+
+    async def send(self, topic: str, value: bytes, key: Union[str, bytes, None] = None) -> asyncio.Future:
+        """
+        Buffer a message, returns a future resolved with its record metadata
+
+        :param topic: str:
+        :param value: bytes:
+        :param key: Union[str, bytes, None]:  (Default value = None)
+        """
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+
+        start = perf_counter()
+        await self._in_flight.acquire()
+        try:
+            delivery = asyncio.ensure_future(
+                await self._send(topic, value, key.encode() if isinstance(key, str) else key)
+            )
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+        self._pending += 1
+        delivery.add_done_callback(partial(self._on_delivery, topic.replace('.', '_'), start))
+        return delivery
+
+    def _on_delivery(self, topic: str, start: float, delivery: asyncio.Future) -> None:
+        self._pending -= 1
+        self._in_flight.release()  # type: ignore
+
+        # retrieving the exception keeps fire and forget sends from going unnoticed
+        if not delivery.cancelled() and delivery.exception():
+            logger.error(f'Kafka delivery failed: {delivery.exception()}')
+            metrics.incr('messages_sent_error', topic=topic)
+            return
+
+        metrics.observe('kafka.send', perf_counter() - start, topic=topic)
+
+    async def send_and_wait(self, topic: str, value: bytes, key: Union[str, bytes, None] = None) -> Any:
+        """
+        Send a message and wait for the broker acknowledgement
+
+        :param topic: str:
+        :param value: bytes:
+        :param key: Union[str, bytes, None]:  (Default value = None)
+        """
+        return await (await self.send(topic, value, key=key))
+
+
+class WorkerProducer(AsyncProducer):
+    '''AsyncProducer sharing the producer faust already runs in the worker,
+    its lifecycle is handled by the app.
+    '''
+
+    async def start(self) -> None:
+        """ """
+
+    async def stop(self) -> None:
+        """ """
+
+    async def _send(self, topic: str, value: bytes, key: Optional[bytes]) -> Awaitable:
+        delivery: Awaitable = await self._producer.send(topic, key, value, None, None, None)
+        return delivery
+
+
 class KafkaWorker(faust.App):
     '''Wraction_maner class for combining features of faust and Kafka-Python. The broker
     argument can be passed as a string of the form 'kafka-1:9092,kafka-2:9092'
@@ -30,17 +142,16 @@ class KafkaWorker(faust.App):
 
     '''
 
-    def __init__(self, *args: List, **kwargs: Dict) -> None:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
         self.broker : str = kwargs.pop('broker')
         self.topics_map : Dict[str, faust.agents.Agent] = {}
 
-        logging.warning('kafka.kafka_producer initialization...')
-        self._kafka_producer = get_kafka_producer(self.broker)
-        logging.warning('kafka.kafka_producer initialization...done ✓')
-
-        self._db_pool = None
-        self._cache_pool = None
-        self._redis_lock_manager = None
+        self._db_pool: Optional[Pool] = None
+        self._cache_pool: Optional[ConnectionsPool] = None
+        self._redis_lock_manager: Optional[Aioredlock] = None
+        self._counter_buffer = cache.CounterBuffer()
+        self._debouncer = Debouncer()
+        self._kafka_producer: Optional[WorkerProducer] = None
 
         super().__init__(*args, broker=KafkaWorker._broker_faust_string(self.broker), **kwargs)
 
@@ -83,37 +194,115 @@ class KafkaWorker(faust.App):
 
         return self._redis_lock_manager
 
-    def kafka_producer(self) -> KafkaProducer:
+    def counter_buffer(self) -> cache.CounterBuffer:
+        """ """
+        return self._counter_buffer
+
+    def debouncer(self) -> Debouncer:
         """ """
+        return self._debouncer
+
+    async def flush_counters(self) -> None:
+        """ Flush buffered cache increments, reporting batch size and latency to the monitor """
+        if not len(self._counter_buffer):
+            return
+
+        increments = self._counter_buffer.increments
+        cache_pool = await self.cache_pool()
+
+        start = monotonic()
+        commands = await self._counter_buffer.flush(cache_pool)
+        cast(StatsdMon, self.monitor).on_counters_flush(commands, increments, monotonic() - start)
+
+    async def flush_debouncer(self) -> None:
+        """ Flag the experiments still waiting in the debouncer dirty in Redis, so they aren't lost with this worker """
+        pending = self._debouncer.drain()
+        if pending:
+            await cache.flag_dirty_experiments(await self.cache_pool(), pending)
+
+    def record_metrics(self, registry: metrics.Registry) -> None:
+        """
+        Gauge what is only known on demand: consumer lag per assigned
+        partition, producer buffers and connection pools
+
+        :param registry: metrics.Registry:
+        """
+        registry.clear_gauge('consumer.lag')
+        read_offsets = self.monitor.tp_read_offsets
+        for tp in self.consumer.assignment():
+            highwater = self.consumer.highwater(tp)
+            if highwater is not None and tp in read_offsets:
+                registry.gauge(
+                    'consumer.lag', max(highwater - read_offsets[tp] - 1, 0), topic=tp.topic, partition=str(tp.partition)
+                )
+
+        registry.gauge('kafka.producer.buffered', self.producer.buffer.pending.qsize())
+        if self._kafka_producer:
+            registry.gauge('kafka.producer.in_flight', self._kafka_producer.in_flight)
+        if self._db_pool:
+            metrics.record_db_pool(registry, self._db_pool)
+        if self._cache_pool:
+            metrics.record_cache_pool(registry, self._cache_pool)
+
+    def kafka_producer(self) -> AsyncProducer:
+        """ """
+        if not self._kafka_producer:
+            self._kafka_producer = WorkerProducer(self.producer)
+
         return self._kafka_producer
 
+    async def on_first_start(self) -> None:
+        """ Restore lost counters before the agents start consuming, see recovery.restore_counters """
+        await super().on_first_start()
+        await recovery.restore_counters(self)
+
     async def on_stop(self) -> None:
         """ """
         if self._redis_lock_manager:
             await self._redis_lock_manager.destroy()
 
         if self._cache_pool:
+            try:
+                await self.flush_counters()
+            except Exception:
+                logging.exception('kafka.counter_buffer flush failed, counts might be lost')
+
+            try:
+                await self.flush_debouncer()
+            except Exception:
+                logging.exception('kafka.debouncer flush failed, pending recalculations might be lost')
+
             self._cache_pool.close()
             await self._cache_pool.wait_closed()
 
         await super().on_stop()
 
 
-def get_kafka_producer(broker: str) -> KafkaProducer:
+def current_app() -> KafkaWorker:
+    '''The KafkaWorker of the agent running the current task'''
+    agent = current_agent()
+    if agent is None:
+        raise RuntimeError('current_app() called outside of an agent')
+    return cast(KafkaWorker, agent.app)
+
+
+def get_kafka_producer(broker: str, loop: AbstractEventLoop) -> AsyncProducer:
     '''
 
     :param broker: str:
+    :param loop: AbstractEventLoop:
 
     '''
-    try:
-        return KafkaProducer(
+    return AsyncProducer(
+        AIOKafkaProducer(
+            loop=loop,
             bootstrap_servers=broker,
             connections_max_idle_ms=10000,
-            key_serializer=lambda x: x.encode() if x else None
+            linger_ms=PRODUCER_LINGER_MS,
+            max_batch_size=PRODUCER_MAX_BATCH_SIZE,
+            compression_type=PRODUCER_COMPRESSION_TYPE
         )
-    except Exception as exc:
-        raise KafkaConnectException(f'Exception while connecting to Kafka: {exc}') from exc
-
+    )
 
 
 def init_kafka() -> KafkaWorker:
@@ -124,17 +313,21 @@ def init_kafka() -> KafkaWorker:
         service_name='action_man',
         broker=environ.get('KAFKA_CNX_STRING', 'kafka:9092'),
         autodiscover=[
-            'action_man.actions', 'action_man.bootstrap', 'action_man.experiments', 'action_man.probabilities'
+            'action_man.actions', 'action_man.bootstrap', 'action_man.counters', 'action_man.experiments',
+            'action_man.probabilities'
         ],
         origin='action_man',
         store=environ.get('STORE_CNX_STRING', 'memory://'),
-        topic_partitions=10,
+        topic_partitions=cache.PARTITIONS,
+        producer_linger_ms=PRODUCER_LINGER_MS,
+        producer_max_batch_size=PRODUCER_MAX_BATCH_SIZE,
+        producer_compression_type=PRODUCER_COMPRESSION_TYPE,
         consumer_auto_offset_reset=environ.get('KAFKA_AUTO_OFFSET_RESET', 'latest'),
         web_bind='0.0.0.0',
         web_host='0.0.0.0',
         web_enabled=True,
         monitor=StatsdMon(
-            host=environ.get('STATSD_HOST'),
+            host=environ.get('STATSD_HOST', 'localhost'),
             prefix=f'{environ.get("STATSD_PREFIX")}'
         )
     )
@@ -0,0 +1,251 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from os import environ
+import re
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from faust.agents import current_agent
+
+
+# seconds between two flushes of the in process metrics to statsd
+METRICS_FLUSH_INTERVAL = float(environ.get('METRICS_FLUSH_INTERVAL', 10.0))
+
+# content type of the Prometheus text exposition format rendered by `render`
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PROMETHEUS_PREFIX = 'action_man'
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf')
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+
+class Histogram:
+    '''Cumulative counts of observations per bucket, along with their sum.'''
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+
+        :param value: float:
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float, counts: Optional[Sequence[int]] = None) -> float:
+        """
+        Upper bound of the bucket holding the `q` quantile, of `counts` when
+        given (e.g. the difference between two snapshots) or of every observation
+
+        :param q: float:
+        :param counts: Optional[Sequence[int]]:  (Default value = None)
+        """
+        counts = self.counts if counts is None else counts
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+
+class Registry:
+    '''In process counters, gauges and histograms keyed by name and labels.
+
+    Recording a value only updates a dict entry, nothing leaves the process
+    until an exporter reads the registry: StatsdMon sends what changed every
+    METRICS_FLUSH_INTERVAL. Values are cumulative since the process started.
+    '''
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self._buckets = buckets
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+
+        :param name: str:
+        :param value: float:  (Default value = 1)
+        """
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels: str) -> None:
+        """
+
+        :param name: str:
+        :param value: float:
+        """
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def clear_gauge(self, name: str) -> None:
+        """
+        Drop every series of a gauge, e.g. before recording the partitions currently assigned
+
+        :param name: str:
+        """
+        self.gauges = {key: value for key, value in self.gauges.items() if key[0] != name}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+
+        :param name: str:
+        :param value: float: seconds, for latencies
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self._buckets)
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """
+        Observe the seconds spent in the block, tagged with the running agent
+
+        :param name: str:
+        """
+        labels.setdefault('agent', agent_label())
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+
+def agent_label() -> str:
+    """ Short name of the agent running the current task, empty outside agents """
+    agent = current_agent()
+    return agent.name.rsplit('.', 1)[-1] if agent else ''
+
+
+def snapshot(registry: Registry) -> Tuple[Dict[Key, float], Dict[Key, Tuple[List[int], float, int]]]:
+    """
+    Copy of the counters and histograms of `registry`, exporters diff two
+    snapshots to report what happened in between
+
+    :param registry: Registry:
+    """
+    return (
+        dict(registry.counters),
+        {key: (list(h.counts), h.sum, h.count) for key, h in registry.histograms.items()}
+    )
+
+
+def _prometheus_name(name: str) -> str:
+    return f'{PROMETHEUS_PREFIX}_{re.sub("[^a-zA-Z0-9_]", "_", name)}'
+
+
+def _prometheus_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+
+    pairs = ','.join(
+        '{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in labels
+    )
+    return f'{{{pairs}}}'
+
+
+def _prometheus_value(value: float) -> str:
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+def render(registry: Registry) -> str:
+    """
+    Every series of `registry` in the Prometheus text exposition format,
+    names are prefixed with PROMETHEUS_PREFIX and dots become underscores
+
+    :param registry: Registry:
+    """
+    lines: List[str] = []
+    typed = set()
+
+    def family(metric: str, kind: str) -> None:
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f'# TYPE {metric} {kind}')
+
+    for (name, labels), value in sorted(registry.counters.items()):
+        metric = f'{_prometheus_name(name)}_total'
+        family(metric, 'counter')
+        lines.append(f'{metric}{_prometheus_labels(labels)} {_prometheus_value(value)}')
+
+    for (name, labels), value in sorted(registry.gauges.items()):
+        metric = _prometheus_name(name)
+        family(metric, 'gauge')
+        lines.append(f'{metric}{_prometheus_labels(labels)} {_prometheus_value(value)}')
+
+    for (name, labels), histogram in sorted(registry.histograms.items(), key=lambda item: item[0]):
+        metric = _prometheus_name(name)
+        family(metric, 'histogram')
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            bucket_labels = _prometheus_labels(labels + (('le', _prometheus_value(bound)),))
+            lines.append(f'{metric}_bucket{bucket_labels} {cumulative}')
+        lines.append(f'{metric}_sum{_prometheus_labels(labels)} {_prometheus_value(histogram.sum)}')
+        lines.append(f'{metric}_count{_prometheus_labels(labels)} {histogram.count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def record_db_pool(registry: Registry, pool: Any) -> None:
+    """
+    Gauge the connections of an asyncpg pool
+
+    :param registry: Registry:
+    :param pool: Any: asyncpg Pool
+    """
+    if hasattr(pool, 'get_size'):
+        # asyncpg >= 0.25
+        size, idle, maxsize = pool.get_size(), pool.get_idle_size(), pool.get_max_size()
+    else:
+        # asyncpg 0.20 only has the private _holders/_maxsize, the gauges are
+        # skipped rather than breaking the flush if another version drops them
+        holders = getattr(pool, '_holders', None)
+        maxsize = getattr(pool, '_maxsize', None)
+        if holders is None or maxsize is None:
+            return
+        size = sum(getattr(holder, '_con', None) is not None for holder in holders)
+        idle = size - sum(getattr(holder, '_in_use', None) is not None for holder in holders)
+
+    registry.gauge('db.pool.size', size)
+    registry.gauge('db.pool.in_use', size - idle)
+    registry.gauge('db.pool.max', maxsize)
+
+
+def record_cache_pool(registry: Registry, pool: Any) -> None:
+    """
+    Gauge the connections of an aioredis pool
+
+    :param registry: Registry:
+    :param pool: Any: aioredis Redis, as returned by cache.cache_pool
+    """
+    connections = pool.connection
+    registry.gauge('redis.pool.size', connections.size)
+    registry.gauge('redis.pool.in_use', connections.size - connections.freesize)
+    registry.gauge('redis.pool.max', connections.maxsize)
+
+
+REGISTRY = Registry()
+
+incr = REGISTRY.incr
+gauge = REGISTRY.gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
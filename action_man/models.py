@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer
+from sqlalchemy import BigInteger, Column, Date, DateTime, Index, Integer, String
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 
@@ -14,4 +14,51 @@ class Action(Base):
     variant_id = Column(UUID(as_uuid=True), index=True)
     reward = Column(Integer)
     context = Column(JSONB)
-    last_modified = Column(DateTime(), nullable=False, server_default=func.now())
+    # the partition key, has to be part of the primary key
+    last_modified = Column(DateTime(), primary_key=True, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # keyset pagination, see stores.actions.get_actions
+        Index('ix_action_last_modified_id', 'last_modified', 'id'),
+        Index('ix_action_experiment_id_last_modified_id', 'experiment_id', 'last_modified', 'id'),
+        # partitions are managed by stores.partitions
+        {'postgresql_partition_by': 'RANGE (last_modified)'},
+    )
+
+
+class ActionId(Base):
+    ''' '''
+    __tablename__ = 'action_id'
+
+    # ids of the recently stored actions, action can't enforce their uniqueness
+    # across partitions as its primary key includes the partition key
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    # the partition key, ids are only checked for ACTIONS_DEDUP_DAYS so their
+    # partitions are dropped early, see stores.actions.save_action
+    claimed_on = Column(Date(), primary_key=True, nullable=False, server_default=func.current_date())
+
+    __table_args__ = (
+        {'postgresql_partition_by': 'RANGE (claimed_on)'},
+    )
+
+
+class ExperimentVariantStats(Base):
+    ''' '''
+    __tablename__ = 'experiment_variant_stats'
+
+    experiment_id = Column(UUID(as_uuid=True), primary_key=True)
+    variant_id = Column(UUID(as_uuid=True), primary_key=True)
+    # start of the time bucket the actions were rolled up in
+    bucket = Column(DateTime(), primary_key=True)
+    successes = Column(BigInteger, nullable=False, server_default='0')
+    total = Column(BigInteger, nullable=False, server_default='0')
+
+
+class ExperimentVariantStatsOffset(Base):
+    ''' '''
+    __tablename__ = 'experiment_variant_stats_offset'
+
+    # last offset of each topic partition rolled up in experiment_variant_stats
+    topic = Column(String, primary_key=True)
+    partition = Column(Integer, primary_key=True)
+    last_offset = Column(BigInteger, nullable=False)
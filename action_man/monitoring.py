@@ -1,12 +1,25 @@
-from typing import Any
+from typing import Any, Dict, List, Optional
 
 from faust.sensors.monitor import Monitor
 from faust.sensors.statsd import StatsdMonitor
-from faust.types import StreamT, TP, Message
+from faust.types import CollectionT, EventT, ProducerT, StreamT, TP, Message
+from faust.types.tuples import PendingMessage, RecordMetadata
+
+from action_man import metrics
+
+
+def _metric_path(name: str, labels: metrics.Labels) -> str:
+    return '.'.join([name] + [value.replace('.', '_') for _, value in labels if value])
 
 
 class StatsdMon(StatsdMonitor):
-    ''' '''
+    '''Statsd monitor fed by the in process metrics registry.
+
+    Per message and per event hooks only update metrics.REGISTRY, its
+    counters and histograms are sent as one statsd pipeline by
+    `flush_metrics`, every METRICS_FLUSH_INTERVAL, so the monitor cost
+    doesn't grow with the message rate.
+    '''
     def __init__(
         self,
         host: str = 'localhost',
@@ -16,6 +29,8 @@ class StatsdMon(StatsdMonitor):
         **kwargs: Any
     ) -> None:
         super().__init__(host=host, port=port, prefix=f'{prefix}.faust', rate=rate, **kwargs)
+        self.registry = metrics.REGISTRY
+        self._flushed = metrics.snapshot(self.registry)
 
     def _stream_label(self, stream: StreamT) -> str:
         '''Enhance original _stream_label function
@@ -53,8 +68,184 @@ class StatsdMon(StatsdMonitor):
         '''
         super(Monitor, self).on_message_in(tp, offset, message)
 
+        # read offsets are kept for the consumer lag, see KafkaWorker.record_metrics
+        self.tp_read_offsets[tp] = offset
+
         topic = tp.topic.replace('.', '_')
-        self.client.incr('messages_received', rate=self.rate)
-        self.client.incr('messages_active', rate=self.rate)
-        self.client.incr(f'topic.{topic}.messages_received', rate=self.rate)
-        self.client.gauge(f'read_offset.{topic}.{tp.partition}', offset)
+        self.messages_active += 1
+        self.registry.incr('messages_received', topic=topic)
+        self.registry.gauge('read_offset', offset, topic=topic, partition=str(tp.partition))
+
+    def on_message_out(self, tp: TP, offset: int, message: Message) -> None:
+        '''Call when message is fully acknowledged and can be committed.
+
+        :param tp: TP:
+        :param offset: int:
+        :param message: Message:
+
+        '''
+        self.messages_active -= 1
+
+    def on_stream_event_in(self, tp: TP, offset: int, stream: StreamT, event: EventT) -> Optional[Dict]:
+        '''Call when stream starts processing an event.
+
+        :param tp: TP:
+        :param offset: int:
+        :param stream: StreamT:
+        :param event: EventT:
+
+        '''
+        self.events_active += 1
+        return {'time_in': self.time()}
+
+    def on_stream_event_out(
+        self, tp: TP, offset: int, stream: StreamT, event: EventT, state: Optional[Dict] = None
+    ) -> None:
+        '''Call when stream is done processing an event, the time spent is
+        observed per agent: streams run in the task of the agent consuming them.
+
+        :param tp: TP:
+        :param offset: int:
+        :param stream: StreamT:
+        :param event: EventT:
+        :param state: Optional[Dict]:  (Default value = None)
+
+        '''
+        if state is not None:
+            self.events_active -= 1
+            self.registry.observe('events.processing', self.time() - state['time_in'], agent=metrics.agent_label())
+
+    def on_send_initiated(
+        self, producer: ProducerT, topic: str, message: PendingMessage, keysize: int, valsize: int
+    ) -> Any:
+        '''Call when message added to producer buffer.
+
+        :param producer: ProducerT:
+        :param topic: str:
+        :param message: PendingMessage:
+        :param keysize: int:
+        :param valsize: int:
+
+        '''
+        topic = topic.replace('.', '_')
+        self.registry.incr('messages_sent', topic=topic)
+        return topic, self.time()
+
+    def on_send_completed(self, producer: ProducerT, state: Any, metadata: RecordMetadata) -> None:
+        '''Call when producer finished sending message.
+
+        :param producer: ProducerT:
+        :param state: Any: topic and send time
+        :param metadata: RecordMetadata:
+
+        '''
+        topic, start = state
+        self.registry.observe('kafka.send', self.time() - start, topic=topic)
+
+    def on_send_error(self, producer: ProducerT, exc: BaseException, state: Any) -> None:
+        '''Call when producer was unable to publish message.
+
+        :param producer: ProducerT:
+        :param exc: BaseException:
+        :param state: Any: topic and send time
+
+        '''
+        topic, _ = state
+        self.registry.incr('messages_sent_error', topic=topic)
+
+    def on_table_get(self, table: CollectionT, key: Any) -> None:
+        ''' '''
+        self.registry.incr('table.keys_retrieved', table=table.name)
+
+    def on_table_set(self, table: CollectionT, key: Any, value: Any) -> None:
+        ''' '''
+        self.registry.incr('table.keys_updated', table=table.name)
+
+    def on_table_del(self, table: CollectionT, key: Any) -> None:
+        ''' '''
+        self.registry.incr('table.keys_deleted', table=table.name)
+
+    def flush_metrics(self) -> None:
+        '''Send what the registry recorded since the last flush: counter
+        increments, current gauges and, per histogram, the count, average and
+        99th percentile of the new observations.
+        '''
+        counters, histograms = metrics.snapshot(self.registry)
+        flushed_counters, flushed_histograms = self._flushed
+        self._flushed = counters, histograms
+
+        with self.client.pipeline() as pipe:
+            pipe.gauge('messages_active', self.messages_active)
+            pipe.gauge('events_active', self.events_active)
+
+            for (name, labels), value in counters.items():
+                delta = value - flushed_counters.get((name, labels), 0)
+                if delta:
+                    pipe.incr(_metric_path(name, labels), delta)
+
+            for (name, labels), value in list(self.registry.gauges.items()):
+                pipe.gauge(_metric_path(name, labels), value)
+
+            for key, (counts, total, count) in histograms.items():
+                previous_counts, previous_total, previous_count = flushed_histograms.get(
+                    key, ([0] * len(counts), 0.0, 0)
+                )
+                if count == previous_count:
+                    continue
+
+                path = _metric_path(*key)
+                observed = count - previous_count
+                pipe.incr(f'{path}.count', observed)
+                pipe.timing(f'{path}.avg', (total - previous_total) / observed * 1000.0)
+                pipe.timing(
+                    f'{path}.p99',
+                    self.registry.histograms[key].quantile(
+                        0.99, [now - before for now, before in zip(counts, previous_counts)]
+                    ) * 1000.0
+                )
+
+    def on_counters_flush(self, commands: int, increments: int, latency: float) -> None:
+        '''Call after buffered cache increments are written to Redis.
+
+        :param commands: int: number of pipelined commands sent
+        :param increments: int: number of increments merged into them
+        :param latency: float: seconds spent flushing
+
+        '''
+        self.registry.observe('redis.counters_flush', latency)
+        self.registry.incr('cache.counters.flush_commands', commands)
+        self.registry.incr('cache.counters.flush_increments', increments)
+
+    def on_experiments_tick(self, recalculated: int, skipped: int) -> None:
+        '''Call after the experiments timer recalculated the experiments
+        of the partitions owned by this worker, counted so every worker adds up.
+
+        :param recalculated: int: experiments with new actions
+        :param skipped: int: idle experiments
+
+        '''
+        self.registry.incr('experiments.recalculated', recalculated)
+        self.registry.incr('experiments.skipped', skipped)
+
+    def on_probabilities_recalculated(self, recalculated: int, pending: int, staleness: List[float]) -> None:
+        '''Call after the debouncer recalculated the experiments that were due.
+
+        :param recalculated: int: experiments recalculated
+        :param pending: int: experiments with actions still waiting for their interval
+        :param staleness: List[float]: seconds the oldest action of every recalculated experiment waited
+
+        '''
+        self.registry.incr('probabilities.recalculated', recalculated)
+        self.registry.gauge('probabilities.pending', pending)
+        for seconds in staleness:
+            self.registry.observe('probabilities.staleness', seconds)
+
+    def on_lock_acquired(self, key: str, wait: float) -> None:
+        '''Call once a distributed lock is acquired.
+
+        :param key: str: locked key
+        :param wait: float: seconds spent waiting for the lock
+
+        '''
+        self.registry.observe('cache.lock.wait', wait)
+        self.registry.incr('cache.lock.acquired')
@@ -1,57 +1,70 @@
+import asyncio
 import logging
 import json
+from os import environ
+from typing import Any, List, Sequence
 
-from faust.agents import current_agent
-from faust.types import StreamT
-
-from action_man.algorithm import ab
-from action_man.entrypoint import kafka
+from action_man.algorithm import registry
+from action_man.algorithm.alias import AliasTable
 from action_man import cache
-from action_man import models
+from action_man import metrics
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+PROBABILITIES_BATCH_SIZE = int(environ.get('PROBABILITIES_BATCH_SIZE', 100))
+
 
-@kafka.agent()
-async def calculate_probabilities(stream: StreamT):
+async def calculate_batch(app: Any, experiment_ids: Sequence[str]) -> List[str]:
     """
-    Calculate probabilities
+    Score a batch of experiments in a single vectorized call per algorithm,
+    store and publish their probabilities, returns the keys written.
+    The alias table of the probabilities is stored along with them, and the
+    experiments actually rewritten are announced on PROBABILITIES_CHANNEL.
+
+    Variants and their counters come from the experiment registry in Redis,
+    so the cost is O(variants) and the action table is never queried.
 
-    :param stream: StreamT:
+    :param app: Any: KafkaWorker
+    :param experiment_ids: Sequence[str]:
 
     """
-    async for experiment_id in stream:
-        results = {}
-
-        db_pool = await current_agent().app.db_pool()
-        cache_pool = await current_agent().app.cache_pool()
-        redis_lock_manager = await current_agent().app.redis_lock_manager()
-        kafka_producer =current_agent().app.kafka_producer()
-
-        async with db_pool.acquire() as conn:
-            async with conn.transaction():
-                async for record in conn.cursor(
-                    f'SELECT DISTINCT variant_id FROM {models.Action.__tablename__} WHERE experiment_id = $1',
-                    experiment_id
-                ):
-                    variant_id = record.get('variant_id')
-                    with await cache_pool as conn:
-                        exp_successes = await conn.get(f'{experiment_id}_{variant_id}_successes')
-                        exp_total = await conn.get(f'{experiment_id}_{variant_id}_total')
-                        results[str(variant_id)] = int(exp_successes) if exp_successes is not None else 0
-                        results[f'{variant_id}_total'] = int(exp_total) if exp_total is not None else 0
-
-        calculation = {
-            str(variant): ab.calculate(results[variant], results[f'{variant}_total'])
-            for variant in results.keys() if not variant.endswith('_total')
-        }
-
-        calculation = json.dumps(calculation).encode('utf-8')
-
-        await cache.set_key_with_lock(f'{experiment_id}_probabilities', calculation, redis_lock_manager, cache_pool)
-
-        kafka_producer.send('recommendation.probability', value=calculation)
-
-        yield f'{experiment_id}_probabilities'
+    cache_pool = await app.cache_pool()
+    kafka_producer = app.kafka_producer()
+
+    # counters are read after this point, so a later version always holds fresher data
+    version = await cache.next_version(cache_pool)
+    experiments = list(dict.fromkeys(str(experiment_id) for experiment_id in experiment_ids))
+    with metrics.timer('redis.get_counters'):
+        counters = await asyncio.gather(*[
+            cache.get_counters(cache_pool, experiment_id) for experiment_id in experiments
+        ])
+        algorithms = await cache.get_algorithms(cache_pool, experiments)
+
+    with metrics.timer('algorithm.calculate'):
+        calculations = registry.calculate_batch(counters, algorithms)
+
+    keys = []
+    written = []
+    for experiment_id, calculation in zip(experiments, calculations):
+        # serving only maps the table, its cost is paid once per calculation here
+        allocation = AliasTable.from_weights(calculation).dumps()
+        payload = json.dumps(calculation).encode('utf-8')
+
+        # a lost race means a newer calculation was written, and published, already
+        with metrics.timer('redis.compare_and_set'):
+            if await cache.compare_and_set(
+                cache_pool, f'{experiment_id}_probabilities', payload, version,
+                companions={cache.allocation_key(experiment_id): allocation}
+            ):
+                written.append(experiment_id)
+
+        await kafka_producer.send('recommendation.probability', value=payload, key=experiment_id)
+
+        keys.append(f'{experiment_id}_probabilities')
+
+    with metrics.timer('redis.publish_probabilities'):
+        await cache.publish_probabilities(cache_pool, written)
+
+    return keys
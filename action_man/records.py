@@ -1,3 +1,5 @@
+from typing import Optional
+
 from faust import Record
 
 
@@ -14,3 +16,4 @@ class ExperimentInit(Record):
     ''' '''
     experiment_id: str
     variant_id: str
+    algorithm: Optional[str] = None
@@ -1,38 +1,73 @@
+from datetime import datetime
 import json
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, List, Optional, Sequence, Tuple
 import logging
+from os import environ
 
 import asyncpg
 from asyncpg import Record, Connection
 
 from action_man.stores.exceptions import StoreException
-from action_man.models import Action
+from action_man.models import Action, ActionId
 
 
-async def get_actions(conn: Connection, id: str = None, experiment_id: str = None, limit: int = 500) -> Any:
+ACTION_COLUMNS = ('id', 'experiment_id', 'variant_id', 'reward', 'context', 'last_modified')
+# days before today an id is deduplicated against, redeliveries older than
+# that are stored again
+DEDUP_DAYS = int(environ.get('ACTIONS_DEDUP_DAYS', 1))
+
+
+def _context_json(context: Any) -> str:
+    # records.Action carries the context as JSON text already, encoding it
+    # again would store a JSON string instead of the object
+    return context if isinstance(context, str) else json.dumps(context)
+
+
+async def get_actions(
+    conn: Connection,
+    id: Any = None,
+    experiment_id: Any = None,
+    variant_id: Any = None,
+    limit: int = 500,
+    after: Optional[Tuple[datetime, Any]] = None,
+    columns: Sequence[str] = ACTION_COLUMNS
+) -> Any:
     """
+    Actions ordered by (last_modified, id), `after` is the (last_modified, id)
+    keyset of the last row of the previous page.
 
     :param conn: Connection:
-    :param id: str:  (Default value = None)
-    :param experiment_id: str:  (Default value = None)
+    :param id: Any:  (Default value = None)
+    :param experiment_id: Any:  (Default value = None)
+    :param variant_id: Any:  (Default value = None)
     :param limit: int:  (Default value = 500)
+    :param after: Optional[Tuple[datetime, Any]]:  (Default value = None)
+    :param columns: Sequence[str]:  (Default value = ACTION_COLUMNS)
 
     """
-    _q = [f'SELECT * FROM {Action.__tablename__}']
+    _q = [f'SELECT {", ".join(columns)} FROM {Action.__tablename__}']
+    where: List[str] = []
+    q_args: List[Any] = []
+
+    for column, value in (('id', id), ('experiment_id', experiment_id), ('variant_id', variant_id)):
+        if value:
+            q_args.append(value)
+            where.append(f'{column} = ${len(q_args)}')
+
+    if after:
+        q_args.extend(after)
+        where.append(f'(last_modified, id) > (${len(q_args) - 1}, ${len(q_args)})')
 
-    if id:
-        _q.append(f'WHERE id = $1')
+    if where:
+        _q.append(f'WHERE {" AND ".join(where)}')
 
-    if experiment_id:
-        _q.append(f'WHERE experiment_id = $1' if not id else f'AND WHERE experiment_id = $2')
+    _q.append('ORDER BY last_modified, id')
 
     if limit > 0:
         _q.append(f'LIMIT {limit}')
 
     query = ' '.join(_q)
 
-    q_args = [arg for arg in [id, experiment_id] if arg]
-
     async with conn.transaction():
         try:
             return await conn.fetch(query, *q_args)
@@ -41,20 +76,133 @@ async def get_actions(conn: Connection, id: str = None, experiment_id: str = Non
             raise StoreException from exc
 
 
-async def save_action(conn: Connection, action: Dict) -> Any:
+async def iter_actions(
+    conn: Connection,
+    experiment_id: Any = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    columns: Sequence[str] = ACTION_COLUMNS,
+    prefetch: int = 1000
+) -> AsyncIterator[Record]:
+    """
+    Stream actions through a server side cursor, only `prefetch` rows
+    are held in memory at any time.
+
+    :param conn: Connection:
+    :param experiment_id: Any:  (Default value = None)
+    :param since: Optional[datetime]: inclusive lower bound on last_modified  (Default value = None)
+    :param until: Optional[datetime]: exclusive upper bound on last_modified  (Default value = None)
+    :param columns: Sequence[str]:  (Default value = ACTION_COLUMNS)
+    :param prefetch: int:  (Default value = 1000)
+
+    """
+    _q = [f'SELECT {", ".join(columns)} FROM {Action.__tablename__}']
+    where: List[str] = []
+    q_args: List[Any] = []
+
+    for condition, value in (('experiment_id =', experiment_id), ('last_modified >=', since), ('last_modified <', until)):
+        if value:
+            q_args.append(value)
+            where.append(f'{condition} ${len(q_args)}')
+
+    if where:
+        _q.append(f'WHERE {" AND ".join(where)}')
+
+    query = ' '.join(_q)
+
+    async with conn.transaction():
+        try:
+            async for record in conn.cursor(query, *q_args, prefetch=prefetch):
+                yield record
+        except asyncpg.exceptions.PostgresError as exc:
+            logging.exception('Store error')
+            raise StoreException from exc
+
+
+async def save_action(
+    conn: Connection, action: Dict, table: str = Action.__tablename__, ids_table: str = ActionId.__tablename__
+) -> Any:
     """
+    Insert an action unless its id was stored in the last DEDUP_DAYS days,
+    ids are claimed in `ids_table` first so concurrent writers of the same id
+    can't both insert it. Claims are partitioned by day and only the recent
+    partitions are looked up, so the table stays as small as the window.
 
     :param conn: Connection:
     :param action: Dict:
+    :param table: str:  (Default value = Action.__tablename__)
+    :param ids_table: str:  (Default value = ActionId.__tablename__)
 
     """
     async with conn.transaction():
         try:
             await conn.execute(
-                f'INSERT INTO {Action.__tablename__} (id, experiment_id, variant_id, reward, context) VALUES ($1, $2, $3, $4, $5) ON CONFLICT (id) DO NOTHING',
-                action['id'], action['experiment_id'], action['variant_id'], int(action['reward']), json.dumps(action['context'])
+                f'WITH claimed AS ('
+                f'INSERT INTO {ids_table} (id) SELECT $1::uuid WHERE NOT EXISTS ('
+                f'SELECT 1 FROM {ids_table} WHERE id = $1::uuid AND claimed_on >= current_date - {DEDUP_DAYS}) '
+                f'ON CONFLICT DO NOTHING RETURNING id) '
+                f'INSERT INTO {table} (id, experiment_id, variant_id, reward, context) '
+                f'SELECT id, $2::uuid, $3::uuid, $4::integer, $5::jsonb FROM claimed',
+                action['id'], action['experiment_id'], action['variant_id'],
+                int(action['reward']), _context_json(action['context'])
             )
             return action['id']
         except (asyncpg.exceptions.PostgresError, asyncpg.exceptions.DataError) as exc:
             logging.exception('Store error')
             raise StoreException from exc
+
+
+async def save_actions_bulk(
+    conn: Connection,
+    actions: Sequence[Dict],
+    table: str = Action.__tablename__,
+    ids_table: str = ActionId.__tablename__
+) -> List[Any]:
+    """
+    Persist a batch of actions in a single round trip: rows are COPY-ed into a
+    per-session staging table and then merged into the action table, skipping
+    ids claimed in `ids_table` in the last DEDUP_DAYS days, see save_action.
+
+    :param conn: Connection:
+    :param actions: Sequence[Dict]:
+    :param table: str:  (Default value = Action.__tablename__)
+    :param ids_table: str:  (Default value = ActionId.__tablename__)
+
+    """
+    if not actions:
+        return []
+
+    staging = f'{table}_staging'
+    columns = ['id', 'experiment_id', 'variant_id', 'reward', 'context']
+
+    async with conn.transaction():
+        try:
+            await conn.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {staging} '
+                f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+            )
+            await conn.copy_records_to_table(
+                staging,
+                records=[
+                    (
+                        action['id'], action['experiment_id'], action['variant_id'],
+                        int(action['reward']), _context_json(action['context'])
+                    )
+                    for action in actions
+                ],
+                columns=columns
+            )
+            # ids are claimed in order, so that overlapping batches can't deadlock
+            await conn.execute(
+                f'WITH claimed AS ('
+                f'INSERT INTO {ids_table} (id) SELECT DISTINCT id FROM {staging} staged WHERE NOT EXISTS ('
+                f'SELECT 1 FROM {ids_table} ids WHERE ids.id = staged.id AND claimed_on >= current_date - {DEDUP_DAYS}) '
+                f'ORDER BY id ON CONFLICT DO NOTHING RETURNING id) '
+                f'INSERT INTO {table} ({", ".join(columns)}) '
+                f'SELECT DISTINCT ON (id) {", ".join(columns)} FROM {staging} JOIN claimed USING (id)'
+            )
+            return [action['id'] for action in actions]
+        except (asyncpg.exceptions.PostgresError, asyncpg.exceptions.DataError, ValueError) as exc:
+            # binary COPY surfaces client side encoding errors as plain ValueError
+            logging.exception('Store error')
+            raise StoreException from exc
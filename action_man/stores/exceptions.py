@@ -1,3 +1,33 @@
+import asyncio
+
+import asyncpg
+
+
 class StoreException(Exception):
     ''' '''
     pass
+
+
+# failures a retry can get past: lost or refused connections, serialization
+# failures and deadlocks, anything else fails again on the same rows
+TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.InterfaceError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.TransactionRollbackError,
+    asyncpg.exceptions.OperatorInterventionError,
+    asyncpg.exceptions.TooManyConnectionsError,
+)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Whether retrying what raised `exc` may succeed, StoreException are
+    judged by the driver error they wrap
+
+    :param exc: BaseException:
+    """
+    if isinstance(exc, StoreException):
+        exc = exc.__cause__ or exc
+    return isinstance(exc, TRANSIENT_ERRORS)
@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+import logging
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+import asyncpg
+from asyncpg import Connection
+
+from action_man.stores.exceptions import StoreException
+from action_man.models import Action, ActionId
+from action_man.stores.actions import DEDUP_DAYS
+
+
+_BOUND = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+
+class Partition(NamedTuple):
+    ''' '''
+    name: str
+    # None stands for MINVALUE/MAXVALUE, both are None for the default partition
+    lower: Optional[datetime]
+    upper: Optional[datetime]
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    return None if value in ('MINVALUE', 'MAXVALUE') else datetime.fromisoformat(value.strip("'"))
+
+
+def partition_start(day: datetime, days: int) -> datetime:
+    """
+    Start of the `days` long partition `day` falls in, weekly partitions start on Monday
+
+    :param day: datetime:
+    :param days: int:
+
+    """
+    day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=(day.toordinal() - 1) % days)
+
+
+async def get_partitions(conn: Connection, table: str = Action.__tablename__) -> List[Partition]:
+    """
+
+    :param conn: Connection:
+    :param table: str:  (Default value = Action.__tablename__)
+
+    """
+    try:
+        records = await conn.fetch(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = $1::regclass ORDER BY c.relname',
+            table
+        )
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+    partitions = []
+    for record in records:
+        bound = _BOUND.search(record['bound'])
+        partitions.append(
+            Partition(record['relname'], _parse_bound(bound.group(1)), _parse_bound(bound.group(2)))
+            if bound else Partition(record['relname'], None, None)
+        )
+
+    return partitions
+
+
+async def create_partition(
+    conn: Connection, start: datetime, end: datetime, table: str = Action.__tablename__
+) -> str:
+    """
+    Create the [start, end) range partition, named after its start day
+
+    :param conn: Connection:
+    :param start: datetime:
+    :param end: datetime:
+    :param table: str:  (Default value = Action.__tablename__)
+
+    """
+    name = f'{table}_p{start:%Y%m%d}'
+
+    try:
+        await conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+    return name
+
+
+async def drop_partition(conn: Connection, name: str) -> None:
+    """
+    Drop a partition with its rows, far cheaper than deleting them
+
+    :param conn: Connection:
+    :param name: str:
+
+    """
+    try:
+        await conn.execute(f'DROP TABLE IF EXISTS {name}')
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+
+async def extend_partitions(conn: Connection, now: datetime, days: int, ahead: int, table: str) -> List[str]:
+    """
+    Create the partitions of `table` covering the next `ahead` periods of
+    `days` days, appending to the latest existing one. Returns the created ones.
+
+    :param conn: Connection:
+    :param now: datetime:
+    :param days: int:
+    :param ahead: int:
+    :param table: str:
+
+    """
+    partitions = await get_partitions(conn, table)
+
+    current = partition_start(now, days)
+    start = max([current] + [partition.upper for partition in partitions if partition.upper])
+    horizon = current + timedelta(days=days * (ahead + 1))
+
+    created = []
+    while start < horizon:
+        end = partition_start(start, days) + timedelta(days=days)
+        try:
+            created.append(await create_partition(conn, start, end, table))
+        except StoreException:
+            # rows of this range already sit in the default partition, they stay there
+            logging.warning(f'Skipping {table} partition from {start} to {end}')
+        start = end
+
+    return created
+
+
+async def drop_partitions_before(conn: Connection, cutoff: datetime, table: str) -> List[str]:
+    """
+    Drop the partitions of `table` entirely older than `cutoff`, returns them
+
+    :param conn: Connection:
+    :param cutoff: datetime:
+    :param table: str:
+
+    """
+    dropped = []
+    for partition in await get_partitions(conn, table):
+        if partition.upper and partition.upper <= cutoff:
+            await drop_partition(conn, partition.name)
+            dropped.append(partition.name)
+
+    return dropped
+
+
+async def maintain_partitions(
+    conn: Connection,
+    now: datetime,
+    days: int = 1,
+    ahead: int = 3,
+    retention: int = 0,
+    table: str = Action.__tablename__,
+    ids_table: Optional[str] = ActionId.__tablename__
+) -> Tuple[List[str], List[str]]:
+    """
+    Create the partitions covering the next `ahead` periods of `days` days,
+    appending to the latest existing one, and drop the partitions entirely
+    older than `retention` days. Returns the created and dropped partitions.
+
+    `ids_table` gets the same partitions, but only keeps the ones save_action
+    still looks ids up in, the last DEDUP_DAYS days, whatever the retention.
+
+    :param conn: Connection:
+    :param now: datetime:
+    :param days: int:  (Default value = 1)
+    :param ahead: int:  (Default value = 3)
+    :param retention: int: days of actions to keep, 0 keeps them all  (Default value = 0)
+    :param table: str:  (Default value = Action.__tablename__)
+    :param ids_table: Optional[str]: ids claimed by save_action  (Default value = ActionId.__tablename__)
+
+    """
+    created = await extend_partitions(conn, now, days, ahead, table)
+    if ids_table:
+        created += await extend_partitions(conn, now, days, ahead, ids_table)
+
+    dropped = []
+    if retention > 0:
+        dropped += await drop_partitions_before(conn, now - timedelta(days=retention), table)
+    if ids_table:
+        # a day of margin over the window, claims are dated by the database clock
+        cutoff = partition_start(now, 1) - timedelta(days=DEDUP_DAYS + 1)
+        dropped += await drop_partitions_before(conn, cutoff, ids_table)
+
+    return created, dropped
@@ -0,0 +1,194 @@
+from datetime import datetime
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+from asyncpg import Record, Connection
+
+from action_man.stores.exceptions import StoreException
+from action_man.models import Action, ExperimentVariantStats, ExperimentVariantStatsOffset
+
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# tables counters can be rebuilt from, with their successes and total aggregates
+TOTALS_SOURCES = {
+    'stats': (ExperimentVariantStats.__tablename__, 'sum(successes)', 'sum(total)'),
+    'actions': (Action.__tablename__, 'sum(reward)', 'count(*)'),
+}
+
+
+async def lock_stats_offsets(conn: Connection, tps: Iterable[Tuple[str, int]]) -> Dict[Tuple[str, int], int]:
+    """
+    Last offset rolled up per (topic, partition), -1 for partitions never rolled up.
+    Rows are locked until the transaction ends, run it in the one saving the stats.
+
+    :param conn: Connection:
+    :param tps: Iterable[Tuple[str, int]]:
+
+    """
+    # rows are locked in order, so that overlapping batches can't deadlock
+    tps = sorted(tps)
+    topics, partitions = [topic for topic, _ in tps], [partition for _, partition in tps]
+    table = ExperimentVariantStatsOffset.__tablename__
+
+    try:
+        await conn.execute(
+            f'INSERT INTO {table} (topic, partition, last_offset) '
+            f'SELECT topic, partition, -1 FROM unnest($1::text[], $2::integer[]) AS tp (topic, partition) '
+            f'ON CONFLICT DO NOTHING',
+            topics, partitions
+        )
+        records = await conn.fetch(
+            f'SELECT topic, partition, last_offset FROM {table} '
+            f'WHERE (topic, partition) IN (SELECT * FROM unnest($1::text[], $2::integer[])) '
+            f'ORDER BY topic, partition FOR UPDATE',
+            topics, partitions
+        )
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+    return {(record['topic'], record['partition']): record['last_offset'] for record in records}
+
+
+async def save_stats(
+    conn: Connection,
+    stats: Dict[Tuple[Any, Any, datetime], Tuple[int, int]],
+    offsets: Optional[Dict[Tuple[str, int], int]] = None
+) -> int:
+    """
+    Add rolled up (successes, total) counts, keyed by (experiment_id, variant_id, bucket),
+    to the stored ones in a single upsert. Returns the number of rows written.
+
+    :param conn: Connection:
+    :param stats: Dict[Tuple[Any, Any, datetime], Tuple[int, int]]:
+    :param offsets: Optional[Dict[Tuple[str, int], int]]: last offset per (topic, partition) the
+        stats cover, stored in the same transaction, see lock_stats_offsets  (Default value = None)
+
+    """
+    if not stats and not offsets:
+        return 0
+
+    table = ExperimentVariantStats.__tablename__
+
+    try:
+        async with conn.transaction():
+            if stats:
+                experiments, variants, buckets = zip(*stats.keys())
+                successes, totals = zip(*stats.values())
+                await conn.execute(
+                    f'INSERT INTO {table} AS stats (experiment_id, variant_id, bucket, successes, total) '
+                    f'SELECT * FROM unnest($1::uuid[], $2::uuid[], $3::timestamp[], $4::bigint[], $5::bigint[]) '
+                    f'ON CONFLICT (experiment_id, variant_id, bucket) DO UPDATE SET '
+                    f'successes = stats.successes + EXCLUDED.successes, total = stats.total + EXCLUDED.total',
+                    experiments, variants, buckets, successes, totals
+                )
+            if offsets:
+                tps = sorted(offsets)
+                await conn.execute(
+                    f'INSERT INTO {ExperimentVariantStatsOffset.__tablename__} AS offsets (topic, partition, last_offset) '
+                    f'SELECT * FROM unnest($1::text[], $2::integer[], $3::bigint[]) '
+                    f'ON CONFLICT (topic, partition) DO UPDATE SET '
+                    f'last_offset = greatest(offsets.last_offset, EXCLUDED.last_offset)',
+                    [topic for topic, _ in tps], [partition for _, partition in tps], [offsets[tp] for tp in tps]
+                )
+    except (asyncpg.exceptions.PostgresError, asyncpg.exceptions.DataError) as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+    return len(stats)
+
+
+async def get_stats(
+    conn: Connection,
+    experiment_id: Any,
+    variant_id: Any = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = 'hour'
+) -> List[Record]:
+    """
+    Successes and totals of an experiment per variant and time bucket,
+    hourly buckets are merged into coarser ones by `granularity`.
+
+    :param conn: Connection:
+    :param experiment_id: Any:
+    :param variant_id: Any:  (Default value = None)
+    :param since: Optional[datetime]: inclusive lower bound on the bucket  (Default value = None)
+    :param until: Optional[datetime]: exclusive upper bound on the bucket  (Default value = None)
+    :param granularity: str: one of GRANULARITIES  (Default value = 'hour')
+
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity}')
+
+    q_args: List[Any] = [granularity, experiment_id]
+    where = ['experiment_id = $2']
+
+    for condition, value in (('variant_id =', variant_id), ('bucket >=', since), ('bucket <', until)):
+        if value:
+            q_args.append(value)
+            where.append(f'{condition} ${len(q_args)}')
+
+    try:
+        rows: List[Record] = await conn.fetch(
+            f'SELECT variant_id, date_trunc($1, bucket) AS bucket, '
+            f'sum(successes)::bigint AS successes, sum(total)::bigint AS total '
+            f'FROM {ExperimentVariantStats.__tablename__} WHERE {" AND ".join(where)} '
+            f'GROUP BY 1, 2 ORDER BY 2, 1',
+            *q_args
+        )
+        return rows
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+
+async def get_variant_totals(
+    conn: Connection, after: Any = None, limit: int = 1000, source: str = 'stats'
+) -> List[Record]:
+    """
+    Lifetime successes and totals per variant of the first `limit` experiments,
+    ordered by id, following `after`. Reads the rollup table by default,
+    `source='actions'` aggregates the raw actions instead.
+
+    :param conn: Connection:
+    :param after: Any: experiment id the previous page ended with  (Default value = None)
+    :param limit: int:  (Default value = 1000)
+    :param source: str: one of TOTALS_SOURCES  (Default value = 'stats')
+
+    """
+    table, successes, total = TOTALS_SOURCES[source]
+
+    try:
+        totals: List[Record] = await conn.fetch(
+            f'WITH experiments AS ('
+            f'SELECT DISTINCT experiment_id FROM {table} '
+            f'WHERE experiment_id IS NOT NULL AND ($1::uuid IS NULL OR experiment_id > $1::uuid) '
+            f'ORDER BY experiment_id LIMIT $2) '
+            f'SELECT experiment_id, variant_id, {successes}::bigint AS successes, {total}::bigint AS total '
+            f'FROM {table} JOIN experiments USING (experiment_id) GROUP BY 1, 2 ORDER BY 1, 2',
+            after, limit
+        )
+        return totals
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
+
+
+async def count_actions(conn: Connection, source: str = 'stats') -> int:
+    """
+
+    :param conn: Connection:
+    :param source: str: one of TOTALS_SOURCES  (Default value = 'stats')
+
+    """
+    table, _, total = TOTALS_SOURCES[source]
+
+    try:
+        count: int = await conn.fetchval(f'SELECT coalesce({total}, 0)::bigint FROM {table}')
+        return count
+    except asyncpg.exceptions.PostgresError as exc:
+        logging.exception('Store error')
+        raise StoreException from exc
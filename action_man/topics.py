@@ -1,5 +1,35 @@
+from typing import AsyncIterator
+
+from faust.types import StreamT
+
 from action_man.entrypoint import kafka
 from action_man.records import Action
+from action_man.serializers import ACTIONS_SERIALIZER
+
+
+actions_topic = kafka.topic('actions', value_type=Action, value_serializer=ACTIONS_SERIALIZER)
+# unkeyed actions, from producers predating the experiment_id key, are moved
+# here keyed by experiment; it has as many partitions as actions so both
+# place an experiment on the same partition number
+actions_repartition_topic = kafka.topic('actions-repartition', value_type=Action, value_serializer=ACTIONS_SERIALIZER)
+keyed_actions_topic = kafka.topic(
+    'actions', 'actions-repartition', value_type=Action, value_serializer=ACTIONS_SERIALIZER
+)
+
+
+async def owned_actions(actions: StreamT) -> AsyncIterator[Action]:
+    """
+    Yield the actions of a keyed_actions_topic stream on the partition owning
+    their experiment. Actions from `actions` not keyed by experiment_id are
+    forwarded to actions-repartition and come back through it on the right
+    partition, keyed ones skip the extra hop.
 
+    :param actions: StreamT:
+    """
+    async for action in actions:
+        event = actions.current_event
+        if event is not None and event.message.topic == actions_topic.get_topic_name() and event.key != str(action.experiment_id).encode():
+            await actions_repartition_topic.send(key=str(action.experiment_id), value=action)
+            continue
 
-actions_topic = kafka.topic('actions', value_type=Action)
+        yield action
@@ -1,5 +1,7 @@
+from asyncio import AbstractEventLoop
 import logging
 from os import environ
+from time import perf_counter
 
 from sanic import Sanic
 from sanic.response import json, HTTPResponse
@@ -8,8 +10,12 @@ from sanic.request import Request
 from action_man import cache
 from action_man import db
 from action_man import kafka
+from action_man import metrics
 from action_man.api.actions import actions_bp
 from action_man.api.demo import demo_bp
+from action_man.api.experiments import experiments_bp
+from action_man.api.metrics import metrics_bp
+from action_man.api.probabilities import ProbabilitiesCache
 from action_man.stores.exceptions import StoreException
 
 
@@ -22,37 +28,63 @@ def init_web() -> Sanic:
     ''' '''
     app = Sanic('action_man')
 
-    async def setup_kafka_producer(app: Sanic, loop):
+    async def setup_kafka_producer(app: Sanic, loop: AbstractEventLoop) -> None:
         brokers = environ.get('KAFKA_CNX_STRING', 'kafka:9092')
         logger.warning(f'app.kafka initialization...{brokers}')
-        app.kafka = kafka.get_kafka_producer(brokers)
+        app.kafka = kafka.get_kafka_producer(brokers, loop)
+        await app.kafka.start()
         logger.warning('app.kafka initialized')
 
-    async def setup_db(app: Sanic, loop):
+    async def stop_kafka_producer(app: Sanic, loop: AbstractEventLoop) -> None:
+        await app.kafka.stop()
+
+    async def setup_db(app: Sanic, loop: AbstractEventLoop) -> None:
         logger.warning('app.db_pool initialization...')
         app.db_pool = await db.db_pool()
         logger.warning('app.db_pool initialized')
 
-    async def setup_cache(app: Sanic, loop):
+    async def setup_cache(app: Sanic, loop: AbstractEventLoop) -> None:
         logger.warning('app.cache_pool initialization...')
         app.cache_pool = await cache.cache_pool()
         logger.warning('app.cache_pool initialized')
 
-    async def stop_cache(app: Sanic, loop):
+    async def setup_probabilities(app: Sanic, loop: AbstractEventLoop) -> None:
+        app.probabilities = ProbabilitiesCache(app.cache_pool)
+        app.probabilities_listener = loop.create_task(app.probabilities.listen())
+
+    async def stop_probabilities(app: Sanic, loop: AbstractEventLoop) -> None:
+        app.probabilities_listener.cancel()
+
+    async def stop_cache(app: Sanic, loop: AbstractEventLoop) -> None:
         app.cache_pool.close()
         await app.cache_pool.wait_closed()
 
+    async def start_request_timer(request: Request) -> None:
+        request.ctx.start = perf_counter()
+
+    async def observe_request(request: Request, response: HTTPResponse) -> None:
+        metrics.incr('http.requests', status=str(response.status))
+        metrics.observe('http.request', perf_counter() - request.ctx.start)
+
     async def server_error_handler(request: Request, exception: Exception) -> HTTPResponse:
         return json({'message': "Oops, server error", }, status=500)
 
     app.error_handler.add(StoreException, server_error_handler)
 
+    app.register_middleware(start_request_timer, 'request')
+    app.register_middleware(observe_request, 'response')
+
     app.register_listener(setup_cache, 'before_server_start')
+    app.register_listener(setup_probabilities, 'before_server_start')
     app.register_listener(setup_db, 'before_server_start')
     app.register_listener(setup_kafka_producer, 'before_server_start')
+    app.register_listener(stop_kafka_producer, 'before_server_stop')
+    app.register_listener(stop_probabilities, 'before_server_stop')
     app.register_listener(stop_cache, 'after_server_stop')
 
     app.blueprint(actions_bp)
     app.blueprint(demo_bp)
+    app.blueprint(experiments_bp)
+    app.blueprint(metrics_bp)
 
     return app
@@ -0,0 +1,53 @@
+'''
+Per variant `ab.calculate` loop, as calculate_probabilities used to run it,
+against the vectorized `ab.probability_of_best` scoring every experiment at once.
+
+    python -m benchmarks.ab --experiments 1000 --variants 3
+'''
+import argparse
+from functools import partial
+from random import randint
+from time import perf_counter
+
+from action_man.algorithm import ab
+from action_man.algorithm import registry
+
+
+def main(experiments: int, variants: int, draws: int) -> None:
+    batch = []
+    for _ in range(experiments):
+        counters = {}
+        for variant in range(variants):
+            total = randint(0, 10000)
+            counters[str(variant)] = (randint(0, total), total)
+        batch.append(counters)
+
+    start = perf_counter()
+    for counters in batch:
+        {variant: ab.calculate(successes, total) for variant, (successes, total) in counters.items()}
+    loop = perf_counter() - start
+
+    registry.ALGORITHMS['thompson_1'] = partial(ab.probability_of_best, draws=1)
+    registry.ALGORITHMS['thompson_n'] = partial(ab.probability_of_best, draws=draws)
+
+    start = perf_counter()
+    registry.calculate_batch(batch, ['thompson_1'] * experiments)
+    single = perf_counter() - start
+
+    start = perf_counter()
+    registry.calculate_batch(batch, ['thompson_n'] * experiments)
+    vectorized = perf_counter() - start
+
+    print(f'{"per variant loop, 1 draw":<32} {loop * 1000:>10.2f} ms')
+    print(f'{"vectorized, 1 draw":<32} {single * 1000:>10.2f} ms')
+    print(f'{f"vectorized, {draws} draws":<32} {vectorized * 1000:>10.2f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--experiments', type=int, default=1000)
+    parser.add_argument('--variants', type=int, default=3)
+    parser.add_argument('--draws', type=int, default=ab.DRAWS)
+    args = parser.parse_args()
+
+    main(args.experiments, args.variants, args.draws)
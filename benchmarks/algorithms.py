@@ -0,0 +1,40 @@
+'''
+CPU time per 1k experiments for every registered algorithm.
+
+    python -m benchmarks.algorithms --experiments 1000 --variants 2
+'''
+import argparse
+from random import randint
+from time import process_time
+
+from action_man.algorithm import registry
+
+
+def main(experiments: int, variants: int, rounds: int) -> None:
+    batch = []
+    for _ in range(experiments):
+        counters = {}
+        for variant in range(variants):
+            total = randint(0, 10000)
+            counters[str(variant)] = (randint(0, total // 10), total)
+        batch.append(counters)
+
+    print(f'{"algorithm":<16} {"CPU ms / 1k experiments":>24}')
+
+    for name in registry.ALGORITHMS:
+        start = process_time()
+        for _ in range(rounds):
+            registry.calculate_batch(batch, [name] * experiments)
+        elapsed = (process_time() - start) / rounds
+
+        print(f'{name:<16} {elapsed * 1000 * 1000 / experiments:>24.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--experiments', type=int, default=1000)
+    parser.add_argument('--variants', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.experiments, args.variants, args.rounds)
@@ -0,0 +1,67 @@
+'''
+Cost of picking a variant in the web app: a Thompson draw from every Beta
+posterior against a draw from the alias table the workers publish, plus the
+one off cost of building and decoding that table, at 1, 10 and 100 variants:
+
+    python -m benchmarks.assignment --assignments 100000
+    python -m benchmarks.assignment --variants 2 5 1000
+'''
+import argparse
+from random import randint
+from time import perf_counter
+from uuid import uuid4
+
+from action_man.algorithm import registry
+from action_man.algorithm.alias import AliasTable
+from action_man.assignment import sticky_choice, thompson_choice
+
+
+def main(assignments: int, variants: int) -> None:
+    counters = {}
+    for _ in range(variants):
+        total = randint(0, 10000)
+        counters[str(uuid4())] = (randint(0, total), total)
+    probabilities = registry.calculate_batch([counters])[0]
+    experiment_id = str(uuid4())
+
+    start = perf_counter()
+    for _ in range(assignments):
+        thompson_choice(counters)
+    thompson = perf_counter() - start
+
+    start = perf_counter()
+    for _ in range(1000):
+        payload = AliasTable.from_weights(probabilities).dumps()
+    build = (perf_counter() - start) / 1000
+
+    start = perf_counter()
+    for _ in range(1000):
+        table = AliasTable.loads(payload)
+    load = (perf_counter() - start) / 1000
+
+    start = perf_counter()
+    for _ in range(assignments):
+        table.sample()
+    alias = perf_counter() - start
+
+    start = perf_counter()
+    for i in range(assignments):
+        sticky_choice(str(i), experiment_id, probabilities)
+    sticky = perf_counter() - start
+
+    print(f'{variants} variants, {len(payload)} bytes table')
+    print(f'  {"thompson draw":<16} {thompson / assignments * 1e6:>10.2f} us/assignment')
+    print(f'  {"alias table":<16} {alias / assignments * 1e6:>10.2f} us/assignment')
+    print(f'  {"sticky":<16} {sticky / assignments * 1e6:>10.2f} us/assignment')
+    print(f'  {"table build":<16} {build * 1e6:>10.2f} us')
+    print(f'  {"table load":<16} {load * 1e6:>10.2f} us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assignments', type=int, default=100000)
+    parser.add_argument('--variants', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    for variants in args.variants:
+        main(args.assignments, variants)
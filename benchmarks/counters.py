@@ -0,0 +1,65 @@
+'''
+Read latency of an experiment state as its variant count grows,
+flat `{experiment}_{variant}_successes/_total` keys (2 x N GETs) against
+the per experiment counters hash (1 HGETALL).
+
+    REDIS_CNX_STRING=redis://... python -m benchmarks.counters --reads 200
+'''
+import argparse
+import asyncio
+from time import perf_counter
+from uuid import uuid4
+
+from action_man import cache
+
+
+VARIANTS = [2, 8, 32, 128, 512]
+
+
+async def main(reads: int) -> None:
+    pool = await cache.cache_pool()
+
+    print(f'{"variants":>8} {"flat GETs (ms)":>16} {"HGETALL (ms)":>14}')
+
+    for size in VARIANTS:
+        experiment_id = uuid4()
+        variants = [uuid4() for _ in range(size)]
+
+        with await pool as conn:
+            for variant_id in variants:
+                await conn.set(f'{experiment_id}_{variant_id}_successes', 5)
+                await conn.set(f'{experiment_id}_{variant_id}_total', 10)
+                await conn.hset(cache.counters_key(experiment_id), f'{variant_id}_successes', 5)
+                await conn.hset(cache.counters_key(experiment_id), f'{variant_id}_total', 10)
+
+        start = perf_counter()
+        for _ in range(reads):
+            with await pool as conn:
+                for variant_id in variants:
+                    await conn.get(f'{experiment_id}_{variant_id}_successes')
+                    await conn.get(f'{experiment_id}_{variant_id}_total')
+        flat = (perf_counter() - start) / reads
+
+        start = perf_counter()
+        for _ in range(reads):
+            await cache.get_counters(pool, experiment_id)
+        hashed = (perf_counter() - start) / reads
+
+        with await pool as conn:
+            await conn.delete(cache.counters_key(experiment_id), *[
+                f'{experiment_id}_{variant_id}_{counter}'
+                for variant_id in variants for counter in ('successes', 'total')
+            ])
+
+        print(f'{size:>8} {flat * 1000:>16.3f} {hashed * 1000:>14.3f}')
+
+    pool.close()
+    await pool.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reads', type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.reads))
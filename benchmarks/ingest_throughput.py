@@ -0,0 +1,85 @@
+'''
+End to end ingest throughput: publishes actions for fresh experiments to the
+`actions` topic, keyed by experiment, and waits until the Redis counters
+account for all of them.
+
+Run it once against workers started with COUNTERS_BACKEND=redis and once with
+COUNTERS_BACKEND=table to compare both counter paths:
+
+    KAFKA_CNX_STRING=localhost:9092 REDIS_CNX_STRING=redis://... python -m benchmarks.ingest_throughput --actions 100000
+'''
+import argparse
+import asyncio
+from os import environ
+from random import randint
+from time import perf_counter
+from typing import Tuple
+from uuid import uuid4
+
+from action_man import cache
+from action_man import kafka
+from action_man.serializers import dumps_action
+
+
+async def run(actions: int, experiments: int, variants: int, timeout: float) -> Tuple[float, int, float]:
+    """ Returns the publish rate, the actions counted and the seconds it took to count them """
+    loop = asyncio.get_event_loop()
+    producer = kafka.get_kafka_producer(environ.get('KAFKA_CNX_STRING', 'kafka:9092'), loop)
+    cache_pool = await cache.cache_pool()
+    await producer.start()
+
+    experiment_ids = [str(uuid4()) for _ in range(experiments)]
+    variant_ids = [str(uuid4()) for _ in range(variants)]
+
+    start = perf_counter()
+    deliveries = []
+    for i in range(actions):
+        experiment_id = experiment_ids[i % experiments]
+        deliveries.append(
+            await producer.send(
+                'actions',
+                value=dumps_action(
+                    {
+                        'id': str(uuid4()),
+                        'experiment_id': experiment_id,
+                        'variant_id': variant_ids[i % variants],
+                        'reward': randint(0, 1),
+                        'context': '{}'
+                    }
+                ),
+                key=experiment_id
+            )
+        )
+    await asyncio.gather(*deliveries)
+    published = perf_counter() - start
+
+    counted = 0
+    while counted < actions and perf_counter() - start < timeout:
+        await asyncio.sleep(0.1)
+        counters = await asyncio.gather(*[cache.get_counters(cache_pool, experiment_id) for experiment_id in experiment_ids])
+        counted = sum(total for experiment in counters for _, total in experiment.values())
+    elapsed = perf_counter() - start
+
+    await producer.stop()
+    cache_pool.close()
+    await cache_pool.wait_closed()
+
+    return actions / published, counted, elapsed
+
+
+async def main(actions: int, experiments: int, variants: int, timeout: float) -> None:
+    publish_rate, counted, elapsed = await run(actions, experiments, variants, timeout)
+
+    print(f'published {actions} actions at {publish_rate:.0f} actions/sec')
+    print(f'counted   {counted} actions at {counted / elapsed:.0f} actions/sec end to end ({elapsed:.2f}s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--actions', type=int, default=100000)
+    parser.add_argument('--experiments', type=int, default=1)
+    parser.add_argument('--variants', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.actions, args.experiments, args.variants, args.timeout))
@@ -0,0 +1,212 @@
+'''
+Insert throughput and experiment query latency of the single heap action table
+against the daily partitioned one, plus the cost of enforcing retention on each.
+Inserts deduplicate ids the way the app does for each layout: ON CONFLICT (id)
+on the heap, the action_id claims of stores.actions on the partitioned table,
+whose id partitions only hold the last ACTIONS_DEDUP_DAYS days.
+
+Both layouts are built as scratch tables next to `action`, rows are spread over
+`--days` days and `--experiments` experiments:
+
+    DB_CNX_STRING=postgresql://... python -m benchmarks.partitions --rows 10000000
+    DB_CNX_STRING=postgresql://... python -m benchmarks.partitions --rows 100000000 --days 90
+'''
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import json
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List
+from uuid import uuid4
+
+from asyncpg import Connection
+
+from action_man import db
+from action_man.stores.actions import DEDUP_DAYS, save_action, save_actions_bulk
+from action_man.stores.partitions import drop_partition
+
+
+COLUMNS = '''
+    id UUID NOT NULL,
+    experiment_id UUID,
+    variant_id UUID,
+    reward INTEGER,
+    context JSONB,
+    last_modified TIMESTAMP WITHOUT TIME ZONE DEFAULT now() NOT NULL
+'''
+
+INDEXES = ('experiment_id', 'variant_id', 'last_modified, id', 'experiment_id, last_modified, id')
+
+
+async def create_heap(conn: Connection, table: str, start: datetime, days: int) -> None:
+    await conn.execute(f'CREATE TABLE {table} ({COLUMNS}, PRIMARY KEY (id))')
+
+
+async def create_partitioned(conn: Connection, table: str, start: datetime, days: int) -> None:
+    await conn.execute(
+        f'CREATE TABLE {table}_id (id UUID NOT NULL, claimed_on DATE DEFAULT current_date NOT NULL, '
+        f'PRIMARY KEY (id, claimed_on)) PARTITION BY RANGE (claimed_on)'
+    )
+    await conn.execute(f'CREATE TABLE {table} ({COLUMNS}, PRIMARY KEY (id, last_modified)) PARTITION BY RANGE (last_modified)')
+    for day in range(days + 1):
+        lower = start + timedelta(days=day)
+        for partitioned in (table, f'{table}_id'):
+            await conn.execute(
+                f'CREATE TABLE {partitioned}_p{lower:%Y%m%d} PARTITION OF {partitioned} '
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{(lower + timedelta(days=1)).isoformat()}')"
+            )
+
+
+async def load(
+    conn: Connection, table: str, rows: int, start: datetime, days: int, experiments: int, partitioned: bool
+) -> float:
+    begin = perf_counter()
+    # batches keep every statement in a bounded amount of WAL and memory
+    for offset in range(0, rows, 1000000):
+        await conn.execute(
+            f'''
+            INSERT INTO {table} (id, experiment_id, variant_id, reward, context, last_modified)
+            SELECT
+                md5(n::text)::uuid,
+                md5('experiment' || (n % $3))::uuid,
+                md5('variant' || (n % $3) || (n % 3))::uuid,
+                (random() < 0.1)::integer,
+                '{{}}',
+                $4::timestamp + (n * $5::float / $2) * interval '1 day'
+            FROM generate_series($1::bigint, least($1::bigint + 999999, $2::bigint - 1)) n
+            ''',
+            offset, rows, experiments, start, days
+        )
+
+    if partitioned:
+        # only the ids save_action still looks up are kept, older id partitions are dropped by the worker
+        await conn.execute(
+            f'INSERT INTO {table}_id (id, claimed_on) SELECT id, last_modified::date FROM {table} '
+            f'WHERE last_modified >= current_date - {DEDUP_DAYS}'
+        )
+
+    for columns in INDEXES:
+        await conn.execute(f'CREATE INDEX ON {table} ({columns})')
+    await conn.execute(f'ANALYZE {table}')
+
+    return perf_counter() - begin
+
+
+async def timed(query: Callable[[], Awaitable], repeat: int) -> float:
+    begin = perf_counter()
+    for _ in range(repeat):
+        await query()
+    return (perf_counter() - begin) / repeat
+
+
+async def queries(conn: Connection, table: str, now: datetime, repeat: int) -> Dict[str, float]:
+    experiment_id = await conn.fetchval(f'SELECT experiment_id FROM {table} LIMIT 1')
+
+    return {
+        'experiment page': await timed(
+            lambda: conn.fetch(
+                f'SELECT * FROM {table} WHERE experiment_id = $1 ORDER BY last_modified, id LIMIT 500', experiment_id
+            ),
+            repeat
+        ),
+        'experiment last day': await timed(
+            lambda: conn.fetchval(
+                f'SELECT count(*) FROM {table} WHERE experiment_id = $1 AND last_modified >= $2',
+                experiment_id, now - timedelta(days=1)
+            ),
+            repeat
+        ),
+        'distinct experiments last day': await timed(
+            lambda: conn.fetch(
+                f'SELECT DISTINCT experiment_id FROM {table} WHERE last_modified >= $1', now - timedelta(days=1)
+            ),
+            repeat
+        ),
+    }
+
+
+def actions(experiment_id: str, count: int) -> List[Dict]:
+    return [
+        {'id': str(uuid4()), 'experiment_id': experiment_id, 'variant_id': experiment_id, 'reward': 1, 'context': {}}
+        for _ in range(count)
+    ]
+
+
+async def insert_heap(conn: Connection, table: str, batch: List[Dict]) -> None:
+    # what the app ran before actions were partitioned, batches were COPY-ed and merged the same way
+    await conn.execute(
+        f'INSERT INTO {table} (id, experiment_id, variant_id, reward, context) '
+        f'SELECT * FROM unnest($1::uuid[], $2::uuid[], $3::uuid[], $4::integer[], $5::jsonb[]) '
+        f'ON CONFLICT (id) DO NOTHING',
+        *[[action[column] for action in batch] for column in ('id', 'experiment_id', 'variant_id', 'reward')],
+        [json.dumps(action['context']) for action in batch]
+    )
+
+
+async def inserts(conn: Connection, table: str, partitioned: bool, repeat: int) -> Dict[str, float]:
+    experiment_id = str(await conn.fetchval(f'SELECT experiment_id FROM {table} LIMIT 1'))
+
+    async def single() -> None:
+        if partitioned:
+            await save_action(conn, actions(experiment_id, 1)[0], table, f'{table}_id')
+        else:
+            await insert_heap(conn, table, actions(experiment_id, 1))
+
+    async def bulk() -> None:
+        if partitioned:
+            await save_actions_bulk(conn, actions(experiment_id, 1000), table, f'{table}_id')
+        else:
+            await insert_heap(conn, table, actions(experiment_id, 1000))
+
+    return {
+        'single insert': await timed(single, repeat),
+        'bulk insert, 1000 actions': await timed(bulk, repeat),
+    }
+
+
+async def retention(conn: Connection, table: str, start: datetime, partitioned: bool) -> float:
+    begin = perf_counter()
+    if partitioned:
+        await drop_partition(conn, f'{table}_p{start:%Y%m%d}')
+    else:
+        await conn.execute(f'DELETE FROM {table} WHERE last_modified < $1', start + timedelta(days=1))
+    return perf_counter() - begin
+
+
+async def main(rows: int, days: int, experiments: int, repeat: int, keep: bool) -> None:
+    pool = await db.db_pool()
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = now - timedelta(days=days)
+
+    async with pool.acquire() as conn:
+        for table, create, partitioned in (
+            ('action_bench_heap', create_heap, False), ('action_bench_partitioned', create_partitioned, True)
+        ):
+            await conn.execute(f'DROP TABLE IF EXISTS {table}, {table}_id CASCADE')
+            await create(conn, table, start, days)
+
+            elapsed = await load(conn, table, rows, start, days, experiments, partitioned)
+            print(f'{table}: loaded {rows} rows at {rows / elapsed:.0f} rows/sec ({elapsed:.2f}s)')
+
+            timings = {**await queries(conn, table, now, repeat), **await inserts(conn, table, partitioned, repeat)}
+            for name, latency in timings.items():
+                print(f'  {name:<32} {latency * 1000:>10.2f} ms')
+
+            print(f'  {"retention, one day":<32} {await retention(conn, table, start, partitioned) * 1000:>10.2f} ms')
+
+            if not keep:
+                await conn.execute(f'DROP TABLE IF EXISTS {table}, {table}_id CASCADE')
+
+    await pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--experiments', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch tables around')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.days, args.experiments, args.repeat, args.keep))
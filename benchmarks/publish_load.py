@@ -0,0 +1,80 @@
+'''
+Load test of an HTTP endpoint, `/api/demo/publish` by default, reporting
+requests/sec and latency percentiles. Every connection is kept alive and
+sends its requests back to back.
+
+    python -m benchmarks.publish_load --url http://localhost:8000/api/demo/publish --concurrency 50
+'''
+import argparse
+import asyncio
+from time import perf_counter
+from typing import List
+from urllib.parse import urlsplit
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+
+    for line in head.split(b'\r\n'):
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            await reader.readexactly(int(value))
+
+    return status
+
+
+async def connection(host: str, port: int, request: bytes, requests: int, latencies: List[float]) -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    errors = 0
+
+    for _ in range(requests):
+        start = perf_counter()
+        writer.write(request)
+        if await read_response(reader) >= 400:
+            errors += 1
+        latencies.append(perf_counter() - start)
+
+    writer.close()
+    return errors
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def main(url: str, method: str, concurrency: int, requests: int) -> None:
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (
+        f'{method} {path} HTTP/1.1\r\n'
+        f'Host: {parts.netloc}\r\n'
+        'Content-Length: 0\r\n'
+        'Connection: keep-alive\r\n\r\n'
+    ).encode()
+
+    latencies: List[float] = []
+    start = perf_counter()
+    errors = await asyncio.gather(*[
+        connection(parts.hostname, parts.port or 80, request, requests, latencies)
+        for _ in range(concurrency)
+    ])
+    elapsed = perf_counter() - start
+
+    latencies.sort()
+    print(f'requests  {len(latencies)} ({sum(errors)} errors) in {elapsed:.2f}s')
+    print(f'req/sec   {len(latencies) / elapsed:.0f}')
+    for pct in (50, 90, 99):
+        print(f'p{pct:<8} {percentile(latencies, pct) * 1000:.2f} ms')
+    print(f'max       {latencies[-1] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:8000/api/demo/publish')
+    parser.add_argument('--method', default='POST')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200, help='requests per connection')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.method, args.concurrency, args.requests))
@@ -0,0 +1,57 @@
+'''
+Encode and decode throughput, and bytes per message, of records.Action with
+the JSON codec against the binary `action` codec. Decoding includes building
+the record, as the agents do for every message:
+
+    python -m benchmarks.serializers --actions 100000
+    python -m benchmarks.serializers --actions 100000 --context '{"page": "home", "position": 3}'
+'''
+import argparse
+from time import perf_counter
+from uuid import uuid4
+
+from action_man.records import Action
+# registers the action codec
+from action_man import serializers  # noqa: F401
+
+
+CODECS = ('json', 'action')
+
+
+def main(actions: int, context: str) -> None:
+    records = [
+        Action(
+            id=str(uuid4()),
+            experiment_id=str(uuid4()),
+            variant_id=str(uuid4()),
+            reward=i % 2,
+            context=context
+        )
+        for i in range(actions)
+    ]
+
+    for codec in CODECS:
+        start = perf_counter()
+        payloads = [record.dumps(serializer=codec) for record in records]
+        encode = perf_counter() - start
+
+        start = perf_counter()
+        for payload in payloads:
+            Action.loads(payload, serializer=codec)
+        decode = perf_counter() - start
+
+        size = sum(len(payload) for payload in payloads) / actions
+
+        print(
+            f'{codec:<8} encode {actions / encode:>10.0f} msg/sec  '
+            f'decode {actions / decode:>10.0f} msg/sec  {size:>6.1f} bytes/msg'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--actions', type=int, default=100000)
+    parser.add_argument('--context', default='{}', help='JSON context of every action')
+    args = parser.parse_args()
+
+    main(args.actions, args.context)
@@ -0,0 +1,63 @@
+'''
+Rows/sec of the per-row `save_action` path against `save_actions_bulk`.
+
+Run against a scratch database, it inserts real rows:
+
+    DB_CNX_STRING=postgresql://... python -m benchmarks.store_actions --rows 20000 --batch 500
+'''
+import argparse
+import asyncio
+from random import randint
+from time import perf_counter
+from typing import Dict, List
+from uuid import uuid4
+
+from action_man import db
+from action_man.stores.actions import save_action, save_actions_bulk
+
+
+def make_actions(rows: int) -> List[Dict]:
+    experiment_id = uuid4()
+    variants = [uuid4() for _ in range(3)]
+
+    return [
+        {
+            'id': uuid4(),
+            'experiment_id': experiment_id,
+            'variant_id': variants[i % len(variants)],
+            'reward': randint(0, 1),
+            'context': {}
+        }
+        for i in range(rows)
+    ]
+
+
+async def main(rows: int, batch: int) -> None:
+    pool = await db.db_pool()
+
+    async with pool.acquire() as conn:
+        actions = make_actions(rows)
+        start = perf_counter()
+        for action in actions:
+            await save_action(conn, action)
+        single = perf_counter() - start
+
+        actions = make_actions(rows)
+        start = perf_counter()
+        for i in range(0, rows, batch):
+            await save_actions_bulk(conn, actions[i:i + batch])
+        bulk = perf_counter() - start
+
+    await pool.close()
+
+    print(f'save_action       {rows / single:>12.0f} rows/sec ({single:.2f}s)')
+    print(f'save_actions_bulk {rows / bulk:>12.0f} rows/sec ({bulk:.2f}s, batch={batch})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.batch))
@@ -0,0 +1,59 @@
+'''
+Ingest throughput with 1, 2 and 4 workers: for every size a set of faust
+workers is started, given time to rebalance, and fed actions spread over many
+experiments so the keyed partitions are shared among them.
+
+    KAFKA_CNX_STRING=localhost:9092 REDIS_CNX_STRING=redis://... python -m benchmarks.worker_scaling --actions 200000
+'''
+import argparse
+import asyncio
+import subprocess
+import sys
+from typing import List
+
+from benchmarks.ingest_throughput import run
+
+
+def start_workers(count: int) -> List[subprocess.Popen]:
+    return [
+        subprocess.Popen(
+            [
+                sys.executable, '-m', 'faust', '-A', 'action_man.entrypoint.kafka',
+                '--datadir', f'/tmp/action_man-bench-{i}', '-l', 'warning',
+                'worker', '--web-port', str(6066 + i)
+            ],
+            stdout=subprocess.DEVNULL
+        )
+        for i in range(count)
+    ]
+
+
+def stop_workers(workers: List[subprocess.Popen]) -> None:
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.wait()
+
+
+async def main(sizes: List[int], actions: int, experiments: int, warmup: float, timeout: float) -> None:
+    for size in sizes:
+        workers = start_workers(size)
+        try:
+            await asyncio.sleep(warmup)
+            _, counted, elapsed = await run(actions, experiments, 3, timeout)
+        finally:
+            stop_workers(workers)
+
+        print(f'{size} workers: {counted / elapsed:>10.0f} actions/sec ({counted}/{actions} counted in {elapsed:.2f}s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--actions', type=int, default=200000)
+    parser.add_argument('--experiments', type=int, default=100)
+    parser.add_argument('--warmup', type=float, default=30.0, help='seconds given to the workers to join and rebalance')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.workers, args.actions, args.experiments, args.warmup, args.timeout))
@@ -0,0 +1,26 @@
+"""002 action keyset indexes
+
+Revision ID: 3f9c2a7d1e4b
+Revises: ad817b0e647b
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d1e4b'
+down_revision = 'ad817b0e647b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_action_last_modified_id', 'action', ['last_modified', 'id'], unique=False)
+    op.create_index('ix_action_experiment_id_last_modified_id', 'action', ['experiment_id', 'last_modified', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_action_experiment_id_last_modified_id', table_name='action')
+    op.drop_index('ix_action_last_modified_id', table_name='action')
@@ -0,0 +1,108 @@
+"""003 partition action by day
+
+Revision ID: 8b1e4c6f2a90
+Revises: 3f9c2a7d1e4b
+Create Date: 2026-10-18 14:03:27.501183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '8b1e4c6f2a90'
+down_revision = '3f9c2a7d1e4b'
+branch_labels = None
+depends_on = None
+
+
+# daily partitions created ahead of time, the worker keeps extending them,
+# see bootstrap.tasks.maintain_action_partitions
+PARTITIONS_AHEAD = 3
+
+
+def upgrade():
+    # the existing heap becomes the first partition, covering everything up to
+    # the end of today, so no row needs to be rewritten
+    op.rename_table('action', 'action_legacy')
+    op.execute('ALTER INDEX ix_action_experiment_id RENAME TO ix_action_legacy_experiment_id')
+    op.execute('ALTER INDEX ix_action_variant_id RENAME TO ix_action_legacy_variant_id')
+    op.execute('ALTER INDEX ix_action_last_modified_id RENAME TO ix_action_legacy_last_modified_id')
+    op.execute(
+        'ALTER INDEX ix_action_experiment_id_last_modified_id '
+        'RENAME TO ix_action_legacy_experiment_id_last_modified_id'
+    )
+
+    # the partition key has to be part of the primary key
+    op.execute('ALTER TABLE action_legacy DROP CONSTRAINT action_pkey')
+    op.execute('ALTER TABLE action_legacy ADD CONSTRAINT action_legacy_pkey PRIMARY KEY (id, last_modified)')
+
+    op.execute(
+        '''
+        CREATE TABLE action (
+            id UUID NOT NULL,
+            experiment_id UUID,
+            variant_id UUID,
+            reward INTEGER,
+            context JSONB,
+            last_modified TIMESTAMP WITHOUT TIME ZONE DEFAULT now() NOT NULL,
+            CONSTRAINT action_pkey PRIMARY KEY (id, last_modified)
+        ) PARTITION BY RANGE (last_modified)
+        '''
+    )
+    # rows falling outside every partition land here instead of failing the insert
+    op.execute('CREATE TABLE action_default PARTITION OF action DEFAULT')
+
+    op.execute(
+        f'''
+        DO $$
+        DECLARE
+            upper_bound DATE := (
+                SELECT date_trunc('day', greatest(now(), max(last_modified))) + interval '1 day' FROM action_legacy
+            );
+            day DATE;
+        BEGIN
+            EXECUTE format(
+                'ALTER TABLE action ATTACH PARTITION action_legacy FOR VALUES FROM (MINVALUE) TO (%L)', upper_bound
+            );
+            FOR i IN 0..{PARTITIONS_AHEAD} LOOP
+                day := upper_bound + i;
+                EXECUTE format(
+                    'CREATE TABLE action_p%s PARTITION OF action FOR VALUES FROM (%L) TO (%L)',
+                    to_char(day, 'YYYYMMDD'), day, day + 1
+                );
+            END LOOP;
+        END
+        $$
+        '''
+    )
+
+    # indexes on the parent are created on every partition, matching legacy ones are attached
+    op.create_index('ix_action_experiment_id', 'action', ['experiment_id'], unique=False)
+    op.create_index('ix_action_variant_id', 'action', ['variant_id'], unique=False)
+    op.create_index('ix_action_last_modified_id', 'action', ['last_modified', 'id'], unique=False)
+    op.create_index('ix_action_experiment_id_last_modified_id', 'action', ['experiment_id', 'last_modified', 'id'], unique=False)
+
+
+def downgrade():
+    op.rename_table('action', 'action_partitioned')
+    op.create_table('action',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('experiment_id', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('variant_id', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('reward', sa.Integer(), nullable=True),
+    sa.Column('context', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('last_modified', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id', name='action_heap_pkey')
+    )
+    op.execute(
+        'INSERT INTO action (id, experiment_id, variant_id, reward, context, last_modified) '
+        'SELECT id, experiment_id, variant_id, reward, context, last_modified FROM action_partitioned '
+        'ORDER BY last_modified ON CONFLICT (id) DO NOTHING'
+    )
+    op.execute('DROP TABLE action_partitioned CASCADE')
+    op.execute('ALTER TABLE action RENAME CONSTRAINT action_heap_pkey TO action_pkey')
+    op.create_index(op.f('ix_action_experiment_id'), 'action', ['experiment_id'], unique=False)
+    op.create_index(op.f('ix_action_variant_id'), 'action', ['variant_id'], unique=False)
+    op.create_index('ix_action_last_modified_id', 'action', ['last_modified', 'id'], unique=False)
+    op.create_index('ix_action_experiment_id_last_modified_id', 'action', ['experiment_id', 'last_modified', 'id'], unique=False)
@@ -0,0 +1,61 @@
+"""005 action id
+
+Revision ID: e7a4b19c3d52
+Revises: c52d9e0a7f13
+Create Date: 2026-10-18 19:12:44.218306
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4b19c3d52'
+down_revision = 'c52d9e0a7f13'
+branch_labels = None
+depends_on = None
+
+
+# daily partitions created ahead of time, the worker keeps extending them and
+# drops the ones past ACTIONS_DEDUP_DAYS, see stores.partitions.maintain_partitions
+PARTITIONS_AHEAD = 3
+# days of ids claimed from the existing actions, ACTIONS_DEDUP_DAYS defaults to 1
+DEDUP_DAYS = 1
+
+
+def upgrade():
+    op.execute(
+        '''
+        CREATE TABLE action_id (
+            id UUID NOT NULL,
+            claimed_on DATE DEFAULT current_date NOT NULL,
+            CONSTRAINT action_id_pkey PRIMARY KEY (id, claimed_on)
+        ) PARTITION BY RANGE (claimed_on)
+        '''
+    )
+    op.execute('CREATE TABLE action_id_default PARTITION OF action_id DEFAULT')
+    op.execute(
+        f'''
+        DO $$
+        DECLARE
+            day DATE;
+        BEGIN
+            FOR i IN -{DEDUP_DAYS}..{PARTITIONS_AHEAD} LOOP
+                day := current_date + i;
+                EXECUTE format(
+                    'CREATE TABLE action_id_p%s PARTITION OF action_id FOR VALUES FROM (%L) TO (%L)',
+                    to_char(day, 'YYYYMMDD'), day, day + 1
+                );
+            END LOOP;
+        END
+        $$
+        '''
+    )
+    # ids stored within the window are claimed too, or their replays would be inserted again
+    op.execute(
+        'INSERT INTO action_id (id, claimed_on) '
+        'SELECT DISTINCT ON (id) id, last_modified::date FROM action '
+        f"WHERE last_modified >= current_date - {DEDUP_DAYS} ORDER BY id, last_modified DESC"
+    )
+
+
+def downgrade():
+    op.execute('DROP TABLE action_id CASCADE')
@@ -6,9 +6,12 @@ from random import randint
 
 import pytest
 
-from action_man.actions.agents import store_actions, cache_actions
+from action_man.actions.agents import store_actions, cache_actions, rollup_actions
+from action_man import cache
 from action_man import models
 from action_man import records
+from action_man.stores.exceptions import StoreException
+from action_man.stores.stats import get_stats
 
 
 
@@ -47,20 +50,83 @@ async def test_cache_actions(faust, cache_pool):
         context={}
     )
 
-    key = f'{str(action.experiment_id)}_{str(action.variant_id)}'
-
-    with await cache_pool as conn:
-        await conn.set(f'{key}_total', 0)
-        await conn.set(f'{key}_successes', 0)
-
     # act
     async with cache_actions.test_context() as agent:
         await agent.put(action)
+        await agent.app.flush_counters()
+
+    # assert
+    counters = await cache.get_counters(cache_pool, action.experiment_id)
+
+    assert counters[str(action.variant_id)] == (action.reward, 1)
+
+
+@pytest.mark.asyncio
+async def test_rollup_actions(faust, db_conn):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    actions = [
+        records.Action(id=uuid4(), experiment_id=experiment_id, variant_id=variant_id, reward=reward, context={})
+        for reward in (0, 1, 1)
+    ]
+
+    # test contexts number offsets from 0 again
+    await db_conn.execute(f'DELETE FROM {models.ExperimentVariantStatsOffset.__tablename__}')
+
+    # act
+    async with rollup_actions.test_context() as agent:
+        for action in actions:
+            await agent.put(action)
+
+    # assert
+    stats = await get_stats(db_conn, experiment_id)
+
+    assert sum(record.get('successes') for record in stats) == 2
+    assert sum(record.get('total') for record in stats) == 3
+
+
+@pytest.mark.asyncio
+async def test_rollup_actions_skips_redelivered_actions(faust, db_conn):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    actions = [
+        records.Action(id=uuid4(), experiment_id=experiment_id, variant_id=variant_id, reward=reward, context={})
+        for reward in (0, 1)
+    ]
+
+    await db_conn.execute(f'DELETE FROM {models.ExperimentVariantStatsOffset.__tablename__}')
+
+    async with rollup_actions.test_context() as agent:
+        for action in actions:
+            await agent.put(action)
+
+    # act
+    async with rollup_actions.test_context() as agent:
+        for action in actions + actions[:1]:
+            await agent.put(action)
 
     # assert
-    with await cache_pool as conn:
-        total =  await conn.get(f'{key}_total')
-        successes = await conn.get(f'{key}_successes')
+    stats = await get_stats(db_conn, experiment_id)
+
+    assert sum(record.get('successes') for record in stats) == 1
+    assert sum(record.get('total') for record in stats) == 3
 
-    assert int(total) == 1
-    assert int(successes) == action.reward
+
+@pytest.mark.asyncio
+async def test_rollup_actions_skips_batches_failing_on_non_transient_errors(faust, db_conn):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    action = records.Action(id=uuid4(), experiment_id=experiment_id, variant_id=variant_id, reward=1, context={})
+
+    await db_conn.execute(f'DELETE FROM {models.ExperimentVariantStatsOffset.__tablename__}')
+
+    # act
+    with patch('action_man.actions.agents.save_stats', AsyncMock(side_effect=StoreException)) as save_stats, \
+            patch('action_man.actions.agents.asyncio.sleep', AsyncMock()) as sleep:
+        async with rollup_actions.test_context() as agent:
+            await agent.put(action)
+
+    # assert
+    save_stats.assert_awaited_once()
+    sleep.assert_not_awaited()
+    assert await get_stats(db_conn, experiment_id) == []
@@ -0,0 +1,37 @@
+from uuid import uuid4
+
+import pytest
+
+from action_man.counters import agents
+from action_man import cache
+
+
+@pytest.mark.asyncio
+async def test_snapshot_counts_writes_changed_counters(faust, cache_pool):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    key = f'{experiment_id}:{variant_id}'
+    table = {key: [2, 5]}
+    changed = {key}
+
+    # act
+    written = await agents.snapshot_counts(faust, table, changed)
+
+    # assert
+    counters = await cache.get_counters(cache_pool, experiment_id)
+
+    assert written == 1
+    assert counters == {str(variant_id): (2, 5)}
+    assert not changed
+
+
+@pytest.mark.asyncio
+async def test_snapshot_counts_skips_unchanged_counters(faust):
+    # arrange
+    table = {f'{uuid4()}:{uuid4()}': [1, 1]}
+
+    # act
+    written = await agents.snapshot_counts(faust, table, set())
+
+    # assert
+    assert written == 0
@@ -6,85 +6,150 @@ from random import randint
 
 import pytest
 
-from action_man.experiments.agents import init_experiment, calculate_experiments
-from action_man.probabilities.agents import calculate_probabilities
-from action_man import models
+from action_man.experiments.agents import init_experiment, calculate_experiments, calculate_all
+from action_man import cache
 from action_man import records
 
 
 @pytest.mark.asyncio
-async def test_init_experiment(faust, cache_pool, cache_lock_manager):
+async def test_init_experiment(faust, cache_pool):
     # arrange
     experiment = records.ExperimentInit(
         experiment_id=uuid4(),
         variant_id=uuid4(),
     )
 
-    key = f'{str(experiment.experiment_id)}_{str(experiment.variant_id)}'
-
     with await cache_pool as conn:
-        assert not await conn.get(f'{key}_total')
-        assert not await conn.get(f'{key}_successes')
+        assert not await conn.exists(cache.counters_key(experiment.experiment_id))
 
     # act
     async with init_experiment.test_context() as agent:
         await agent.put(experiment)
 
     # assert
+    counters = await cache.get_counters(cache_pool, experiment.experiment_id)
+
+    assert counters[str(experiment.variant_id)] == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_init_experiment_keeps_existing_counters(faust, cache_pool):
+    # arrange
+    experiment = records.ExperimentInit(
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+    )
+
     with await cache_pool as conn:
-        total =  await conn.get(f'{key}_total')
-        successes = await conn.get(f'{key}_successes')
+        await conn.hset(cache.counters_key(experiment.experiment_id), f'{experiment.variant_id}_total', 10)
+
+    # act
+    async with init_experiment.test_context() as agent:
+        await agent.put(experiment)
+
+    # assert
+    counters = await cache.get_counters(cache_pool, experiment.experiment_id)
+
+    assert counters[str(experiment.variant_id)] == (0, 10)
+
+
+@pytest.mark.asyncio
+async def test_init_experiment_ignores_unknown_algorithms(faust, cache_pool):
+    # arrange
+    experiment = records.ExperimentInit(
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+        algorithm='unknown',
+    )
+
+    # act
+    async with init_experiment.test_context() as agent:
+        await agent.put(experiment)
+
+    # assert
+    assert await cache.get_algorithms(cache_pool, [experiment.experiment_id]) == [None]
 
 
-    assert int(total) == int(successes) == 0
-    assert not await cache_lock_manager.is_locked(f'lock_{key}_successes')
+ALL_PARTITIONS = list(range(cache.PARTITIONS))
 
 
 @pytest.mark.xfail(reason='RuntimeError: Task <> got Future <Future pending> attached to a different loop')
 @pytest.mark.asyncio
-async def test_calculate_experiments_with_no_experiments_available(faust, db_conn):
+async def test_calculate_experiments_with_no_experiments_available(faust, cache_pool):
     # arrange
-    assert await db_conn.fetch(f'SELECT * FROM {models.Action.__tablename__}')
+    with await cache_pool as conn:
+        await conn.delete(*[cache.dirty_experiments_key(partition) for partition in ALL_PARTITIONS])
 
     # act
-    with patch.object(calculate_probabilities, 'cast', new_callable=AsyncMock()) as mock_cast:
+    with patch('action_man.experiments.agents.owned_partitions', return_value=ALL_PARTITIONS), \
+            patch('action_man.experiments.agents.calculate_batch', new_callable=AsyncMock) as mock_calculate:
         await calculate_experiments()
 
     # assert
-    assert mock_calculate_prob.cast.call_count == 0
+    assert mock_calculate.call_count == 0
 
 
 @pytest.mark.xfail(reason='RuntimeError: Task <> got Future <Future pending> attached to a different loop')
 @pytest.mark.asyncio
-async def test_calculate_experiments_with_five_experiments_available(db_conn):
+async def test_calculate_experiments_only_recalculates_dirty_experiments(faust, cache_pool):
     # arrange
-    actions = [
-        (uuid4(), uuid4(), uuid4(), randint(0, 1), '{}')
-        for i in range(5)
-    ]
-
-    await db_conn.executemany(
-        f'INSERT INTO {models.Action.__tablename__} (id, experiment_id, variant_id, reward, context)'
-        'VALUES ($1, $2, $3, $4, $5)',
-        actions
-    )
+    experiments = [uuid4() for i in range(5)]
 
-    def mock_coro(return_value=None, **kwargs):
-        """Create mock coroutine function."""
-        async def wrapped(*args, **kwargs):
-            return return_value
-        return MagicMock(wraps=wrapped, **kwargs)
+    with await cache_pool as conn:
+        await conn.delete(*[cache.dirty_experiments_key(partition) for partition in ALL_PARTITIONS])
+        await conn.sadd(cache.experiments_key(0), str(uuid4()))
 
-    # take into account other saved
-    record = await db_conn.fetchrow(f'SELECT count(*) as count FROM {models.Action.__tablename__}')
+    for experiment_id in experiments:
+        await cache.init_counters(cache_pool, experiment_id, uuid4())
 
-    # at least 5 records
-    assert record.get('count') >= 5
+    # act
+    with patch('action_man.experiments.agents.owned_partitions', return_value=ALL_PARTITIONS), \
+            patch('action_man.experiments.agents.calculate_batch', new_callable=AsyncMock) as mock_calculate:
+        await calculate_experiments()
+
+    # assert
+    calculated = [experiment_id for call in mock_calculate.call_args_list for experiment_id in call.args[1]]
+
+    assert set(calculated) == {str(experiment_id) for experiment_id in experiments}
+
+    with await cache_pool as conn:
+        for partition in ALL_PARTITIONS:
+            assert not await conn.smembers(cache.dirty_experiments_key(partition))
+
+
+@pytest.mark.xfail(reason='RuntimeError: Task <> got Future <Future pending> attached to a different loop')
+@pytest.mark.asyncio
+async def test_calculate_experiments_skips_partitions_owned_by_other_workers(faust, cache_pool):
+    # arrange
+    experiment_id = uuid4()
+    partition = cache.experiment_partition(experiment_id)
+    await cache.init_counters(cache_pool, experiment_id, uuid4())
 
     # act
-    with patch('action_man.experiments.agents.calculate_probabilities') as mock_calculate_prob:
-        mock_calculate_prob.cast = mock_coro()
+    with patch('action_man.experiments.agents.owned_partitions', return_value=[p for p in ALL_PARTITIONS if p != partition]), \
+            patch('action_man.experiments.agents.calculate_batch', new_callable=AsyncMock) as mock_calculate:
         await calculate_experiments()
 
     # assert
-    assert mock_calculate_prob.cast.call_count == record.get('count')
+    calculated = [experiment_id for call in mock_calculate.call_args_list for experiment_id in call.args[1]]
+
+    assert str(experiment_id) not in calculated
+
+    with await cache_pool as conn:
+        assert str(experiment_id) in await conn.smembers(cache.dirty_experiments_key(partition), encoding='utf-8')
+
+
+@pytest.mark.asyncio
+async def test_calculate_all_flags_failed_batches_dirty_again():
+    # arrange
+    experiments = [str(uuid4()) for i in range(3)]
+    cache_pool = MagicMock()
+
+    # act
+    with patch('action_man.experiments.agents.calculate_batch', AsyncMock(side_effect=Exception)), \
+            patch('action_man.experiments.agents.kafka.cache_pool', AsyncMock(return_value=cache_pool)), \
+            patch('action_man.experiments.agents.cache.flag_dirty_experiments', new_callable=AsyncMock) as mock_flag:
+        await calculate_all(experiments)
+
+    # assert
+    mock_flag.assert_awaited_once_with(cache_pool, experiments)
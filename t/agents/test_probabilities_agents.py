@@ -6,13 +6,14 @@ from random import randint
 
 import pytest
 
-from action_man.probabilities.agents import calculate_probabilities
+from action_man.probabilities.agents import calculate_batch
+from action_man import cache
 from action_man import models
 from action_man import records
 
 
 @pytest.mark.asyncio
-async def test_calculate_probabilities(faust, db_conn, cache_pool):
+async def test_calculate_batch(faust, cache_pool):
     # arrange
     experiment_id = uuid4()
     actions = [
@@ -20,24 +21,17 @@ async def test_calculate_probabilities(faust, db_conn, cache_pool):
         for i in range(5)
     ]
 
-    await db_conn.executemany(
-        f'INSERT INTO {models.Action.__tablename__} (id, experiment_id, variant_id, reward, context)'
-        'VALUES ($1, $2, $3, $4, $5)',
-        actions
-    )
-
     with await cache_pool as conn:
         for action in actions:
-            key = f'{experiment_id}_{action[2]}'
-            await conn.set(f'{key}_total', 10)
-            await conn.set(f'{key}_successes', 5)
+            await conn.hset(cache.counters_key(experiment_id), f'{action[2]}_total', 10)
+            await conn.hset(cache.counters_key(experiment_id), f'{action[2]}_successes', 5)
 
     # act
-    async with calculate_probabilities.test_context() as agent:
-        with patch.object(agent.app, 'kafka_producer', return_value=AsyncMock(send_and_wait=AsyncMock())):
-            await agent.put(experiment_id)
+    with patch.object(faust, 'kafka_producer', return_value=AsyncMock(send=AsyncMock())):
+        keys = await calculate_batch(faust, [str(experiment_id)])
 
     # assert
+    assert keys == [f'{experiment_id}_probabilities']
 
     with await cache_pool as conn:
         probabilities =  await conn.get(f'{experiment_id}_probabilities')
@@ -49,3 +43,23 @@ async def test_calculate_probabilities(faust, db_conn, cache_pool):
 
     for value in probabilities.values():
         assert 0 <= value <=1
+
+
+@pytest.mark.asyncio
+async def test_calculate_batch_includes_registered_variants_without_actions(faust, cache_pool):
+    # arrange
+    experiment_id = uuid4()
+    variants = [uuid4() for i in range(3)]
+
+    for variant_id in variants:
+        await cache.init_counters(cache_pool, experiment_id, variant_id)
+
+    # act
+    with patch.object(faust, 'kafka_producer', return_value=AsyncMock(send=AsyncMock())):
+        await calculate_batch(faust, [str(experiment_id)])
+
+    # assert
+    with await cache_pool as conn:
+        probabilities =  await conn.get(f'{experiment_id}_probabilities')
+
+    assert set(json.loads(probabilities).keys()) == {str(variant_id) for variant_id in variants}
@@ -0,0 +1,45 @@
+import numpy
+import pytest
+
+from action_man.algorithm import ab
+
+
+def test_calculate_returns_a_probability():
+    # act
+    value = ab.calculate(5, 10)
+
+    # assert
+    assert 0 <= value <= 1
+
+
+def test_probability_of_best_sums_to_one():
+    # act
+    probabilities = ab.probability_of_best([5, 10, 20], [100, 100, 100])
+
+    # assert
+    assert probabilities.shape == (3, )
+    assert probabilities.sum() == pytest.approx(1)
+    assert probabilities.argmax() == 2
+
+
+def test_probability_of_best_is_reproducible_with_a_seeded_generator():
+    # act
+    first = ab.probability_of_best([5, 6], [10, 10], rng=numpy.random.default_rng(42))
+    second = ab.probability_of_best([5, 6], [10, 10], rng=numpy.random.default_rng(42))
+
+    # assert
+    assert (first == second).all()
+
+
+def test_probability_of_best_ignores_masked_variants():
+    # arrange
+    successes = numpy.array([[5, 90], [5, 5]])
+    totals = numpy.array([[10, 100], [10, 10]])
+    mask = numpy.array([[True, False], [True, True]])
+
+    # act
+    probabilities = ab.probability_of_best(successes, totals, mask=mask)
+
+    # assert
+    assert probabilities[0].tolist() == [1, 0]
+    assert probabilities[1].sum() == pytest.approx(1)
@@ -0,0 +1,42 @@
+from collections import Counter
+import random
+
+import pytest
+
+from action_man.algorithm.alias import AliasTable, build
+
+
+@pytest.mark.parametrize('weights', [[1.0], [0.2, 0.3, 0.5], [0.0, 0.0, 1.0], [0.7] + [0.003] * 100])
+def test_build_keeps_each_variant_share(weights):
+    # act
+    prob, alias = build(weights)
+
+    # assert
+    n = len(weights)
+    shares = [p / n for p in prob]
+    for i, a in enumerate(alias):
+        shares[a] += (1 - prob[i]) / n
+
+    assert shares == pytest.approx([w / sum(weights) for w in weights])
+
+
+def test_build_is_uniform_without_positive_weights():
+    # act
+    prob, alias = build([0.0, 0.0])
+
+    # assert
+    assert prob == [1.0, 1.0]
+    assert alias == [0, 1]
+
+
+def test_alias_table_samples_by_weight():
+    # arrange
+    rng = random.Random(42)
+    table = AliasTable.loads(AliasTable.from_weights({'a': 0.2, 'b': 0.8, 'c': 0.0}).dumps())
+
+    # act
+    picks = Counter(table.sample(rng) for _ in range(10000))
+
+    # assert
+    assert picks['c'] == 0
+    assert abs(picks['a'] / 10000 - 0.2) < 0.02
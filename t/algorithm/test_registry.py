@@ -0,0 +1,90 @@
+import numpy
+import pytest
+
+from action_man.algorithm import closed_form, greedy, registry, ucb
+
+
+def test_get_algorithm_falls_back_to_default():
+    # act
+    algorithm = registry.get_algorithm('unknown')
+
+    # assert
+    assert algorithm is registry.ALGORITHMS[registry.DEFAULT_ALGORITHM]
+
+
+def test_calculate_batch_keeps_variant_ids():
+    # arrange
+    experiments = [
+        {'a': (1, 10), 'b': (9, 10)},
+        {},
+        {'c': (0, 0)}
+    ]
+
+    # act
+    result = registry.calculate_batch(experiments)
+
+    # assert
+    assert [set(calculation) for calculation in result] == [{'a', 'b'}, set(), {'c'}]
+    assert result[0]['b'] > result[0]['a']
+    assert result[2]['c'] == 1
+
+
+@pytest.mark.parametrize('algorithm', list(registry.ALGORITHMS))
+def test_calculate_batch_allocations_sum_to_one(algorithm):
+    # arrange
+    experiments = [
+        {'a': (10, 100), 'b': (20, 100)},
+        {'a': (10, 100), 'b': (20, 100), 'c': (0, 0)}
+    ]
+
+    # act
+    result = registry.calculate_batch(experiments, [algorithm, algorithm])
+
+    # assert
+    for calculation in result:
+        assert sum(calculation.values()) == pytest.approx(1, abs=1e-6)
+        assert all(0 <= value <= 1 for value in calculation.values())
+
+
+def test_ucb_allocates_untried_variants_first():
+    # arrange
+    successes = numpy.array([[50., 0.]])
+    totals = numpy.array([[100., 0.]])
+    mask = numpy.array([[True, True]])
+
+    # act
+    allocation = ucb.allocate(successes, totals, mask)
+
+    # assert
+    assert allocation.tolist() == [[0, 1]]
+
+
+def test_epsilon_greedy_explores_every_variant():
+    # arrange
+    successes = numpy.array([[50., 10., 0.]])
+    totals = numpy.array([[100., 100., 0.]])
+    mask = numpy.array([[True, True, False]])
+
+    # act
+    allocation = greedy.allocate(successes, totals, mask, epsilon=0.2)
+
+    # assert
+    assert allocation[0].tolist() == pytest.approx([0.9, 0.1, 0])
+
+
+def test_closed_form_matches_monte_carlo():
+    # act
+    exact = closed_form.probability_b_beats_a(10, 100, 15, 100)
+    approximated = registry.ALGORITHMS['thompson'](numpy.array([[10., 15.]]), numpy.array([[100., 100.]]), draws=100000)
+
+    # assert
+    assert exact == pytest.approx(approximated[0, 1], abs=0.01)
+
+
+def test_closed_form_is_symmetric():
+    # act
+    p_b = closed_form.probability_b_beats_a(3, 40, 7, 50)
+    p_a = closed_form.probability_b_beats_a(7, 50, 3, 40)
+
+    # assert
+    assert p_a + p_b == pytest.approx(1)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+from uuid import uuid4
+
+import pytest
+from sanic import Sanic
+from sanic.exceptions import InvalidUsage
+
+from action_man.api import actions
+from action_man.api.actions import actions_bp, _validate_action
+
+
+def action_data(**fields):
+    data = {
+        'id': str(uuid4()),
+        'experiment_id': str(uuid4()),
+        'variant_id': str(uuid4()),
+        'reward': 1,
+        'context': {'page': 'home'},
+    }
+    data.update(fields)
+    return data
+
+
+class Producer:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value, key):
+        self.sent.append((topic, key))
+        delivery = asyncio.get_event_loop().create_future()
+        delivery.set_result(None)
+        return delivery
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(actions, 'INGEST_MODE', 'kafka')
+    monkeypatch.setattr(actions, 'INGEST_BATCH_SIZE', 2)
+
+    app = Sanic('test_actions_api')
+    app.blueprint(actions_bp)
+    app.kafka = Producer()
+
+    return app
+
+
+def test_validate_action_returns_a_record_shaped_action():
+    # arrange
+    data = action_data()
+
+    # act
+    action = _validate_action(data)
+
+    # assert
+    assert action == {
+        'id': data['id'],
+        'experiment_id': data['experiment_id'],
+        'variant_id': data['variant_id'],
+        'reward': 1,
+        'context': '{"page": "home"}',
+    }
+
+
+def test_validate_action_keeps_string_contexts():
+    # act
+    action = _validate_action(action_data(context='{"page": "home"}'))
+
+    # assert
+    assert action['context'] == '{"page": "home"}'
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    'action',
+    action_data(id='not-a-uuid'),
+    action_data(experiment_id=None),
+    {key: value for key, value in action_data().items() if key != 'variant_id'},
+    action_data(reward=True),
+    action_data(reward=2),
+    action_data(reward=None),
+    action_data(context='{"page": '),
+    action_data(context='home'),
+])
+def test_validate_action_rejects_invalid_actions(data):
+    # act / assert
+    with pytest.raises(InvalidUsage):
+        _validate_action(data)
+
+
+def test_create_action_publishes_to_the_actions_topic(app):
+    # arrange
+    data = action_data()
+
+    # act
+    _, response = app.test_client.post('/api/actions/', data=json.dumps(data))
+
+    # assert
+    assert response.status == 202
+    assert response.json == {'data': {'id': data['id']}}
+    assert app.kafka.sent == [('actions', data['experiment_id'])]
+
+
+def test_create_actions_publishes_a_batch(app):
+    # arrange
+    data = [action_data(), action_data()]
+
+    # act
+    _, response = app.test_client.post('/api/actions/batch', data=json.dumps(data))
+
+    # assert
+    assert response.status == 202
+    assert response.json == {'data': {'ids': [action['id'] for action in data]}}
+    assert len(app.kafka.sent) == 2
+
+
+@pytest.mark.parametrize('data', [[], [action_data(), action_data(), action_data()], action_data()])
+def test_create_actions_rejects_batches_out_of_bounds(app, data):
+    # act
+    _, response = app.test_client.post('/api/actions/batch', data=json.dumps(data))
+
+    # assert
+    assert response.status == 400
+    assert app.kafka.sent == []
+
+
+def test_create_actions_publishes_nothing_when_an_action_is_invalid(app):
+    # arrange
+    data = [action_data(), action_data(reward=True)]
+
+    # act
+    _, response = app.test_client.post('/api/actions/batch', data=json.dumps(data))
+
+    # assert
+    assert response.status == 400
+    assert app.kafka.sent == []
@@ -0,0 +1,39 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sanic.exceptions import InvalidUsage
+
+from action_man.api.args import datetime_arg
+
+
+def test_datetime_arg_keeps_naive_datetimes():
+    # arrange
+    request = SimpleNamespace(args={'since': '2026-01-01T10:30:00'})
+
+    # act
+    since = datetime_arg(request, 'since')
+
+    # assert
+    assert since == datetime(2026, 1, 1, 10, 30)
+
+
+def test_datetime_arg_converts_aware_datetimes_to_naive_utc():
+    # arrange
+    request = SimpleNamespace(args={'since': '2026-01-01T10:30:00+02:00'})
+
+    # act
+    since = datetime_arg(request, 'since')
+
+    # assert
+    assert since == datetime(2026, 1, 1, 8, 30)
+    assert since.tzinfo is None
+
+
+def test_datetime_arg_rejects_invalid_datetimes():
+    # arrange
+    request = SimpleNamespace(args={'until': 'yesterday'})
+
+    # act / assert
+    with pytest.raises(InvalidUsage):
+        datetime_arg(request, 'until')
@@ -6,7 +6,7 @@ from random import randint
 
 import pytest
 
-from action_man.stores.actions import save_action, get_actions
+from action_man.stores.actions import DEDUP_DAYS, save_action, save_actions_bulk, get_actions, iter_actions
 from action_man.stores.exceptions import StoreException
 from action_man import models
 from action_man import records
@@ -60,6 +60,77 @@ async def test_save_action_keeps_going_on_conflict(db_conn):
     assert record.get('reward') == action.reward
 
 
+@pytest.mark.asyncio
+async def test_save_action_skips_claimed_ids(db_conn):
+    # arrange
+    action = records.Action(
+        id=uuid4(),
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+        reward=randint(0, 1),
+        context={}
+    ).to_representation()
+
+    # an id stored the day before, in another partition
+    await db_conn.execute(
+        f'INSERT INTO {models.ActionId.__tablename__} (id, claimed_on) VALUES ($1, current_date - 1)', action['id']
+    )
+
+    # act
+    await save_action(db_conn, action)
+    await save_actions_bulk(db_conn, [action])
+
+    # assert
+    record = await db_conn.fetchrow(f'SELECT * FROM {models.Action.__tablename__} WHERE id = $1', action['id'])
+
+    assert not record
+
+
+@pytest.mark.asyncio
+async def test_save_action_stores_ids_claimed_before_the_dedup_window(db_conn):
+    # arrange
+    action = records.Action(
+        id=uuid4(),
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+        reward=randint(0, 1),
+        context={}
+    ).to_representation()
+
+    await db_conn.execute(
+        f'INSERT INTO {models.ActionId.__tablename__} (id, claimed_on) VALUES ($1, current_date - $2::integer)',
+        action['id'], DEDUP_DAYS + 1
+    )
+
+    # act
+    await save_action(db_conn, action)
+
+    # assert
+    record = await db_conn.fetchrow(f'SELECT * FROM {models.Action.__tablename__} WHERE id = $1', action['id'])
+
+    assert record
+
+
+@pytest.mark.asyncio
+async def test_save_action_stores_json_context_as_is(db_conn):
+    # arrange
+    action = records.Action(
+        id=uuid4(),
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+        reward=randint(0, 1),
+        context='{"page": "home"}'
+    )
+
+    # act
+    id = await save_action(db_conn, action.to_representation())
+
+    # assert
+    context = await db_conn.fetchval(f"SELECT context ->> 'page' FROM {models.Action.__tablename__} WHERE id = $1", id)
+
+    assert context == 'home'
+
+
 @pytest.mark.asyncio
 async def test_save_action_raises_if_something_is_wrong(db_conn):
     # arrange
@@ -81,6 +152,83 @@ async def test_save_action_raises_if_something_is_wrong(db_conn):
     assert not record
 
 
+@pytest.mark.asyncio
+async def test_save_actions_bulk_inserts_into_db(db_conn):
+    # arrange
+    actions = [
+        records.Action(
+            id=uuid4(),
+            experiment_id=uuid4(),
+            variant_id=uuid4(),
+            reward=randint(0, 1),
+            context={}
+        ).to_representation()
+        for i in range(5)
+    ]
+
+    # act
+    ids = await save_actions_bulk(db_conn, actions)
+
+    # assert
+    records_ = await db_conn.fetch(f'SELECT * FROM {models.Action.__tablename__} WHERE id = ANY($1::uuid[])', ids)
+
+    assert len(records_) == 5
+    assert {record.get('id') for record in records_} == {action['id'] for action in actions}
+
+
+@pytest.mark.asyncio
+async def test_save_actions_bulk_keeps_going_on_conflict(db_conn):
+    # arrange
+    action = records.Action(
+        id=uuid4(),
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+        reward=randint(0, 1),
+        context={}
+    ).to_representation()
+
+    await save_action(db_conn, action)
+
+    # act
+    ids = await save_actions_bulk(db_conn, [action, action])
+
+    # assert
+    record = await db_conn.fetchrow(f'SELECT count(*) as count FROM {models.Action.__tablename__} WHERE id = $1', action['id'])
+
+    assert ids == [action['id'], action['id']]
+    assert record.get('count') == 1
+
+
+@pytest.mark.asyncio
+async def test_save_actions_bulk_raises_if_something_is_wrong(db_conn):
+    # arrange
+    actions = [
+        {
+            'id': uuid4(),
+            'experiment_id': 'fake-uuid',
+            'variant_id': uuid4(),
+            'reward': randint(0, 1),
+            'context': {}
+        },
+        {
+            'id': uuid4(),
+            'experiment_id': uuid4(),
+            'variant_id': uuid4(),
+            'reward': randint(0, 1),
+            'context': {}
+        }
+    ]
+
+    # act
+    with pytest.raises(StoreException):
+        await save_actions_bulk(db_conn, actions)
+
+    # assert
+    record = await db_conn.fetchrow(f'SELECT * FROM {models.Action.__tablename__} WHERE id = $1', actions[1]['id'])
+
+    assert not record
+
+
 @pytest.mark.asyncio
 async def test_get_actions_by_experiment_id(db_conn):
     # arrange
@@ -191,3 +339,75 @@ async def test_get_actions_by_id_returns_empty_list(db_conn):
 
     # assert
     assert len(records) == 0
+
+
+@pytest.mark.asyncio
+async def test_get_actions_pages_with_keyset(db_conn):
+    # arrange
+    experiment_id = uuid4()
+    actions = [
+        (uuid4(), experiment_id, uuid4(), randint(0, 1), '{}')
+        for i in range(5)
+    ]
+
+    await db_conn.executemany(
+        f'INSERT INTO {models.Action.__tablename__} (id, experiment_id, variant_id, reward, context)'
+        'VALUES ($1, $2, $3, $4, $5)',
+        actions
+    )
+
+    # act
+    first_page = await get_actions(db_conn, experiment_id=experiment_id, limit=3)
+    last = first_page[-1]
+    second_page = await get_actions(db_conn, experiment_id=experiment_id, limit=3, after=(last.get('last_modified'), last.get('id')))
+
+    # assert
+    assert len(first_page) == 3
+    assert len(second_page) == 2
+    assert {record.get('id') for record in first_page + second_page} == {action[0] for action in actions}
+
+
+@pytest.mark.asyncio
+async def test_get_actions_by_variant_id(db_conn):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    actions = [
+        (uuid4(), experiment_id, variant_id if i % 2 else uuid4(), randint(0, 1), '{}')
+        for i in range(6)
+    ]
+
+    await db_conn.executemany(
+        f'INSERT INTO {models.Action.__tablename__} (id, experiment_id, variant_id, reward, context)'
+        'VALUES ($1, $2, $3, $4, $5)',
+        actions
+    )
+
+    # act
+    records = await get_actions(db_conn, experiment_id=experiment_id, variant_id=variant_id)
+
+    # assert
+    assert len(records) == 3
+    assert all([record.get('variant_id') == variant_id for record in records])
+
+
+@pytest.mark.asyncio
+async def test_iter_actions_streams_experiment_actions(db_conn):
+    # arrange
+    experiment_id = uuid4()
+    actions = [
+        (uuid4(), experiment_id if i % 3 else uuid4(), uuid4(), randint(0, 1), '{}')
+        for i in range(9)
+    ]
+
+    await db_conn.executemany(
+        f'INSERT INTO {models.Action.__tablename__} (id, experiment_id, variant_id, reward, context)'
+        'VALUES ($1, $2, $3, $4, $5)',
+        actions
+    )
+
+    # act
+    records = [record async for record in iter_actions(db_conn, experiment_id=experiment_id, prefetch=2)]
+
+    # assert
+    assert len(records) == 6
+    assert {record.get('id') for record in records} == {action[0] for action in actions if action[1] == experiment_id}
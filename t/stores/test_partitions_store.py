@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from action_man import models
+from action_man.stores.partitions import get_partitions, maintain_partitions, partition_start
+
+
+def test_partition_start_daily():
+    # arrange
+    now = datetime(2026, 10, 18, 13, 45)
+
+    # act
+    start = partition_start(now, 1)
+
+    # assert
+    assert start == datetime(2026, 10, 18)
+
+
+def test_partition_start_weekly_starts_on_monday():
+    # arrange
+    now = datetime(2026, 10, 18, 13, 45)
+
+    # act
+    start = partition_start(now, 7)
+
+    # assert
+    assert start == datetime(2026, 10, 12)
+    assert start.weekday() == 0
+
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_creates_partitions_ahead(db_conn):
+    # arrange
+    now = datetime.utcnow() + timedelta(days=30)
+    transaction = db_conn.transaction()
+    await transaction.start()
+
+    try:
+        # act
+        created, dropped = await maintain_partitions(db_conn, now, days=1, ahead=2, ids_table=None)
+        again, _ = await maintain_partitions(db_conn, now, days=1, ahead=2, ids_table=None)
+        partitions = {partition.name: partition for partition in await get_partitions(db_conn)}
+    finally:
+        await transaction.rollback()
+
+    # assert
+    assert dropped == []
+    assert again == []
+    assert f'action_p{now + timedelta(days=2):%Y%m%d}' in created
+    assert partitions[f'action_p{now:%Y%m%d}'].lower == partition_start(now, 1)
+
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_drops_partitions_past_retention(db_conn):
+    # arrange
+    now = datetime.utcnow() + timedelta(days=30)
+    transaction = db_conn.transaction()
+    await transaction.start()
+
+    try:
+        await maintain_partitions(db_conn, now, days=1, ahead=0, ids_table=None)
+
+        # act
+        _, dropped = await maintain_partitions(
+            db_conn, now + timedelta(days=3), days=1, ahead=0, retention=2, ids_table=None
+        )
+        partitions = [partition.name for partition in await get_partitions(db_conn)]
+    finally:
+        await transaction.rollback()
+
+    # assert
+    assert f'action_p{now:%Y%m%d}' in dropped
+    assert f'action_p{now:%Y%m%d}' not in partitions
+    assert 'action_default' in partitions
+
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_drops_ids_past_the_dedup_window(db_conn):
+    # arrange
+    now = datetime.utcnow() + timedelta(days=30)
+    transaction = db_conn.transaction()
+    await transaction.start()
+
+    try:
+        await maintain_partitions(db_conn, now, days=1, ahead=3)
+
+        # act
+        _, dropped = await maintain_partitions(db_conn, now + timedelta(days=3), days=1, ahead=0)
+        partitions = [partition.name for partition in await get_partitions(db_conn, models.ActionId.__tablename__)]
+        actions = [partition.name for partition in await get_partitions(db_conn)]
+    finally:
+        await transaction.rollback()
+
+    # assert
+    assert f'action_id_p{now:%Y%m%d}' in dropped
+    assert f'action_id_p{now:%Y%m%d}' not in partitions
+    assert f'action_id_p{now + timedelta(days=2):%Y%m%d}' in partitions
+    assert 'action_id_default' in partitions
+    # actions are kept, retention is off
+    assert f'action_p{now:%Y%m%d}' in actions
@@ -0,0 +1,74 @@
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from action_man.stores.stats import get_stats, lock_stats_offsets, save_stats
+
+
+@pytest.mark.asyncio
+async def test_save_stats_adds_to_stored_counts(db_conn):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    bucket = datetime(2026, 10, 18, 10)
+
+    # act
+    await save_stats(db_conn, {(experiment_id, variant_id, bucket): (1, 3)})
+    await save_stats(db_conn, {(experiment_id, variant_id, bucket): (2, 2)})
+
+    # assert
+    stats = await get_stats(db_conn, experiment_id)
+
+    assert len(stats) == 1
+    assert stats[0].get('successes') == 3
+    assert stats[0].get('total') == 5
+
+
+@pytest.mark.asyncio
+async def test_save_stats_stores_offsets_with_the_counts(db_conn):
+    # arrange
+    topic = str(uuid4())
+    experiment_id, variant_id = uuid4(), uuid4()
+    bucket = datetime(2026, 10, 18, 10)
+
+    async with db_conn.transaction():
+        assert await lock_stats_offsets(db_conn, [(topic, 0), (topic, 1)]) == {(topic, 0): -1, (topic, 1): -1}
+
+        # act
+        await save_stats(db_conn, {(experiment_id, variant_id, bucket): (1, 3)}, offsets={(topic, 0): 41})
+        await save_stats(db_conn, {}, offsets={(topic, 0): 12, (topic, 1): 7})
+
+    # assert
+    async with db_conn.transaction():
+        assert await lock_stats_offsets(db_conn, [(topic, 0), (topic, 1)]) == {(topic, 0): 41, (topic, 1): 7}
+
+
+@pytest.mark.asyncio
+async def test_get_stats_merges_buckets_by_granularity(db_conn):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    await save_stats(
+        db_conn,
+        {
+            (experiment_id, variant_id, datetime(2026, 10, 18, 10)): (1, 2),
+            (experiment_id, variant_id, datetime(2026, 10, 18, 11)): (1, 4),
+            (experiment_id, variant_id, datetime(2026, 10, 19, 11)): (0, 1),
+        }
+    )
+
+    # act
+    hourly = await get_stats(db_conn, experiment_id, since=datetime(2026, 10, 18, 11))
+    daily = await get_stats(db_conn, experiment_id, granularity='day')
+
+    # assert
+    assert [record.get('total') for record in hourly] == [4, 1]
+    assert [(record.get('bucket'), record.get('total')) for record in daily] == [
+        (datetime(2026, 10, 18), 6), (datetime(2026, 10, 19), 1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_stats_raises_on_unknown_granularity(db_conn):
+    # act / assert
+    with pytest.raises(ValueError):
+        await get_stats(db_conn, uuid4(), granularity='minute')
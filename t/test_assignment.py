@@ -0,0 +1,103 @@
+from collections import Counter
+import random
+from uuid import uuid4
+
+from action_man.algorithm.alias import AliasTable
+from action_man.assignment import assign, sticky_choice, thompson_choice, weighted_choice
+
+
+def test_thompson_choice_favours_the_best_variant():
+    # arrange
+    rng = random.Random(42)
+    counters = {'a': (10, 1000), 'b': (500, 1000)}
+
+    # act
+    picks = Counter(thompson_choice(counters, rng) for _ in range(1000))
+
+    # assert
+    assert picks['b'] == 1000
+
+
+def test_weighted_choice_is_uniform_without_weights():
+    # arrange
+    rng = random.Random(42)
+
+    # act
+    picks = Counter(weighted_choice({'a': 0.0, 'b': 0.0}, rng) for _ in range(1000))
+
+    # assert
+    assert set(picks) == {'a', 'b'}
+
+
+def test_sticky_choice_keeps_users_on_their_variant():
+    # arrange
+    experiment_id = str(uuid4())
+    weights = {'a': 0.2, 'b': 0.3, 'c': 0.5}
+
+    # act
+    variants = {sticky_choice('user', experiment_id, weights) for _ in range(10)}
+
+    # assert
+    assert len(variants) == 1
+
+
+def test_sticky_choice_splits_users_by_weight():
+    # arrange
+    experiment_id = str(uuid4())
+    weights = {'a': 0.2, 'b': 0.3, 'c': 0.5}
+
+    # act
+    picks = Counter(sticky_choice(str(uuid4()), experiment_id, weights) for _ in range(10000))
+
+    # assert
+    for variant_id, weight in weights.items():
+        assert abs(picks[variant_id] / 10000 - weight) < 0.02
+
+
+def test_sticky_choice_moves_few_users_when_weights_shift():
+    # arrange
+    experiment_id = str(uuid4())
+    users = [str(uuid4()) for _ in range(10000)]
+    before = {'a': 0.5, 'b': 0.5}
+    after = {'a': 0.4, 'b': 0.6}
+
+    # act
+    moved = sum(
+        sticky_choice(user_id, experiment_id, before) != sticky_choice(user_id, experiment_id, after)
+        for user_id in users
+    )
+
+    # assert
+    assert moved / len(users) < 0.15
+
+
+def test_assign_without_variants():
+    # act
+    variant_id = assign(str(uuid4()), {}, {})
+
+    # assert
+    assert variant_id is None
+
+
+def test_assign_gives_no_traffic_to_variants_missing_from_probabilities():
+    # arrange
+    probabilities = {'a': 1.0}
+    counters = {'a': (1, 10), 'b': (0, 0)}
+
+    # act
+    picks = {assign(str(uuid4()), probabilities, counters, algorithm='ucb1') for _ in range(100)}
+
+    # assert
+    assert picks == {'a'}
+
+
+def test_assign_samples_the_allocation_table():
+    # arrange
+    allocation = AliasTable.from_weights({'a': 0.0, 'b': 1.0})
+    counters = {'a': (100, 100), 'b': (0, 100)}
+
+    # act
+    picks = {assign(str(uuid4()), {}, counters, allocation=allocation) for _ in range(100)}
+
+    # assert
+    assert picks == {'b'}
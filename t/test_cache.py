@@ -9,7 +9,8 @@ import pytest
 
 from action_man.stores.actions import save_action, get_actions
 from action_man.stores.exceptions import StoreException
-from action_man.cache import set_key_with_lock, lock_manager
+from action_man.cache import set_key_with_lock, lock_manager, CounterBuffer
+from action_man import cache
 from action_man import records
 
 
@@ -92,3 +93,284 @@ async def test_lock_manager_locks_a_key(cache_pool):
 
                 # this raises
                 await conn.set(key, 1000)
+
+
+def test_counter_buffer_merges_increments_per_key():
+    # arrange
+    counters = CounterBuffer()
+
+    # act
+    for i in range(10):
+        counters.incr('action_count')
+        counters.hincr('experiment', 'variant_total')
+    counters.incr('action_count', 5)
+
+    # assert
+    assert len(counters) == 2
+    assert counters.increments == 25
+
+
+@pytest.mark.asyncio
+async def test_counter_buffer_flush_writes_merged_increments(cache_pool):
+    # arrange
+    key = str(uuid4())
+    counters = CounterBuffer()
+
+    for i in range(100):
+        counters.incr(f'{key}_count')
+        counters.hincr(key, 'field', 2)
+
+    # act
+    commands = await counters.flush(cache_pool)
+
+    # assert
+    assert commands == 2
+    assert len(counters) == 0
+
+    with await cache_pool as conn:
+        assert int(await conn.get(f'{key}_count')) == 100
+        assert int(await conn.hget(key, 'field')) == 200
+
+
+@pytest.mark.asyncio
+async def test_counter_buffer_keeps_increments_if_flush_fails():
+    # arrange
+    counters = CounterBuffer()
+    counters.incr('action_count', 3)
+
+    class BrokenPool:
+        def __await__(self):
+            raise ConnectionError
+            yield
+
+    # act
+    with pytest.raises(ConnectionError):
+        await counters.flush(BrokenPool())
+
+    # assert
+    assert counters.increments == 3
+
+
+def test_parse_counters_groups_fields_by_variant():
+    # arrange
+    variant_id = str(uuid4())
+    fields = {
+        f'{variant_id}_successes': '3',
+        f'{variant_id}_total': '7',
+    }
+
+    # act
+    counters = cache.parse_counters(fields)
+
+    # assert
+    assert counters == {variant_id: (3, 7)}
+
+
+@pytest.mark.asyncio
+async def test_get_counters_reads_every_variant(cache_pool):
+    # arrange
+    experiment_id = uuid4()
+    counters = CounterBuffer()
+
+    for reward in [0, 1, 1]:
+        cache.incr_counters(counters, experiment_id, 'a', reward)
+    cache.incr_counters(counters, experiment_id, 'b', 0)
+
+    await counters.flush(cache_pool)
+
+    # act
+    result = await cache.get_counters(cache_pool, experiment_id)
+
+    # assert
+    assert result == {'a': (2, 3), 'b': (0, 1)}
+
+
+@pytest.mark.asyncio
+async def test_init_counters_does_not_reset_existing_counters(cache_pool):
+    # arrange
+    experiment_id = uuid4()
+    variant_id = uuid4()
+
+    with await cache_pool as conn:
+        await conn.hset(cache.counters_key(experiment_id), f'{variant_id}_total', 10)
+
+    # act
+    await cache.init_counters(cache_pool, experiment_id, variant_id)
+
+    # assert
+    assert await cache.get_counters(cache_pool, experiment_id) == {str(variant_id): (0, 10)}
+
+
+@pytest.mark.asyncio
+async def test_get_counters_reports_registered_variants_without_counters(cache_pool):
+    # arrange
+    experiment_id = uuid4()
+
+    with await cache_pool as conn:
+        await conn.sadd(cache.variants_key(experiment_id), 'a')
+
+    # act
+    result = await cache.get_counters(cache_pool, experiment_id)
+
+    # assert
+    assert result == {'a': (0, 0)}
+
+
+@pytest.mark.asyncio
+async def test_pop_dirty_experiments_empties_the_dirty_set(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    await cache.init_counters(cache_pool, experiment_id, uuid4())
+
+    partitions = [cache.experiment_partition(experiment_id)]
+
+    # act
+    dirty, active = await cache.pop_dirty_experiments(cache_pool, partitions)
+
+    # assert
+    assert experiment_id in dirty
+    assert active >= 1
+    assert experiment_id not in (await cache.pop_dirty_experiments(cache_pool, partitions))[0]
+
+
+@pytest.mark.asyncio
+async def test_flag_dirty_experiments_flags_them_on_their_partition(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    partition = cache.experiment_partition(experiment_id)
+
+    # act
+    await cache.flag_dirty_experiments(cache_pool, [experiment_id])
+
+    # assert
+    dirty, _ = await cache.pop_dirty_experiments(cache_pool, [partition])
+
+    assert experiment_id in dirty
+
+
+# partitions the Kafka Java client DefaultPartitioner picks out of 1000
+@pytest.mark.parametrize('key,expected', [
+    ('', 681), ('a', 524), ('ab', 434), ('abc', 107), ('123456789', 566), ('\x00 ', 742)
+])
+def test_experiment_partition_matches_the_kafka_default_partitioner(key, expected):
+    # act
+    partition = cache.experiment_partition(key, 1000)
+
+    # assert
+    assert partition == expected
+
+
+@pytest.mark.asyncio
+async def test_pop_dirty_experiments_only_pops_the_given_partitions(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    partition = cache.experiment_partition(experiment_id)
+    await cache.init_counters(cache_pool, experiment_id, uuid4())
+
+    # act
+    dirty, _ = await cache.pop_dirty_experiments(cache_pool, [(partition + 1) % cache.PARTITIONS])
+
+    # assert
+    assert experiment_id not in dirty
+    assert experiment_id in (await cache.pop_dirty_experiments(cache_pool, [partition]))[0]
+
+
+@pytest.mark.asyncio
+async def test_get_algorithms_returns_none_for_experiments_without_one(cache_pool):
+    # arrange
+    experiment_id, other_experiment_id = uuid4(), uuid4()
+
+    await cache.set_algorithm(cache_pool, experiment_id, 'ucb1')
+
+    # act
+    algorithms = await cache.get_algorithms(cache_pool, [experiment_id, other_experiment_id])
+
+    # assert
+    assert algorithms == ['ucb1', None]
+
+
+@pytest.mark.asyncio
+async def test_setnx_key_does_not_write_if_value_exists(cache_pool):
+    # arrange
+    key = str(uuid4())
+
+    # act
+    assert await cache.setnx_key(cache_pool, key, 1000)
+    assert not await cache.setnx_key(cache_pool, key, 5000)
+
+    # assert
+    with await cache_pool as conn:
+        assert int(await conn.get(key)) == 1000
+
+
+@pytest.mark.asyncio
+async def test_msetnx_keys_writes_nothing_if_any_key_exists(cache_pool):
+    # arrange
+    key, other_key = str(uuid4()), str(uuid4())
+
+    await cache.set_key(cache_pool, key, 1000)
+
+    # act
+    written = await cache.msetnx_keys(cache_pool, {key: 5000, other_key: 5000})
+
+    # assert
+    assert not written
+
+    with await cache_pool as conn:
+        assert int(await conn.get(key)) == 1000
+        assert await conn.get(other_key) is None
+
+
+@pytest.mark.asyncio
+async def test_compare_and_set_rejects_stale_versions(cache_pool):
+    # arrange
+    key = str(uuid4())
+
+    # act
+    assert await cache.compare_and_set(cache_pool, key, 'fresh', 2)
+    assert not await cache.compare_and_set(cache_pool, key, 'stale', 1)
+
+    # assert
+    with await cache_pool as conn:
+        assert await conn.get(key) == b'fresh'
+
+
+@pytest.mark.asyncio
+async def test_next_version_increases(cache_pool):
+    # act
+    first = await cache.next_version(cache_pool)
+    second = await cache.next_version(cache_pool)
+
+    # assert
+    assert second > first
+
+
+@pytest.mark.asyncio
+async def test_set_key_with_lock_reports_lock_wait(cache_pool, cache_lock_manager):
+    # arrange
+    key = str(uuid4())
+    monitor = MagicMock()
+
+    # act
+    await set_key_with_lock(key, 1000, cache_lock_manager, cache_pool, monitor=monitor)
+
+    # assert
+    monitor.on_lock_acquired.assert_called_once()
+    assert monitor.on_lock_acquired.call_args.args[0] == key
+
+
+@pytest.mark.asyncio
+async def test_load_counters_can_leave_experiments_clean(cache_pool):
+    # arrange
+    experiment_id, variant_id = str(uuid4()), str(uuid4())
+    partition = cache.experiment_partition(experiment_id)
+
+    # act
+    commands = await cache.load_counters(cache_pool, [(experiment_id, variant_id, 1, 2)], flag_dirty=False)
+
+    # assert
+    dirty, _ = await cache.pop_dirty_experiments(cache_pool, [partition])
+
+    assert commands == 3
+    assert experiment_id not in dirty
+    assert await cache.get_counters(cache_pool, experiment_id) == {variant_id: (1, 2)}
@@ -0,0 +1,94 @@
+from action_man.debounce import Debouncer
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_debouncer_recalculates_idle_experiments_on_their_first_action():
+    # arrange
+    clock = Clock()
+    debouncer = Debouncer(interval=1.0, max_pending=100, clock=clock)
+
+    # act
+    debouncer.mark('a')
+    clock.now = 0.1
+    due = debouncer.due()
+
+    # assert
+    assert due == [('a', 0.1)]
+    assert len(debouncer) == 0
+
+
+def test_debouncer_recalculates_busy_experiments_once_per_interval():
+    # arrange
+    clock = Clock()
+    debouncer = Debouncer(interval=1.0, max_pending=100, clock=clock)
+    debouncer.mark('a')
+    debouncer.due()
+
+    # act
+    clock.now = 0.2
+    debouncer.mark('a')
+    clock.now = 0.5
+    debouncer.mark('a')
+    early = debouncer.due()
+    clock.now = 1.0
+    late = debouncer.due()
+
+    # assert
+    assert early == []
+    assert late == [('a', 0.8)]
+
+
+def test_debouncer_recalculates_after_max_pending_actions():
+    # arrange
+    clock = Clock()
+    debouncer = Debouncer(interval=1.0, max_pending=3, clock=clock)
+    debouncer.mark('a')
+    debouncer.due()
+
+    # act
+    for _ in range(3):
+        debouncer.mark('a')
+    due = debouncer.due()
+
+    # assert
+    assert [key for key, _ in due] == ['a']
+
+
+def test_debouncer_drains_pending_experiments():
+    # arrange
+    clock = Clock()
+    debouncer = Debouncer(interval=1.0, max_pending=100, clock=clock)
+    debouncer.mark('a')
+    debouncer.due()
+    debouncer.mark('a')
+    debouncer.mark('b')
+
+    # act
+    pending = debouncer.drain()
+
+    # assert
+    assert sorted(pending) == ['a', 'b']
+    assert len(debouncer) == 0
+    assert debouncer.due() == []
+
+
+def test_debouncer_skips_experiments_without_actions():
+    # arrange
+    clock = Clock()
+    debouncer = Debouncer(interval=1.0, max_pending=3, clock=clock)
+    debouncer.mark('a')
+    debouncer.due()
+
+    # act
+    clock.now = 5.0
+    due = debouncer.due()
+
+    # assert
+    assert due == []
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from action_man.kafka import AsyncProducer
+
+
+class FakeProducer:
+    def __init__(self):
+        self.deliveries = []
+        self.keys = []
+
+    async def send(self, topic, value=None, key=None):
+        delivery = asyncio.get_event_loop().create_future()
+        self.deliveries.append(delivery)
+        self.keys.append(key)
+        return delivery
+
+
+@pytest.mark.asyncio
+async def test_async_producer_send_returns_a_delivery_future():
+    # arrange
+    fake = FakeProducer()
+    producer = AsyncProducer(fake)
+
+    # act
+    delivery = await producer.send('actions', b'{}', key='experiment')
+
+    # assert
+    assert not delivery.done()
+    assert fake.keys == [b'experiment']
+
+    fake.deliveries[0].set_result('metadata')
+    assert await delivery == 'metadata'
+
+
+@pytest.mark.asyncio
+async def test_async_producer_blocks_when_too_many_messages_are_in_flight():
+    # arrange
+    fake = FakeProducer()
+    producer = AsyncProducer(fake, max_in_flight=2)
+
+    await producer.send('actions', b'1')
+    await producer.send('actions', b'2')
+
+    # act
+    blocked = asyncio.ensure_future(producer.send('actions', b'3'))
+    await asyncio.sleep(0)
+
+    # assert
+    assert not blocked.done()
+    assert producer.in_flight == 2
+
+    fake.deliveries[0].set_result(None)
+    await asyncio.wait_for(blocked, 1)
+
+    assert producer.in_flight == 2
@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+from action_man.metrics import Histogram, Registry, record_db_pool, render, snapshot
+
+
+def test_registry_aggregates_by_name_and_labels():
+    # arrange
+    registry = Registry()
+
+    # act
+    registry.incr('messages_received', topic='actions')
+    registry.incr('messages_received', 2, topic='actions')
+    registry.incr('messages_received', topic='probabilities')
+    registry.gauge('read_offset', 10, topic='actions', partition='0')
+    registry.gauge('read_offset', 12, partition='0', topic='actions')
+
+    # assert
+    assert registry.counters == {
+        ('messages_received', (('topic', 'actions'),)): 3,
+        ('messages_received', (('topic', 'probabilities'),)): 1,
+    }
+    assert registry.gauges == {('read_offset', (('partition', '0'), ('topic', 'actions'))): 12}
+
+
+def test_registry_timer_observes_elapsed_seconds():
+    # arrange
+    registry = Registry()
+
+    # act
+    with registry.timer('db.save_action'):
+        pass
+
+    # assert
+    histogram = registry.histograms[('db.save_action', (('agent', ''),))]
+    assert histogram.count == 1
+    assert 0 <= histogram.sum < 0.1
+
+
+def test_histogram_quantile_of_snapshot_difference():
+    # arrange
+    registry = Registry(buckets=(0.01, 0.1, 1.0, float('inf')))
+    for _ in range(100):
+        registry.observe('kafka.send', 0.5)
+    _, before = snapshot(registry)
+
+    # act
+    for _ in range(99):
+        registry.observe('kafka.send', 0.005)
+    registry.observe('kafka.send', 5.0)
+    _, after = snapshot(registry)
+
+    # assert
+    key = ('kafka.send', ())
+    counts = [now - then for now, then in zip(after[key][0], before[key][0])]
+    assert registry.histograms[key].quantile(0.5, counts) == 0.01
+    assert registry.histograms[key].quantile(0.99, counts) == 0.01
+    assert registry.histograms[key].quantile(1.0, counts) == float('inf')
+    assert Histogram().quantile(0.99) == 0.0
+
+
+def test_render_prometheus_text_format():
+    # arrange
+    registry = Registry(buckets=(0.1, float('inf')))
+    registry.incr('http.requests', status='200')
+    registry.gauge('consumer.lag', 3, topic='actions', partition='0')
+    registry.gauge('db.pool.max', 10, note='a "quoted"\nvalue')
+    registry.observe('db.save_action', 0.05)
+    registry.observe('db.save_action', 1.0)
+
+    # act
+    text = render(registry)
+
+    # assert
+    assert text.splitlines() == [
+        '# TYPE action_man_http_requests_total counter',
+        'action_man_http_requests_total{status="200"} 1.0',
+        '# TYPE action_man_consumer_lag gauge',
+        'action_man_consumer_lag{partition="0",topic="actions"} 3.0',
+        '# TYPE action_man_db_pool_max gauge',
+        'action_man_db_pool_max{note="a \\"quoted\\"\\nvalue"} 10.0',
+        '# TYPE action_man_db_save_action histogram',
+        'action_man_db_save_action_bucket{le="0.1"} 1',
+        'action_man_db_save_action_bucket{le="+Inf"} 2',
+        'action_man_db_save_action_sum 1.05',
+        'action_man_db_save_action_count 2',
+    ]
+
+
+def test_record_db_pool_gauges_asyncpg_holders():
+    # arrange
+    registry = Registry()
+    holders = [SimpleNamespace(_con=object(), _in_use=object()), SimpleNamespace(_con=object(), _in_use=None),
+               SimpleNamespace(_con=None, _in_use=None)]
+    pool = SimpleNamespace(_holders=holders, _maxsize=3)
+
+    # act
+    record_db_pool(registry, pool)
+
+    # assert
+    assert registry.gauges == {('db.pool.size', ()): 2, ('db.pool.in_use', ()): 1, ('db.pool.max', ()): 3}
+
+
+def test_record_db_pool_skips_pools_without_known_attributes():
+    # arrange
+    registry = Registry()
+
+    # act
+    record_db_pool(registry, SimpleNamespace())
+
+    # assert
+    assert registry.gauges == {}
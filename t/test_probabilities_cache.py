@@ -0,0 +1,99 @@
+import asyncio
+import json
+from uuid import uuid4
+
+import pytest
+
+from action_man.api.probabilities import ProbabilitiesCache
+from action_man import cache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_probabilities_cache_serves_local_copy_until_invalidated(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    probabilities = ProbabilitiesCache(cache_pool, ttl=60.0)
+
+    await cache_pool.set(f'{experiment_id}_probabilities', json.dumps({'a': 1.0}))
+    assert await probabilities.get(experiment_id) == {'a': 1.0}
+    await cache_pool.set(f'{experiment_id}_probabilities', json.dumps({'b': 1.0}))
+
+    # act
+    cached = await probabilities.get(experiment_id)
+    probabilities.invalidate(experiment_id)
+    fresh = await probabilities.get(experiment_id)
+
+    # assert
+    assert cached == {'a': 1.0}
+    assert fresh == {'b': 1.0}
+
+
+@pytest.mark.asyncio
+async def test_probabilities_cache_state_holds_counters_and_algorithm(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    variant_id = str(uuid4())
+    probabilities = ProbabilitiesCache(cache_pool, ttl=60.0)
+
+    await cache.init_counters(cache_pool, experiment_id, variant_id)
+    await cache.set_algorithm(cache_pool, experiment_id, 'ucb1')
+
+    # act
+    state = await probabilities.state(experiment_id)
+
+    # assert
+    assert state.probabilities == {}
+    assert state.counters == {variant_id: (0, 0)}
+    assert state.algorithm == 'ucb1'
+
+
+@pytest.mark.asyncio
+async def test_probabilities_cache_reloads_expired_entries(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    clock = Clock()
+    probabilities = ProbabilitiesCache(cache_pool, ttl=5.0, clock=clock)
+
+    assert await probabilities.get(experiment_id) == {}
+    await cache_pool.set(f'{experiment_id}_probabilities', json.dumps({'a': 1.0}))
+
+    # act
+    clock.now = 4.0
+    cached = await probabilities.get(experiment_id)
+    clock.now = 5.0
+    fresh = await probabilities.get(experiment_id)
+
+    # assert
+    assert cached == {}
+    assert fresh == {'a': 1.0}
+
+
+@pytest.mark.asyncio
+async def test_probabilities_cache_evicts_published_experiments(cache_pool):
+    # arrange
+    experiment_id = str(uuid4())
+    probabilities = ProbabilitiesCache(cache_pool, ttl=60.0)
+    listener = asyncio.ensure_future(probabilities.listen())
+    await asyncio.sleep(0.1)
+
+    assert await probabilities.get(experiment_id) == {}
+
+    # act
+    await cache_pool.set(f'{experiment_id}_probabilities', json.dumps({'a': 1.0}))
+    await cache.publish_probabilities(cache_pool, [experiment_id])
+    await asyncio.sleep(0.1)
+
+    # assert
+    try:
+        assert await probabilities.get(experiment_id) == {'a': 1.0}
+    finally:
+        listener.cancel()
+        await cache_pool.unsubscribe(cache.PROBABILITIES_CHANNEL)
@@ -0,0 +1,88 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import pytest
+
+from action_man.bootstrap import recovery
+from action_man.stores.stats import save_stats
+from action_man import cache
+
+
+@pytest.mark.asyncio
+async def test_rebuild_counters_loads_rollup_totals(db_pool, cache_pool):
+    # arrange
+    experiment_id, control, test = uuid4(), uuid4(), uuid4()
+    async with db_pool.acquire() as conn:
+        await save_stats(
+            conn,
+            {
+                (experiment_id, control, datetime(2026, 10, 18, 10)): (1, 4),
+                (experiment_id, control, datetime(2026, 10, 18, 11)): (2, 3),
+                (experiment_id, test, datetime(2026, 10, 18, 11)): (5, 6),
+            }
+        )
+
+    # act
+    rows, _ = await recovery.rebuild_counters(db_pool, cache_pool, chunk=2, resume=False)
+
+    # assert
+    counters = await cache.get_counters(cache_pool, experiment_id)
+
+    assert rows >= 2
+    assert counters == {str(control): (3, 7), str(test): (5, 6)}
+    assert not await recovery.needs_rebuild(cache_pool)
+
+
+@pytest.mark.asyncio
+async def test_needs_rebuild_after_an_interrupted_rebuild(cache_pool):
+    # arrange
+    await cache.set_key(cache_pool, recovery.CHECKPOINT_KEY, str(uuid4()))
+
+    try:
+        # act
+        needed = await recovery.needs_rebuild(cache_pool)
+    finally:
+        with await cache_pool as conn:
+            await conn.delete(recovery.CHECKPOINT_KEY)
+
+    # assert
+    assert needed
+
+
+class Worker:
+    def __init__(self, db_pool, cache_pool, lock_manager):
+        self._db_pool, self._cache_pool, self._lock_manager = db_pool, cache_pool, lock_manager
+        self.monitor = MagicMock()
+
+    async def db_pool(self):
+        return self._db_pool
+
+    async def cache_pool(self):
+        return self._cache_pool
+
+    async def redis_lock_manager(self):
+        return self._lock_manager
+
+
+@pytest.mark.asyncio
+async def test_restore_counters_rebuilds_lost_counters(db_pool, cache_pool, cache_lock_manager):
+    # arrange
+    experiment_id, variant_id = uuid4(), uuid4()
+    async with db_pool.acquire() as conn:
+        await save_stats(conn, {(experiment_id, variant_id, datetime(2026, 10, 18, 10)): (1, 4)})
+
+    with await cache_pool as conn:
+        await conn.delete('action_count', cache.counters_key(experiment_id))
+
+    worker = Worker(db_pool, cache_pool, cache_lock_manager)
+
+    # act
+    await recovery.restore_counters(worker)
+
+    # assert
+    counters = await cache.get_counters(cache_pool, experiment_id)
+
+    assert counters == {str(variant_id): (1, 4)}
+    assert not await recovery.needs_rebuild(cache_pool)
+    worker.monitor.on_lock_acquired.assert_called_once()
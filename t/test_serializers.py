@@ -0,0 +1,60 @@
+from uuid import uuid4
+
+from action_man import records
+from action_man.serializers import ActionCodec
+
+
+def test_action_codec_round_trip():
+    # arrange
+    action = records.Action(
+        id=uuid4(),
+        experiment_id=uuid4(),
+        variant_id=uuid4(),
+        reward=1,
+        context='{"page": "home"}'
+    )
+
+    # act
+    decoded = records.Action.loads(action.dumps(serializer='action'), serializer='action')
+
+    # assert
+    assert decoded.id == str(action.id)
+    assert decoded.experiment_id == str(action.experiment_id)
+    assert decoded.variant_id == str(action.variant_id)
+    assert decoded.reward == 1
+    assert decoded.context == '{"page": "home"}'
+
+
+def test_action_codec_is_smaller_than_json():
+    # arrange
+    action = records.Action(
+        id=str(uuid4()),
+        experiment_id=str(uuid4()),
+        variant_id=str(uuid4()),
+        reward=0,
+        context='{}'
+    )
+
+    # act
+    binary = action.dumps(serializer='action')
+
+    # assert
+    assert len(binary) == 52
+    assert len(binary) < len(action.dumps(serializer='json')) / 3
+
+
+def test_action_codec_decodes_json_payloads():
+    # arrange
+    action = {
+        'id': str(uuid4()),
+        'experiment_id': str(uuid4()),
+        'variant_id': str(uuid4()),
+        'reward': 1,
+        'context': '{}'
+    }
+
+    # act
+    decoded = ActionCodec().loads(records.Action(**action).dumps(serializer='json'))
+
+    # assert
+    assert {field: decoded[field] for field in action} == action
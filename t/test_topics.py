@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+from uuid import uuid4
+
+import pytest
+
+from action_man import records
+from action_man import topics
+
+
+class Stream:
+    """
+    Minimal stream of (topic, key, action) events exposing current_event
+    """
+    def __init__(self, events):
+        self.events = events
+        self.current_event = None
+
+    async def __aiter__(self):
+        for topic, key, action in self.events:
+            self.current_event = SimpleNamespace(key=key, message=SimpleNamespace(topic=topic))
+            yield action
+
+
+def action():
+    return records.Action(id=uuid4(), experiment_id=uuid4(), variant_id=uuid4(), reward=1, context={})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('key', [None, b'not-the-experiment'])
+async def test_owned_actions_forwards_actions_not_keyed_by_experiment(key):
+    # arrange
+    unkeyed = action()
+    stream = Stream([('actions', key, unkeyed)])
+
+    # act
+    with patch.object(topics.actions_repartition_topic, 'send', new_callable=AsyncMock) as mock_send:
+        owned = [owned async for owned in topics.owned_actions(stream)]
+
+    # assert
+    assert owned == []
+    mock_send.assert_awaited_once_with(key=str(unkeyed.experiment_id), value=unkeyed)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('topic', ['actions', 'actions-repartition'])
+async def test_owned_actions_yields_actions_keyed_by_experiment(topic):
+    # arrange
+    keyed = action()
+    stream = Stream([(topic, str(keyed.experiment_id).encode(), keyed)])
+
+    # act
+    with patch.object(topics.actions_repartition_topic, 'send', new_callable=AsyncMock) as mock_send:
+        owned = [owned async for owned in topics.owned_actions(stream)]
+
+    # assert
+    assert owned == [keyed]
+    mock_send.assert_not_awaited()